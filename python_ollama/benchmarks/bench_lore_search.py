@@ -0,0 +1,84 @@
+"""
+Micro-benchmark: lore vector store top-k latency, brute force vs. the ANN index.
+
+Usage:
+    python benchmarks/bench_lore_search.py [--chunks 10000 100000] [--dim 768] [--queries 100] [--json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from lore_store import VectorStore, normalize
+
+def make_vectors(count, dim, seed=0):
+    """Clustered random vectors, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, count // 200), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), count)] + 0.5 * rng.standard_normal((count, dim)).astype(np.float32)
+    queries = vectors[rng.integers(0, count, 100)] + 0.3 * rng.standard_normal((100, dim)).astype(np.float32)
+    return vectors, queries
+
+def time_queries(store, queries, k):
+    store.search(queries[:1], k)  # Fault the memory map in
+    start = time.perf_counter()
+    results = [store.search(query, k)[0] for query in queries]
+    return (time.perf_counter() - start) / len(queries), results
+
+def recall(vectors, queries, results, k):
+    matrix = normalize(vectors)
+    hits = 0
+    for query, result in zip(normalize(queries), results):
+        truth = set(np.argpartition(-(matrix @ query), k - 1)[:k].tolist())
+        hits += len(truth & {int(text.split()[1]) for _, text, _ in result})
+    return hits / (k * len(queries))
+
+def run(chunk_counts, dim, query_count, k):
+    results = []
+    for count in chunk_counts:
+        vectors, queries = make_vectors(count, dim)
+        queries = queries[:query_count]
+        texts = [f"chunk {i}" for i in range(count)]
+        with tempfile.TemporaryDirectory() as directory:
+            brute = VectorStore(os.path.join(directory, "brute"), ivf_min_vectors=None)
+            brute.add(texts, vectors)
+            brute_s, _ = time_queries(brute, queries, k)
+            start = time.perf_counter()
+            ann = VectorStore(os.path.join(directory, "ann"), ivf_min_vectors=1)
+            ann.add(texts, vectors)
+            build_s = time.perf_counter() - start
+            ann_s, ann_results = time_queries(ann, queries, k)
+        results.append({
+            "chunks": count,
+            "dim": dim,
+            "brute_ms": brute_s * 1000,
+            "ann_ms": ann_s * 1000,
+            "ann_build_s": build_s,
+            "ann_recall": recall(vectors, queries, ann_results, k),
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, nargs="+", default=[10000, 100000], help="Store sizes")
+    parser.add_argument("--dim", type=int, default=768, help="Embedding size")
+    parser.add_argument("--queries", type=int, default=100, help="Queries per measurement")
+    parser.add_argument("--k", type=int, default=3, help="Results per query")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+
+    results = run(args.chunks, args.dim, args.queries, args.k)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'chunks':>8} {'brute':>10} {'ann':>10} {'build':>8} {'recall':>7}")
+    for row in results:
+        print(f"{row['chunks']:>8} {row['brute_ms']:>8.2f}ms {row['ann_ms']:>8.2f}ms "
+              f"{row['ann_build_s']:>7.2f}s {row['ann_recall']:>7.2f}")
+
+if __name__ == "__main__":
+    main()
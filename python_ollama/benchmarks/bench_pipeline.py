@@ -0,0 +1,85 @@
+"""
+Micro-benchmarks for the per-turn pipeline: parse_response, and restoring and saving turns through each conversation store backend.
+
+The stores are built with make_store, as the server does through get_store, so the default SQLite store
+is measured next to the JSONL log store.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--turns 100 10000] [--backends sqlite log] [--repeat 20] [--json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from langchain.memory import ConversationBufferWindowMemory
+from ollama_char import parse_response
+from conversation_store import STORE_BACKENDS, make_store
+from fake_ollama import CANNED_COMPLETION
+
+def time_call(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def write_turns(store, conversation_id, turns):
+    for index in range(turns):
+        store.append_turn(conversation_id, f"message {index} from the user", f"*Clara grins* reply number {index}~", "Clara")
+    store.flush()
+
+def bench_save(store, turns):
+    """Append `turns` turns to a new conversation and wait until they are stored; returns seconds per turn."""
+    conversation_id = store.create_conversation("Clara")
+    start = time.perf_counter()
+    write_turns(store, conversation_id, turns)
+    return (time.perf_counter() - start) / turns
+
+def run(turn_counts, backends, repeat):
+    response = "<thinking>" + CANNED_COMPLETION
+    results = {"parse_response_us": time_call(lambda: parse_response(response), repeat * 50) * 1e6, "stores": []}
+    for backend in backends:
+        for turns in turn_counts:
+            with tempfile.TemporaryDirectory() as directory:
+                store = make_store(backend=backend, save_dir=directory)
+                try:
+                    conversation_id = store.create_conversation("Clara")
+                    write_turns(store, conversation_id, turns)
+                    load_s = time_call(
+                        lambda: store.load_history(conversation_id, ConversationBufferWindowMemory(k=5, input_key="input"), 50),
+                        repeat
+                    )
+                    results["stores"].append({
+                        "backend": backend,
+                        "turns": turns,
+                        "load_history_ms": load_s * 1000,
+                        "append_turn_us": bench_save(store, turns) * 1e6,
+                    })
+                finally:
+                    store.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, nargs="+", default=[100, 10000], help="Log sizes in turns")
+    parser.add_argument("--backends", nargs="+", choices=STORE_BACKENDS, default=list(STORE_BACKENDS), help="Store backends to measure")
+    parser.add_argument("--repeat", type=int, default=20, help="Best-of repetitions per measurement")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+
+    results = run(args.turns, args.backends, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"parse_response: {results['parse_response_us']:.1f}us")
+    print(f"{'backend':>8} {'turns':>8} {'load history':>14} {'save per turn':>14}")
+    for row in results["stores"]:
+        print(f"{row['backend']:>8} {row['turns']:>8} {row['load_history_ms']:>12.3f}ms {row['append_turn_us']:>12.1f}us")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Startup benchmark: import time of server.py, time until it listens, time until /ready and time to first token.
+
+Each run starts a fake Ollama that takes --load-ms to load a model on its first request, and a fresh
+server on free ports. The first turn is sent once /ready reports the warm-up done (--turn-at ready),
+or as soon as the socket accepts (--turn-at listen) to see what an impatient first client gets.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 3] [--load-ms 2000] [--turn-at ready] [--json]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from protocol import read_frame, write_frame, FRAME_CHUNK, FRAME_FINAL
+from load_test import free_port, wait_for_port
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.dirname(BENCH_DIR)
+
+def import_seconds(module):
+    """Wall time of importing a module in a fresh interpreter."""
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=SERVER_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed: {result.stderr.strip().splitlines()[-1:]}")
+    return float(result.stdout.strip().splitlines()[-1])
+
+def is_ready(metrics_port):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{metrics_port}/ready", timeout=2) as response:
+            return response.status == 200
+    except (urllib.error.URLError, ConnectionError):
+        return False
+
+async def wait_for_ready(metrics_port, timeout=300):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if await asyncio.to_thread(is_ready, metrics_port):
+            return
+        await asyncio.sleep(0.05)
+    raise TimeoutError(f"Server not ready after {timeout}s")
+
+async def first_turn(port, character_name):
+    """Handshake and one streamed turn; returns (time to first answer chunk, whole turn) in seconds."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        await write_frame(writer, {"conversation_id": 0})
+        conversation_id = (await read_frame(reader))["uid"]
+        started = time.perf_counter()
+        first_token = None
+        await write_frame(writer, {"conversation_id": conversation_id, "character_name": character_name, "input": "hi", "stream": True})
+        while True:
+            frame = await read_frame(reader)
+            if frame is None:
+                raise ConnectionError("Server closed the connection mid-turn")
+            if frame.get("type") == FRAME_CHUNK and first_token is None:
+                first_token = time.perf_counter() - started
+            if frame.get("type") == FRAME_FINAL:
+                break
+        return first_token, time.perf_counter() - started
+    finally:
+        writer.close()
+
+async def run_once(args, save_dir):
+    ollama_port, port, metrics_port = free_port(), free_port(), free_port()
+    fake = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "fake_ollama.py"), "--port", str(ollama_port),
+        "--load-ms", str(args.load_ms), "--first-token-ms", str(args.first_token_ms)
+    ], stdout=subprocess.DEVNULL)
+    processes = [fake]
+    try:
+        await wait_for_port("127.0.0.1", ollama_port)
+        command = [
+            sys.executable, os.path.join(BENCH_DIR, "run_server.py"), "--port", str(port),
+            "--base-url", f"http://127.0.0.1:{ollama_port}", "--save-dir", save_dir, "--metrics-port", str(metrics_port)
+        ]
+        if args.eager:
+            command.append("--eager")
+        spawned = time.perf_counter()
+        processes.append(subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=None if args.server_logs else subprocess.DEVNULL))
+        await wait_for_port("127.0.0.1", port)
+        listening = time.perf_counter() - spawned
+        ready = None
+        if args.turn_at == "ready":
+            await wait_for_ready(metrics_port)
+            ready = time.perf_counter() - spawned
+        ttft, turn = await first_turn(port, args.character)
+        if ready is None:
+            await wait_for_ready(metrics_port)
+            ready = time.perf_counter() - spawned
+        return {"listen_ms": listening * 1000, "ready_ms": ready * 1000, "ttft_ms": ttft * 1000 if ttft is not None else None, "turn_ms": turn * 1000}
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+async def run(args):
+    results = {
+        "load_ms": args.load_ms,
+        "turn_at": args.turn_at,
+        "eager": args.eager,
+        "import_server_ms": min(import_seconds("server") for _ in range(args.runs)) * 1000,
+        "runs": [],
+    }
+    try:
+        results["import_ollama_char_ms"] = min(import_seconds("ollama_char") for _ in range(args.runs)) * 1000
+    except RuntimeError as e:
+        results["import_ollama_char_ms"] = None
+        print(f"Skipping the ollama_char import: {e}", file=sys.stderr)
+    for _ in range(args.runs):
+        results["runs"].append(await run_once(args, tempfile.mkdtemp(prefix="bench_startup_")))
+    for key in ("listen_ms", "ready_ms", "ttft_ms", "turn_ms"):
+        values = [run[key] for run in results["runs"] if run[key] is not None]
+        results[key] = min(values) if values else None
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="Server starts to take the best of")
+    parser.add_argument("--load-ms", type=float, default=2000.0, help="Fake Ollama cold load time per model")
+    parser.add_argument("--first-token-ms", type=float, default=200.0, help="Fake Ollama prompt evaluation delay")
+    parser.add_argument("--turn-at", choices=("ready", "listen"), default="ready", help="When to send the first turn")
+    parser.add_argument("--eager", action="store_true", help="Start the server with the warm-up before listening")
+    parser.add_argument("--character", default="Clara")
+    parser.add_argument("--server-logs", action="store_true", help="Show the spawned server's log output")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    fmt = lambda value: f"{value:.0f}ms" if value is not None else "n/a"
+    print(f"import server:      {fmt(results['import_server_ms'])}")
+    print(f"import ollama_char: {fmt(results['import_ollama_char_ms'])}")
+    print(f"time to listen:     {fmt(results['listen_ms'])}")
+    print(f"time to ready:      {fmt(results['ready_ms'])}")
+    print(f"first token:        {fmt(results['ttft_ms'])} (turn sent at {args.turn_at}, whole turn {fmt(results['turn_ms'])})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Micro-benchmark: single-pass tag parser vs. the original parse_topic scans.
+
+Usage:
+    python benchmarks/bench_tag_parser.py [--sizes 10 25 50] [--repeat 20] [--json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from tag_parser import parse_sections, TagStreamParser
+
+def legacy_parse_topic(response, topic):
+    """The parse_topic implementation replaced by tag_parser, kept verbatim as the baseline."""
+    start_index = -1
+    stop_index = -1
+    for start_symbol in ["<", "(", "{", ""]:
+        for stop_symbol in [">", ")", "}", ""]:
+            if response.find(f'{start_symbol}{topic}{stop_symbol}') != -1:
+                start_index = response.find(f'{start_symbol}{topic}{stop_symbol}') + len(f'{start_symbol}{topic}{stop_symbol}')
+                break
+        if start_index != -1:
+            break
+    if start_index != -1:
+        response = response[start_index:]
+        for start_symbol in ["</", "(/", "{/", ""]:
+            for stop_symbol in [">", ")", "}", ""]:
+                if response.find(f'{start_symbol}{topic}{stop_symbol}') != -1:
+                    stop_index = response.find(f'{start_symbol}{topic}{stop_symbol}')
+                    break
+            if stop_index != -1:
+                break
+    if stop_index != -1:
+        response = response[:stop_index]
+    else:
+        response = ""
+    return response.strip()
+
+def legacy_parse_response(response):
+    return {topic: legacy_parse_topic(response, topic) for topic in ("thinking", "answer", "mood", "actions")}
+
+# Bare "answer"/"mood" in the prose are what the legacy empty-delimiter fallback used to mis-match
+WORDS = ("the", "user", "seems", "to", "want", "a", "playful", "reply", "so", "maybe", "I", "should",
+         "tease", "them", "about", "their", "question", "answer", "mood", "(hmm)", "<3")
+
+def make_response(size_kb, seed=0):
+    """Build a reasoning-model style output with a long thinking block of roughly `size_kb` kilobytes."""
+    rng = random.Random(seed)
+    words = []
+    length = 0
+    while length < size_kb * 1024:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return (
+        "<thinking>" + " ".join(words) + "</thinking>\n"
+        "<answer>*Clara waves* Why hello there, darling~ Care to tell me more about yourself?</answer>\n"
+        "<mood>playful</mood>\n<actions>wave</actions>"
+    )
+
+def time_call(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def stream_parse(text, chunk_size=4):
+    parser = TagStreamParser(channel=None)
+    for index in range(0, len(text), chunk_size):
+        parser.feed(text[index:index + chunk_size])
+    parser.close()
+
+def run(sizes, repeat):
+    results = []
+    for size_kb in sizes:
+        text = make_response(size_kb)
+        legacy = legacy_parse_response(text)
+        current = parse_sections(text)
+        results.append({
+            "size_kb": size_kb,
+            "legacy_ms": time_call(lambda: legacy_parse_response(text), repeat) * 1000,
+            "single_pass_ms": time_call(lambda: parse_sections(text), repeat) * 1000,
+            "stream_ms": time_call(lambda: stream_parse(text), repeat) * 1000,
+            "answers_match": legacy["answer"] == current["answer"],
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 25, 50], help="Response sizes in KB")
+    parser.add_argument("--repeat", type=int, default=20, help="Best-of repetitions per measurement")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable JSON")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'size':>8} {'legacy':>12} {'single-pass':>12} {'stream (4ch)':>13} {'speedup':>8}")
+    for row in results:
+        speedup = row["legacy_ms"] / row["single_pass_ms"] if row["single_pass_ms"] else float("inf")
+        print(f"{row['size_kb']:>6}KB {row['legacy_ms']:>10.3f}ms {row['single_pass_ms']:>10.3f}ms "
+              f"{row['stream_ms']:>11.3f}ms {speedup:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Fake Ollama server streaming canned completions, so benchmarks run offline.
+
+Serves /api/generate (streaming and non-streaming), /api/chat, /api/embed,
+/api/tags and /api/version with a configurable time-to-first-token and token
+rate. A chat ending in an assistant message continues it like Ollama does: the
+canned completion resumes after that prefill. With
+--fail-after it drops every streamed generation after that many tokens, to
+exercise backend failover. With --load-ms the first request for each model
+waits that long, like Ollama loading it into memory, and an empty prompt only
+loads the model.
+
+Usage:
+    python benchmarks/fake_ollama.py [--port 11435] [--tokens-per-second 50] [--first-token-ms 200] [--fail-after N] [--load-ms 0]
+"""
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+
+CANNED_COMPLETION = (
+    "The user is greeting me, I should tease them a little and keep the roleplay going.</thinking>\n"
+    "<answer>*Clara leans in with a smug grin* Ehh~? You came back already? "
+    "You must really have missed me, huh~</answer>\n"
+    "<mood>playful</mood>\n<actions>grin</actions>"
+)
+
+def tokenize(text):
+    """Split text into word-sized pieces that keep their whitespace, like model tokens."""
+    tokens = []
+    start = 0
+    for index in range(1, len(text)):
+        if text[index] == " " or text[index] in "<>\n":
+            tokens.append(text[start:index])
+            start = index
+    tokens.append(text[start:])
+    return tokens
+
+def fake_embedding(text, dim=64):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [((digest[i % len(digest)] + i) % 255) / 127.5 - 1.0 for i in range(dim)]
+
+class FakeOllama:
+    def __init__(self, host="127.0.0.1", port=11435, tokens_per_second=50.0, first_token_ms=200.0,
+                 completion=CANNED_COMPLETION, fail_after=None, load_ms=0.0):
+        """
+        Args:
+            host (str): Interface to bind.
+            port (int): Port to listen on.
+            tokens_per_second (float): Streaming rate after the first token. 0 streams as fast as possible.
+            first_token_ms (float): Simulated prompt evaluation delay before the first token.
+            completion (str): Text streamed for every generate request.
+            fail_after (int): Close the connection after this many streamed tokens, like a crashing backend.
+            load_ms (float): Simulated cold load of a model on its first request.
+        """
+        self.host = host
+        self.port = port
+        self.tokens_per_second = tokens_per_second
+        self.first_token_ms = first_token_ms
+        self.tokens = tokenize(completion)
+        self.fail_after = fail_after
+        self.load_ms = load_ms
+        # Model name -> task finishing when its simulated load is done
+        self.loaded = {}
+        self.requests = 0
+        # (path, request body) of every generation, for tests
+        self.generations = []
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None, None, None
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+        return method, path, json.loads(body) if body else {}
+
+    async def _send_json(self, writer, payload, status="200 OK"):
+        body = json.dumps(payload).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1")
+            + body
+        )
+        await writer.drain()
+
+    async def _write_chunk(self, writer, payload):
+        data = json.dumps(payload).encode("utf-8") + b"\n"
+        writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+        await writer.drain()
+
+    def _continuation(self, request):
+        """Tokens a chat request gets: the canned completion after a trailing assistant prefill, else all of it."""
+        messages = request.get("messages", [])
+        if not messages or messages[-1].get("role") != "assistant":
+            return self.tokens
+        prefill = messages[-1].get("content", "")
+        completion = "".join(self.tokens)
+        if completion.startswith(prefill):
+            return tokenize(completion[len(prefill):]) if len(prefill) < len(completion) else []
+        if "<answer>" in prefill and "<answer>" in completion:
+            return tokenize(completion.split("<answer>", 1)[1].lstrip("\n"))
+        return self.tokens
+
+    def _final(self, request, started, tokens=None):
+        tokens = self.tokens if tokens is None else tokens
+        if "messages" in request:
+            prompt_tokens = max(1, sum(len(message.get("content", "")) for message in request["messages"]) // 4)
+            return {
+                "model": request.get("model", ""),
+                "message": {"role": "assistant", "content": ""},
+                "done": True,
+                "done_reason": "stop",
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(self.first_token_ms * 1e6),
+                "eval_count": len(tokens),
+                "eval_duration": int((time.perf_counter() - started) * 1e9),
+                "total_duration": int((time.perf_counter() - started) * 1e9),
+            }
+        prompt_tokens = max(1, len(request.get("prompt", "")) // 4)
+        return {
+            "model": request.get("model", ""),
+            "response": "",
+            "done": True,
+            "done_reason": "stop",
+            "context": list(range(prompt_tokens + len(tokens))),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(self.first_token_ms * 1e6),
+            "eval_count": len(tokens),
+            "eval_duration": int((time.perf_counter() - started) * 1e9),
+            "total_duration": int((time.perf_counter() - started) * 1e9),
+        }
+
+    async def _load(self, model):
+        if model not in self.loaded:
+            self.loaded[model] = asyncio.create_task(asyncio.sleep(self.load_ms / 1000))
+        await self.loaded[model]
+
+    async def _generate(self, writer, request):
+        started = time.perf_counter()
+        await self._load(request.get("model", ""))
+        chat = "messages" in request
+        if not chat and not request.get("prompt"):
+            # Ollama only loads the model for an empty prompt
+            await self._send_json(writer, {"model": request.get("model", ""), "response": "", "done": True, "done_reason": "load"})
+            return
+        tokens = self._continuation(request) if chat else self.tokens
+        await asyncio.sleep(self.first_token_ms / 1000)
+        delay = 1.0 / self.tokens_per_second if self.tokens_per_second else 0
+        if not request.get("stream", True):
+            await asyncio.sleep(delay * len(tokens))
+            final = self._final(request, started, tokens)
+            if chat:
+                final["message"]["content"] = "".join(tokens)
+            else:
+                final["response"] = "".join(tokens)
+            await self._send_json(writer, final)
+            return
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n")
+        for index, token in enumerate(tokens):
+            if self.fail_after is not None and index >= self.fail_after:
+                raise ConnectionResetError("Simulated backend failure")
+            if chat:
+                chunk = {"model": request.get("model", ""), "message": {"role": "assistant", "content": token}, "done": False}
+            else:
+                chunk = {"model": request.get("model", ""), "response": token, "done": False}
+            await self._write_chunk(writer, chunk)
+            if delay:
+                await asyncio.sleep(delay)
+        await self._write_chunk(writer, self._final(request, started, tokens))
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                method, path, request = await self._read_request(reader)
+                if method is None:
+                    break
+                self.requests += 1
+                if path in ("/api/generate", "/api/chat"):
+                    self.generations.append((path, request))
+                    await self._generate(writer, request)
+                elif path == "/api/embed":
+                    await self._load(request.get("model", ""))
+                    inputs = request.get("input", [])
+                    inputs = [inputs] if isinstance(inputs, str) else inputs
+                    await self._send_json(writer, {"embeddings": [fake_embedding(text) for text in inputs]})
+                elif path == "/api/tags":
+                    await self._send_json(writer, {"models": [{"name": "fake"}]})
+                elif path == "/api/version":
+                    await self._send_json(writer, {"version": "0.0.0-fake"})
+                else:
+                    await self._send_json(writer, {"error": f"unknown endpoint {path}"}, "404 Not Found")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+async def serve(args):
+    fake = await FakeOllama(args.host, args.port, args.tokens_per_second, args.first_token_ms,
+                            fail_after=args.fail_after, load_ms=args.load_ms).start()
+    print(f"Fake Ollama listening on http://{fake.host}:{fake.port}", flush=True)
+    await asyncio.Event().wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--first-token-ms", type=float, default=200.0)
+    parser.add_argument("--fail-after", type=int, help="Drop streamed generations after this many tokens")
+    parser.add_argument("--load-ms", type=float, default=0.0, help="Cold load time of each model on its first request")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
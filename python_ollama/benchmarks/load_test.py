@@ -0,0 +1,212 @@
+"""
+Load test: many concurrent clients speaking the framed JSON protocol against server.py.
+
+By default it starts a fake Ollama and a server on free ports, so it runs offline.
+Each client performs the UID handshake and then a number of streamed turns.
+
+Usage:
+    python benchmarks/load_test.py [--clients 10 100 1000] [--turns 3] [--backends 1] [--output results.json]
+    python benchmarks/load_test.py --server 127.0.0.1:55555 --server-pid 1234   # existing server
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from protocol import read_frame, write_frame, FRAME_CHUNK, FRAME_FINAL
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+INPUTS = ("hi", "who are you?", "what's your next adventure?", "tell me about your hobbies", "roll 1d20 for me")
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def read_rss_kb(pid):
+    """Resident set size of a process in KB, from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+async def wait_for_port(host, port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"Nothing listening on {host}:{port} after {timeout}s")
+
+async def run_client(host, port, turns, character_name, results):
+    """One connection: handshake, then `turns` streamed turns, recording latency and time to first byte."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        await write_frame(writer, {"conversation_id": 0})
+        conversation_id = (await read_frame(reader))["uid"]
+        for turn in range(turns):
+            started = time.perf_counter()
+            first_byte = None
+            await write_frame(writer, {
+                "conversation_id": conversation_id,
+                "character_name": character_name,
+                "input": INPUTS[turn % len(INPUTS)],
+                "stream": True,
+            })
+            while True:
+                frame = await read_frame(reader)
+                if frame is None:
+                    raise ConnectionError("Server closed the connection mid-turn")
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started
+                if frame.get("type") == FRAME_FINAL:
+                    break
+                if frame.get("type") != FRAME_CHUNK:
+                    raise ValueError(f"Unexpected frame {frame}")
+            results["latency"].append(time.perf_counter() - started)
+            results["ttfb"].append(first_byte)
+    except Exception as e:
+        results["errors"].append(f"{type(e).__name__}: {e}")
+    finally:
+        writer.close()
+
+async def sample_rss(pid, samples, stop):
+    while not stop.is_set():
+        rss = read_rss_kb(pid)
+        if rss is not None:
+            samples.append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), 0.25)
+        except asyncio.TimeoutError:
+            pass
+
+async def run_level(host, port, clients, turns, character_name, server_pid, connect_batch):
+    results = {"latency": [], "ttfb": [], "errors": []}
+    rss_samples = []
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(server_pid, rss_samples, stop)) if server_pid else None
+    started = time.perf_counter()
+    tasks = []
+    for index in range(clients):
+        tasks.append(asyncio.create_task(run_client(host, port, turns, character_name, results)))
+        if (index + 1) % connect_batch == 0:
+            await asyncio.sleep(0.05)  # Stay under the listen backlog instead of measuring SYN retries
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    if sampler:
+        await sampler
+    to_ms = lambda value: value * 1000 if value is not None else None
+    return {
+        "clients": clients,
+        "turns_per_client": turns,
+        "completed_turns": len(results["latency"]),
+        "errors": len(results["errors"]),
+        "error_samples": results["errors"][:5],
+        "elapsed_s": elapsed,
+        "turns_per_s": len(results["latency"]) / elapsed if elapsed else 0.0,
+        "latency_ms": {name: to_ms(percentile(results["latency"], q)) for name, q in (("p50", .5), ("p95", .95), ("p99", .99))},
+        "ttfb_ms": {name: to_ms(percentile(results["ttfb"], q)) for name, q in (("p50", .5), ("p95", .95), ("p99", .99))},
+        "server_rss_kb": {"start": rss_samples[0] if rss_samples else None, "peak": max(rss_samples) if rss_samples else None},
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BENCH_DIR, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def spawn_stack(args, save_dir):
+    """Start fake Ollama backends and a server on free ports. Returns (processes, server port)."""
+    ollama_ports, server_port = [free_port() for _ in range(args.backends)], free_port()
+    fakes = [subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "fake_ollama.py"), "--port", str(ollama_port),
+        "--tokens-per-second", str(args.tokens_per_second), "--first-token-ms", str(args.first_token_ms)
+    ], stdout=subprocess.DEVNULL) for ollama_port in ollama_ports]
+    server = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "run_server.py"), "--port", str(server_port),
+        "--base-url", *[f"http://127.0.0.1:{ollama_port}" for ollama_port in ollama_ports], "--save-dir", save_dir
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL if not args.server_logs else None)
+    return [server] + fakes, server_port
+
+async def run(args):
+    processes = []
+    save_dir = None
+    if args.server:
+        host, port = args.server.rsplit(":", 1)
+        port = int(port)
+        server_pid = args.server_pid
+    else:
+        save_dir = tempfile.mkdtemp(prefix="load_test_")
+        processes, port = spawn_stack(args, save_dir)
+        host, server_pid = "127.0.0.1", processes[0].pid
+    try:
+        await wait_for_port(host, port)
+        levels = []
+        for clients in args.clients:
+            level = await run_level(host, port, clients, args.turns, args.character, server_pid, args.connect_batch)
+            levels.append(level)
+            print(f"{clients:>6} clients: {level['turns_per_s']:.1f} turns/s, "
+                  f"p50 {level['latency_ms']['p50'] or 0:.0f}ms p99 {level['latency_ms']['p99'] or 0:.0f}ms, "
+                  f"ttfb p50 {level['ttfb_ms']['p50'] or 0:.0f}ms, errors {level['errors']}", file=sys.stderr)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    return {
+        "revision": git_revision(),
+        "timestamp": time.time(),
+        "fake_ollama": None if args.server else {
+            "tokens_per_second": args.tokens_per_second, "first_token_ms": args.first_token_ms, "backends": args.backends
+        },
+        "save_dir": save_dir,
+        "levels": levels,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, nargs="+", default=[10, 100, 1000], help="Concurrent connections per level")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per connection")
+    parser.add_argument("--character", default="Clara")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="Fake Ollama streaming rate")
+    parser.add_argument("--first-token-ms", type=float, default=200.0, help="Fake Ollama prompt evaluation delay")
+    parser.add_argument("--backends", type=int, default=1, help="Fake Ollama backends to balance across")
+    parser.add_argument("--connect-batch", type=int, default=100, help="Connections opened before a short pause")
+    parser.add_argument("--server", help="host:port of an already running server instead of spawning one")
+    parser.add_argument("--server-pid", type=int, help="PID of that server, for RSS sampling")
+    parser.add_argument("--server-logs", action="store_true", help="Show the spawned server's log output")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
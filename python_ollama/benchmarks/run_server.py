@@ -0,0 +1,41 @@
+"""
+Run server.py against another Ollama URL with a throwaway save directory, for load tests.
+
+Usage:
+    python benchmarks/run_server.py --port 56000 --base-url http://127.0.0.1:11435 [http://127.0.0.1:11436 ...] --save-dir /tmp/saves [--metrics-port 56001] [--eager]
+"""
+import os
+import sys
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--base-url", required=True, nargs="+", help="Ollama (or fake Ollama) URLs; several are load-balanced")
+    parser.add_argument("--save-dir", required=True, help="Directory for chat logs and lore stores")
+    parser.add_argument("--lore", action="store_true", help="Keep lore retrieval enabled")
+    parser.add_argument("--metrics-port", type=int, help="Port of /metrics and /ready (default: from settings)")
+    parser.add_argument("--eager", action="store_true", help="Finish the warm-up before listening")
+    args = parser.parse_args()
+
+    server.BASE_URL = args.base_url[0]
+    server.BACKENDS = args.base_url
+    server.SAVE_DIR = args.save_dir
+    if not args.lore:
+        server.LORE_SETTINGS["enabled"] = False
+    if args.metrics_port:
+        server.METRICS_SETTINGS["port"] = args.metrics_port
+    if args.eager:
+        server.STARTUP_SETTINGS["lazy"] = False
+    try:
+        asyncio.run(server.CompanionServer(args.host, args.port).serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import os
+import time
+import logging
+import threading
+from typing import NamedTuple
+
+from prompting import render_static_prefix
+
+CHAR_DATA_DIR = os.path.join(os.path.dirname(__file__), 'char_data')
+FALLBACK_CHARACTER = 'Clara'
+DEFAULT_DESCRIPTION = 'a witty, adventurous space pirate with a knack for clever quips and a heart of gold'
+
+class CharacterProfile(NamedTuple):
+    """A parsed character sheet with its prompt prefix already rendered."""
+    name: str
+    path: str
+    description: str
+    personality: str
+    static_prefix: str
+    stamp: tuple
+
+def parse_character_sheet(text):
+    """
+    Extract the description and personality from a character sheet in one pass.
+
+    The first non-empty line is the description; the lines after
+    "Personality Traits:" up to the next blank line or "Key: value" line are
+    the personality.
+    """
+    description = None
+    personality_lines = []
+    in_personality = False
+    for line in text.splitlines():
+        stripped = line.strip()
+        if description is None and stripped:
+            description = stripped
+        if in_personality:
+            if not stripped or ':' in line:
+                break
+            personality_lines.append(stripped)
+        elif stripped.startswith('Personality Traits:'):
+            in_personality = True
+    return description or DEFAULT_DESCRIPTION, ' '.join(personality_lines)
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+class ProfileCache:
+    """
+    Character profiles parsed once and kept until their file changes.
+
+    Entries are revalidated with a single stat at most every `check_interval`
+    seconds, comparing mtime, inode and size, so edited or replaced sheets are
+    hot-reloaded while most lookups do no file I/O at all. A name without a
+    sheet falls back to the fallback character's sheet, rendered under the
+    requested name, until a sheet for that name appears.
+    """
+
+    def __init__(self, base_dir=CHAR_DATA_DIR, fallback=FALLBACK_CHARACTER, check_interval=2.0, max_entries=1024):
+        """
+        Args:
+            base_dir (str): Directory holding <name>.txt character sheets.
+            fallback (str): Character whose sheet is used for unknown names.
+            check_interval (float): Seconds between freshness checks of one entry. 0 checks on every lookup.
+            max_entries (int): Cached names, bounding the cache against arbitrary client-supplied names.
+        """
+        self.base_dir = base_dir
+        self.fallback = fallback
+        self.check_interval = check_interval
+        self.max_entries = max_entries
+        self.loads = 0
+        self._entries = {}  # name -> (profile, checked_at)
+        self._lock = threading.Lock()
+
+    def sheet_path(self, character_name):
+        return os.path.join(self.base_dir, f'{character_name}.txt')
+
+    def _resolve(self, character_name):
+        path = self.sheet_path(character_name)
+        # Names come from clients; anything that is not a plain file name gets the fallback
+        stamp = _file_stamp(path) if os.path.basename(character_name) == character_name else None
+        if stamp is None and character_name != self.fallback:
+            path = self.sheet_path(self.fallback)
+            stamp = _file_stamp(path)
+        return path, stamp
+
+    def _load(self, character_name, path, stamp):
+        description, personality = DEFAULT_DESCRIPTION, ''
+        if stamp is not None:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    description, personality = parse_character_sheet(f.read())
+            except Exception as e:
+                logging.warning(f"Failed to load character data from {path}: {e}")
+        if path != self.sheet_path(character_name):
+            logging.warning(f"No character sheet for {character_name}, using {os.path.basename(path)}")
+        self.loads += 1
+        return CharacterProfile(
+            name=character_name,
+            path=path,
+            description=description,
+            personality=personality,
+            static_prefix=render_static_prefix(character_name, description, personality),
+            stamp=stamp
+        )
+
+    def get(self, character_name):
+        """Return the current profile for a character, reparsing its sheet only if it changed."""
+        now = time.monotonic()
+        entry = self._entries.get(character_name)
+        if entry is not None and now - entry[1] < self.check_interval:
+            return entry[0]
+        with self._lock:
+            entry = self._entries.get(character_name)
+            path, stamp = self._resolve(character_name)
+            if entry is not None and entry[0].path == path and entry[0].stamp == stamp:
+                profile = entry[0]
+            else:
+                profile = self._load(character_name, path, stamp)
+            self._entries[character_name] = (profile, now)
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+            return profile
+
+    def preload(self):
+        """Parse every sheet in the character directory, e.g. at server startup."""
+        try:
+            names = sorted(name[:-len('.txt')] for name in os.listdir(self.base_dir) if name.endswith('.txt'))
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            self.get(name)
+        logging.info(f"Preloaded {len(names)} character profiles")
+        return names
+
+profiles = ProfileCache()
+
+def get_profile(character_name):
+    return profiles.get(character_name)
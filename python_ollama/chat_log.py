@@ -0,0 +1,550 @@
+import os
+import re
+import gzip
+import json
+import time
+import queue
+import atexit
+import struct
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Sidecar index: one little-endian uint64 byte offset per record in the active segment
+INDEX_ENTRY = struct.Struct('<Q')
+TAIL_BLOCK_SIZE = 64 * 1024
+
+# A conversation log is an active JSONL segment (<id>.log) plus sealed segments
+# <id>.000001.log, <id>.000002.log.gz, ... that are read-only and optionally compressed.
+SEGMENT_SUFFIXES = {".gz": "gzip", ".zst": "zstd"}
+
+FSYNC_POLICIES = ("none", "interval", "batch")
+
+def index_path(log_path):
+    return log_path + ".idx"
+
+def snapshot_path(log_path):
+    return log_path + ".summary.json"
+
+def segment_counts_path(log_path):
+    """Sidecar with the number of records of each sealed segment, so counting a log never reads them."""
+    return log_path + ".segments.json"
+
+def _sealed_segments(log_path):
+    directory, name = os.path.split(log_path)
+    base = name[:-len(".log")] if name.endswith(".log") else name
+    pattern = re.compile(re.escape(base) + r"\.(\d{6})\.log(\.gz|\.zst)?$")
+    try:
+        names = os.listdir(directory or ".")
+    except FileNotFoundError:
+        return []
+    segments = []
+    for candidate in names:
+        match = pattern.match(candidate)
+        if match:
+            segments.append((int(match.group(1)), os.path.join(directory, candidate)))
+    return sorted(segments)
+
+def segment_paths(log_path):
+    """Sealed segments of a log, oldest first."""
+    return [path for _, path in _sealed_segments(log_path)]
+
+def read_segment(path):
+    """Read the full contents of a sealed segment, decompressing it if needed."""
+    _, suffix = os.path.splitext(path)
+    codec = SEGMENT_SUFFIXES.get(suffix)
+    if codec == "gzip":
+        with gzip.open(path, "rb") as f:
+            return f.read()
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to read {path}")
+        with open(path, "rb") as f:
+            return zstandard.ZstdDecompressor().decompressobj().decompress(f.read())
+    with open(path, "rb") as f:
+        return f.read()
+
+def rebuild_index(log_path):
+    """Scan the active segment once and write its sidecar offset index. Used for logs that predate the index."""
+    offsets = bytearray()
+    with open(log_path, "rb") as f:
+        offset = 0
+        for line in f:
+            if line.strip():
+                offsets += INDEX_ENTRY.pack(offset)
+            offset += len(line)
+    with open(index_path(log_path), "wb") as idxf:
+        idxf.write(offsets)
+
+def count_records(log_path):
+    """Number of records in the active segment, read from its sidecar index."""
+    flush_pending_writes()
+    if not os.path.exists(log_path):
+        return 0
+    if not os.path.exists(index_path(log_path)):
+        rebuild_index(log_path)
+    return os.path.getsize(index_path(log_path)) // INDEX_ENTRY.size
+
+_segment_counts_lock = threading.Lock()
+
+def _load_segment_counts(log_path):
+    try:
+        with open(segment_counts_path(log_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logging.warning(f"Failed to load segment counts of {log_path}: {e}")
+        return {}
+
+def _save_segment_counts(log_path, counts):
+    path = segment_counts_path(log_path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(counts, f)
+    os.replace(tmp_path, path)
+
+def _record_segment_count(log_path, number, count):
+    with _segment_counts_lock:
+        counts = _load_segment_counts(log_path)
+        counts[str(number)] = count
+        try:
+            _save_segment_counts(log_path, counts)
+        except Exception as e:
+            logging.warning(f"Failed to write segment counts of {log_path}: {e}")
+
+def count_all_records(log_path):
+    """
+    Number of records across the sealed segments and the active segment.
+
+    Sealed segments are counted from the counts sidecar written when they were
+    sealed, and the active one from its index, so the cost does not grow with
+    the conversation. Segments sealed before the sidecar existed are read once
+    and their counts recorded.
+    """
+    total = count_records(log_path)
+    with _segment_counts_lock:
+        counts = _load_segment_counts(log_path)
+        missing = False
+        # A segment being compressed briefly exists twice; count its number once
+        for number, path in dict(_sealed_segments(log_path)).items():
+            if str(number) not in counts:
+                try:
+                    counts[str(number)] = len(_parse_lines(read_segment(path).splitlines()))
+                except Exception as e:
+                    logging.warning(f"Failed to read log segment {path}: {e}")
+                    continue
+                missing = True
+            total += counts[str(number)]
+        if missing:
+            try:
+                _save_segment_counts(log_path, counts)
+            except Exception as e:
+                logging.warning(f"Failed to write segment counts of {log_path}: {e}")
+    return total
+
+def read_record(log_path, position):
+    """
+    Read a single record of the active segment by position using the sidecar index.
+
+    Args:
+        log_path (str): Path to the chat log.
+        position (int): Record number; negative values count from the end.
+    Returns:
+        dict: The decoded record.
+    """
+    total = count_records(log_path)
+    if position < 0:
+        position += total
+    if not 0 <= position < total:
+        raise IndexError(f"Record {position} out of range for {log_path} ({total} records)")
+    with open(index_path(log_path), "rb") as idxf:
+        idxf.seek(position * INDEX_ENTRY.size)
+        offset = INDEX_ENTRY.unpack(idxf.read(INDEX_ENTRY.size))[0]
+    with open(log_path, "rb") as f:
+        f.seek(offset)
+        return json.loads(f.readline().decode("utf-8"))
+
+def _parse_lines(lines):
+    records = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line.decode("utf-8")))
+        except Exception as e:
+            logging.warning(f"Failed to parse log line: {e}")
+    return records
+
+def _read_active_tail(log_path, count, block_size):
+    if not os.path.exists(log_path):
+        return []
+    with open(log_path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b''
+        # One extra newline guarantees the first kept line is complete
+        while position > 0 and data.count(b'\n') <= count:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.split(b'\n')
+    if position > 0:
+        lines = lines[1:]  # Partial line cut by the block boundary
+    return _parse_lines(lines)[-count:]
+
+def read_tail_records(log_path, count, block_size=TAIL_BLOCK_SIZE):
+    """
+    Read the last `count` records of a log by seeking backwards from EOF.
+
+    Only the blocks holding those records are read, so the cost depends on the
+    window size rather than on the length of the conversation. Sealed segments
+    are only opened when the active segment holds fewer than `count` records.
+    """
+    if count <= 0:
+        return []
+    flush_pending_writes()
+    records = _read_active_tail(log_path, count, block_size)
+    for segment in reversed(segment_paths(log_path)):
+        if len(records) >= count:
+            break
+        try:
+            older = _parse_lines(read_segment(segment).split(b'\n'))
+        except Exception as e:
+            logging.warning(f"Failed to read log segment {segment}: {e}")
+            break
+        records = older[-(count - len(records)):] + records
+    return records
+
+def iter_records(log_path):
+    """Yield every record of a log, oldest first, across sealed segments and the active segment."""
+    flush_pending_writes()
+    for path in segment_paths(log_path):
+        try:
+            yield from _parse_lines(read_segment(path).splitlines())
+        except Exception as e:
+            logging.warning(f"Failed to read log segment {path}: {e}")
+    if os.path.exists(log_path):
+        with open(log_path, "rb") as f:
+            yield from _parse_lines(f)
+
+def load_chat_history_from_log(log_path, short_term_memory, max_turns=None):
+    """
+    Restore the most recent turns of a log into short-term memory.
+
+    Args:
+        log_path (str): Path to the chat log.
+        short_term_memory: Memory receiving the turns.
+        max_turns (int): Number of turns to restore. Defaults to the memory's window size.
+    """
+    if max_turns is None:
+        max_turns = short_term_memory.k
+    try:
+        for log_entry in read_tail_records(log_path, max_turns):
+            short_term_memory.save_context(
+                {"input": log_entry.get("user_input", "")},
+                {"output": log_entry.get("answer", "")}
+            )
+    except Exception as e:
+        logging.warning(f"Failed to load chat history: {e}")
+
+class _ActiveSegment:
+    """Open handles for the active segment of one log."""
+
+    def __init__(self, log_path):
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        if os.path.exists(log_path) and not os.path.exists(index_path(log_path)):
+            rebuild_index(log_path)
+        self.logf = open(log_path, "ab")
+        self.idxf = open(index_path(log_path), "ab")
+        self.size = self.logf.tell()
+        self.dirty = False
+
+    def write(self, line):
+        self.idxf.write(INDEX_ENTRY.pack(self.size))
+        self.logf.write(line)
+        self.size += len(line)
+        self.dirty = True
+
+    def flush(self, fsync):
+        self.logf.flush()
+        self.idxf.flush()
+        if fsync:
+            os.fsync(self.logf.fileno())
+            os.fsync(self.idxf.fileno())
+        self.dirty = False
+
+    def close(self):
+        self.logf.close()
+        self.idxf.close()
+
+# Longest a reader waits for the writer to catch up before reading what is on disk
+FLUSH_TIMEOUT = 30.0
+
+class LogWriter:
+    """
+    Background writer for chat logs.
+
+    A single thread owns every log file handle. Records queued by any session
+    are written in batches (group commit), flushed once per batch and synced
+    according to the fsync policy. Active segments are sealed once they grow
+    past `segment_max_bytes` and optionally compressed off the write path.
+    """
+
+    def __init__(self, fsync="interval", fsync_interval=1.0, batch_max=256,
+                 segment_max_bytes=8 * 1024 * 1024, compression="gzip", max_open_files=128):
+        """
+        Args:
+            fsync (str): "none" (leave it to the OS), "interval" (at most every fsync_interval seconds) or "batch".
+            fsync_interval (float): Seconds between syncs for the "interval" policy.
+            batch_max (int): Maximum number of records written per batch.
+            segment_max_bytes (int): Seal the active segment once it grows past this size.
+            compression (str): "gzip", "zstd" or "none" for sealed segments.
+            max_open_files (int): Maximum number of active segments kept open.
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync!r}, expected one of {FSYNC_POLICIES}")
+        if compression == "zstd" and zstandard is None:
+            logging.warning("zstandard is not installed, compressing sealed log segments with gzip")
+            compression = "gzip"
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.batch_max = batch_max
+        self.segment_max_bytes = segment_max_bytes
+        self.compression = compression
+        self.max_open_files = max_open_files
+        self._queue = queue.Queue()
+        # Set by close(); checked under the lock so nothing is queued behind the stop marker
+        self.closed = False
+        self._close_lock = threading.Lock()
+        self._segments = OrderedDict()
+        self._last_sync = time.monotonic()
+        self._compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-compress")
+        self._thread = threading.Thread(target=self._run, name="chat-log-writer", daemon=True)
+        self._thread.start()
+
+    def append(self, log_path, record):
+        """Queue a record for the given log. Returns immediately; records appended after close() are dropped."""
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._close_lock:
+            if not self.closed:
+                self._queue.put((log_path, line))
+                return
+        logging.warning(f"Log writer is closed, dropped a record for {log_path}")
+
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        """
+        Block until every record queued so far has been written, for at most `timeout` seconds.
+
+        Returns:
+            bool: False if the writer is closed or did not catch up in time.
+        """
+        if threading.current_thread() is self._thread:
+            return True
+        done = threading.Event()
+        with self._close_lock:
+            if self.closed or not self._thread.is_alive():
+                return False
+            self._queue.put(done)
+        if not done.wait(timeout):
+            logging.warning(f"Log writer did not flush within {timeout}s")
+            return False
+        return True
+
+    def close(self):
+        """Write everything that is queued, sync and close all handles."""
+        with self._close_lock:
+            if self.closed:
+                return
+            self.closed = True
+            if self._thread.is_alive():
+                self._queue.put(None)
+        self._thread.join()
+        self._compressor.shutdown(wait=True)
+
+    def _segment(self, log_path):
+        segment = self._segments.get(log_path)
+        if segment is None:
+            segment = _ActiveSegment(log_path)
+            self._segments[log_path] = segment
+            while len(self._segments) > self.max_open_files:
+                _, oldest = self._segments.popitem(last=False)
+                oldest.flush(self.fsync != "none")
+                oldest.close()
+        self._segments.move_to_end(log_path)
+        return segment
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.fsync_interval)]
+            except queue.Empty:
+                self._sync_dirty(force=False)
+                continue
+            while len(batch) < self.batch_max:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = False
+            waiters = []
+            touched = set()
+            for item in batch:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    log_path, line = item
+                    try:
+                        segment = self._segment(log_path)
+                        segment.write(line)
+                        touched.add(log_path)
+                        if segment.size >= self.segment_max_bytes:
+                            self._seal(log_path)
+                    except Exception as e:
+                        logging.warning(f"Failed to write to log: {e}")
+            for log_path in touched:
+                segment = self._segments.get(log_path)
+                if segment is None:
+                    continue  # Sealed during this batch
+                try:
+                    segment.flush(self.fsync == "batch")
+                except Exception as e:
+                    logging.warning(f"Failed to flush log {log_path}: {e}")
+            self._sync_dirty(force=stop)
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                for segment in self._segments.values():
+                    segment.close()
+                self._segments.clear()
+                return
+
+    def _sync_dirty(self, force):
+        if self.fsync != "interval":
+            return
+        now = time.monotonic()
+        if not force and now - self._last_sync < self.fsync_interval:
+            return
+        self._last_sync = now
+        for segment in self._segments.values():
+            if segment.dirty:
+                segment.flush(True)
+
+    def _seal(self, log_path):
+        """Rename the active segment to the next sealed segment number and compress it in the background."""
+        segment = self._segments.pop(log_path)
+        segment.flush(self.fsync != "none")
+        segment.close()
+        existing = _sealed_segments(log_path)
+        number = existing[-1][0] + 1 if existing else 1
+        sealed = f"{log_path[:-len('.log')]}.{number:06d}.log"
+        count = os.path.getsize(index_path(log_path)) // INDEX_ENTRY.size
+        os.replace(log_path, sealed)
+        os.remove(index_path(log_path))
+        _record_segment_count(log_path, number, count)
+        logging.info(f"Sealed log segment {sealed}")
+        if self.compression != "none":
+            self._compressor.submit(compress_segment, sealed, self.compression)
+
+def compress_segment(path, compression="gzip"):
+    """Compress a sealed segment next to itself and remove the uncompressed copy."""
+    target = path + (".zst" if compression == "zstd" else ".gz")
+    tmp_path = target + ".tmp"
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        if compression == "zstd":
+            data = zstandard.ZstdCompressor().compress(data)
+        else:
+            data = gzip.compress(data)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, target)
+        os.remove(path)
+    except Exception as e:
+        logging.warning(f"Failed to compress log segment {path}: {e}")
+
+_log_writer = None
+_log_writer_lock = threading.Lock()
+
+def configure_log_writer(**kwargs):
+    """Replace the process-wide log writer, e.g. with settings from config. Flushes the previous one."""
+    global _log_writer
+    with _log_writer_lock:
+        previous = _log_writer
+        _log_writer = LogWriter(**kwargs)
+    if previous is not None:
+        previous.close()
+    return _log_writer
+
+def get_log_writer():
+    """Return the process-wide log writer, starting one with default settings if needed."""
+    global _log_writer
+    with _log_writer_lock:
+        if _log_writer is None:
+            _log_writer = LogWriter()
+        return _log_writer
+
+def flush_pending_writes():
+    """Make records queued in the background writer visible to readers."""
+    if _log_writer is not None:
+        _log_writer.flush()
+
+@atexit.register
+def _close_log_writer():
+    if _log_writer is not None:
+        _log_writer.close()
+
+def save_chat_to_log(log_path, user_input, answer):
+    """Queue a user input and answer for the log file. The write happens on the background log writer."""
+    get_log_writer().append(log_path, {
+        "user_input": user_input,
+        "answer": answer
+    })
+
+def load_memory_snapshot(log_path):
+    """
+    Return the long-term memory stored next to a log.
+
+    Returns:
+        dict: "summary" (the arc summary) and "chunks", the chunk summaries as dicts with
+            first_turn, last_turn, summary and rolled (already folded into the summary).
+    """
+    try:
+        with open(snapshot_path(log_path), "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        return {"summary": snapshot.get("summary", ""), "chunks": snapshot.get("chunks", [])}
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.warning(f"Failed to load summary snapshot: {e}")
+    return {"summary": "", "chunks": []}
+
+def save_memory_snapshot(log_path, summary, chunks):
+    """Atomically replace the long-term memory snapshot stored next to a log."""
+    path = snapshot_path(log_path)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "chunks": chunks, "updated": time.time()}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logging.warning(f"Failed to write summary snapshot: {e}")
+
+def load_summary_snapshot(log_path):
+    """Return the compacted long-term summary stored next to a log, or an empty string."""
+    return load_memory_snapshot(log_path)["summary"]
+
+def save_summary_snapshot(log_path, summary):
+    """Atomically replace the summary stored next to a log, keeping its chunk summaries."""
+    save_memory_snapshot(log_path, summary, load_memory_snapshot(log_path)["chunks"])
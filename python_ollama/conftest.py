@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The server modules import each other by their flat names, as when run from python_ollama/
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# benchmarks/load_test.py is a script, not a test module
+collect_ignore = ["benchmarks"]
@@ -0,0 +1,664 @@
+import os
+import re
+import json
+import time
+import uuid
+import queue
+import atexit
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+
+import chat_log
+
+STORE_BACKENDS = ("sqlite", "log")
+
+# <id>.log and its sealed segments <id>.000001.log[.gz|.zst]
+LOG_FILE_NAME = re.compile(r"^(?P<id>.+?)(?:\.\d{6})?\.log(?:\.gz|\.zst)?$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    conversation_id TEXT PRIMARY KEY,
+    character_name TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    turn_count INTEGER NOT NULL DEFAULT 0,
+    summary TEXT NOT NULL DEFAULT '',
+    summary_updated REAL,
+    metadata TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS conversations_updated ON conversations(updated);
+CREATE INDEX IF NOT EXISTS conversations_character ON conversations(character_name, updated);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    created REAL NOT NULL,
+    user_input TEXT NOT NULL,
+    answer TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turns_conversation ON turns(conversation_id, id);
+CREATE INDEX IF NOT EXISTS turns_created ON turns(created);
+CREATE TABLE IF NOT EXISTS summary_chunks (
+    conversation_id TEXT NOT NULL,
+    first_turn INTEGER NOT NULL,
+    last_turn INTEGER NOT NULL,
+    summary TEXT NOT NULL,
+    created REAL NOT NULL,
+    rolled INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (conversation_id, first_turn)
+);
+"""
+
+# Full-text index over turns, kept in sync by triggers. Optional: not every SQLite build has FTS5.
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5(user_input, answer, content='turns', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS turns_fts_insert AFTER INSERT ON turns BEGIN
+    INSERT INTO turns_fts(rowid, user_input, answer) VALUES (new.id, new.user_input, new.answer);
+END;
+CREATE TRIGGER IF NOT EXISTS turns_fts_delete AFTER DELETE ON turns BEGIN
+    INSERT INTO turns_fts(turns_fts, rowid, user_input, answer) VALUES ('delete', old.id, old.user_input, old.answer);
+END;
+"""
+
+# The statements below are constant strings, so sqlite3's statement cache prepares each once per connection
+INSERT_TURN = "INSERT INTO turns(conversation_id, created, user_input, answer) VALUES (?, ?, ?, ?)"
+UPSERT_CONVERSATION = """
+INSERT INTO conversations(conversation_id, character_name, created, updated, turn_count) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(conversation_id) DO UPDATE SET
+    updated = excluded.updated,
+    turn_count = turn_count + excluded.turn_count,
+    character_name = COALESCE(excluded.character_name, character_name)
+"""
+UPSERT_SUMMARY = """
+INSERT INTO conversations(conversation_id, created, updated, summary, summary_updated) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(conversation_id) DO UPDATE SET summary = excluded.summary, summary_updated = excluded.summary_updated
+"""
+SELECT_TAIL = """
+SELECT user_input, answer FROM (
+    SELECT id, user_input, answer FROM turns WHERE conversation_id = ? ORDER BY id DESC LIMIT ?
+) ORDER BY id
+"""
+SELECT_TURNS_AFTER = "SELECT id, user_input, answer FROM turns WHERE conversation_id = ? AND id > ? ORDER BY id LIMIT ?"
+INSERT_CHUNK = """
+INSERT OR REPLACE INTO summary_chunks(conversation_id, first_turn, last_turn, summary, created, rolled) VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+def _record(user_input, answer):
+    return {"user_input": user_input, "answer": answer}
+
+def _memory(arc, turns, chunks):
+    """The load_memory result from the arc, the turn count and every stored chunk summary."""
+    return {
+        "arc": arc,
+        "turns": turns,
+        "chunks": [{key: chunk[key] for key in ("first_turn", "last_turn", "summary")} for chunk in chunks if not chunk["rolled"]],
+        "summarized": max(chunk["last_turn"] for chunk in chunks) + 1 if chunks else None,
+    }
+
+class ConversationStore(ABC):
+    """
+    Where conversations, their turns, summaries and metadata live.
+
+    Writes (`append_turn`, `save_summary`) are queued and return immediately;
+    reads see every write queued before them.
+    """
+
+    @abstractmethod
+    def create_conversation(self, character_name=None):
+        """Allocate a conversation_id that no stored conversation uses."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def exists(self, conversation_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def append_turn(self, conversation_id, user_input, answer, character_name=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def tail(self, conversation_id, count):
+        """The last `count` turns as {"user_input", "answer"} records, oldest first."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_turns(self, conversation_id):
+        """Every turn of a conversation, oldest first."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_summary(self, conversation_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_summary(self, conversation_id, summary):
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_memory(self, conversation_id):
+        """
+        Tiered memory of a conversation, see summarizer.TieredMemory.
+
+        Returns:
+            dict: "arc" (the summary), "turns" (stored turn count), "chunks" (chunk summaries not yet
+                in the arc, as dicts with first_turn, last_turn and summary, oldest first) and
+                "summarized" (turns covered by any chunk, None if no chunk was ever stored).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_chunk(self, conversation_id, first_turn, last_turn, summary):
+        """Store the summary of turns first_turn..last_turn (0-based, inclusive)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_arc(self, conversation_id, arc, through_turn):
+        """Replace the summary with a new arc that covers every chunk ending before through_turn."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_conversations(self, character_name=None, limit=100, offset=0):
+        """Conversations as dicts, most recently updated first."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def search(self, text, conversation_id=None, limit=20):
+        """Turns containing `text` as dicts with their conversation_id, newest first."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def expire(self, max_age):
+        """Delete conversations not updated for `max_age` seconds. Returns their ids."""
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def load_history(self, conversation_id, short_term_memory, max_turns):
+        """Restore the most recent turns of a conversation into short-term memory."""
+        try:
+            for record in self.tail(conversation_id, max_turns):
+                short_term_memory.save_context(
+                    {"input": record.get("user_input", "")},
+                    {"output": record.get("answer", "")}
+                )
+        except Exception as e:
+            logging.warning(f"Failed to load chat history of {conversation_id}: {e}")
+
+class SQLiteStore(ConversationStore):
+    """
+    Conversations in one SQLite database in WAL mode.
+
+    A single writer thread owns the write connection and commits queued turns
+    in batches, one transaction and one executemany per batch, the same group
+    commit as the chat log writer. Readers use one connection per thread; WAL
+    lets them run while the writer commits.
+    """
+
+    def __init__(self, path, batch_max=256, busy_timeout=5.0, synchronous="NORMAL"):
+        """
+        Args:
+            path (str): Database file.
+            batch_max (int): Maximum number of queued writes committed per transaction.
+            busy_timeout (float): Seconds a connection waits for a lock held by another process.
+            synchronous (str): SQLite synchronous pragma. NORMAL only syncs at WAL checkpoints.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.batch_max = batch_max
+        self.busy_timeout = busy_timeout
+        self.synchronous = synchronous
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        self._closed = False
+        writer = self._connect()
+        writer.executescript(SCHEMA)
+        try:
+            writer.executescript(FTS_SCHEMA)
+            self.full_text = True
+        except sqlite3.OperationalError as e:
+            logging.warning(f"SQLite without FTS5, conversation search scans turns: {e}")
+            self.full_text = False
+        self._thread = threading.Thread(target=self._run, args=(writer,), name="conversation-store-writer", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False,
+                                     isolation_level=None, cached_statements=64)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(f"PRAGMA synchronous={self.synchronous}")
+        connection.execute("PRAGMA foreign_keys=ON")
+        return connection
+
+    def _reader(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    # Writes
+
+    def _submit(self, operation):
+        """Run operation(connection) on the writer thread inside its own transaction and return a Future."""
+        future = Future()
+        self._queue.put((operation, future))
+        return future
+
+    def _run(self, connection):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_max:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = False
+            turns = []
+            touched = {}
+            waiters = []
+            for item in batch:
+                if item is None:
+                    stop = True
+                elif item[0] == "turn":
+                    _, conversation_id, character_name, created, user_input, answer = item
+                    turns.append((conversation_id, created, user_input, answer))
+                    previous = touched.get(conversation_id)
+                    touched[conversation_id] = (
+                        character_name or (previous[0] if previous else None), created, (previous[2] if previous else 0) + 1
+                    )
+                else:
+                    waiters.append(item)
+            if turns:
+                try:
+                    with connection:
+                        connection.execute("BEGIN")
+                        connection.executemany(INSERT_TURN, turns)
+                        connection.executemany(UPSERT_CONVERSATION, [
+                            (conversation_id, character_name, created, created, count)
+                            for conversation_id, (character_name, created, count) in touched.items()
+                        ])
+                except Exception as e:
+                    logging.warning(f"Failed to store {len(turns)} turns: {e}")
+            for operation, future in waiters:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    with connection:
+                        connection.execute("BEGIN")
+                        result = operation(connection)
+                    future.set_result(result)
+                except Exception as e:
+                    future.set_exception(e)
+            if stop:
+                connection.close()
+                return
+
+    def append_turn(self, conversation_id, user_input, answer, character_name=None):
+        self._queue.put(("turn", str(conversation_id), character_name, time.time(), user_input, answer))
+
+    def save_summary(self, conversation_id, summary):
+        now = time.time()
+        self._submit(lambda connection: connection.execute(UPSERT_SUMMARY, (str(conversation_id), now, now, summary, now)))
+
+    def save_chunk(self, conversation_id, first_turn, last_turn, summary):
+        now = time.time()
+        self._submit(lambda connection: connection.execute(
+            INSERT_CHUNK, (str(conversation_id), first_turn, last_turn, summary, now, 0)
+        ))
+
+    def save_arc(self, conversation_id, arc, through_turn):
+        now = time.time()
+
+        def update(connection):
+            connection.execute(
+                "UPDATE summary_chunks SET rolled = 1 WHERE conversation_id = ? AND last_turn < ?",
+                (str(conversation_id), through_turn)
+            )
+            connection.execute(UPSERT_SUMMARY, (str(conversation_id), now, now, arc, now))
+        self._submit(update)
+
+    def create_conversation(self, character_name=None):
+        while True:
+            conversation_id = str(uuid.uuid4())
+            now = time.time()
+            created = self._submit(lambda connection: connection.execute(
+                "INSERT OR IGNORE INTO conversations(conversation_id, character_name, created, updated) VALUES (?, ?, ?, ?)",
+                (conversation_id, character_name, now, now)
+            ).rowcount).result()
+            if created:
+                return conversation_id
+
+    def set_metadata(self, conversation_id, **metadata):
+        """Merge keys into a conversation's JSON metadata."""
+        def update(connection):
+            row = connection.execute("SELECT metadata FROM conversations WHERE conversation_id = ?", (str(conversation_id),)).fetchone()
+            if row is None:
+                return False
+            merged = json.loads(row[0] or "{}")
+            merged.update(metadata)
+            connection.execute("UPDATE conversations SET metadata = ? WHERE conversation_id = ?",
+                               (json.dumps(merged, ensure_ascii=False), str(conversation_id)))
+            return True
+        return self._submit(update).result()
+
+    def import_conversation(self, conversation_id, records, character_name=None, summary="", chunks=(), updated=None,
+                            replace=False):
+        """
+        Insert a whole conversation in one transaction, e.g. when migrating chat logs.
+
+        `chunks` are chunk summaries as stored by LogFileStore: dicts with first_turn, last_turn, summary and rolled.
+
+        Returns:
+            int or None: Number of turns inserted, or None if the conversation exists and `replace` is false.
+        """
+        conversation_id = str(conversation_id)
+        updated = updated or time.time()
+        rows = [(conversation_id, updated, record.get("user_input", ""), record.get("answer", "")) for record in records]
+        chunk_rows = [(conversation_id, chunk["first_turn"], chunk["last_turn"], chunk["summary"], updated, int(chunk.get("rolled", False)))
+                      for chunk in chunks]
+
+        def insert(connection):
+            exists = connection.execute("SELECT 1 FROM conversations WHERE conversation_id = ?", (conversation_id,)).fetchone()
+            if exists and not replace:
+                return None
+            connection.execute("DELETE FROM turns WHERE conversation_id = ?", (conversation_id,))
+            connection.execute("DELETE FROM summary_chunks WHERE conversation_id = ?", (conversation_id,))
+            connection.execute("DELETE FROM conversations WHERE conversation_id = ?", (conversation_id,))
+            connection.executemany(INSERT_TURN, rows)
+            connection.executemany(INSERT_CHUNK, chunk_rows)
+            connection.execute(
+                "INSERT INTO conversations(conversation_id, character_name, created, updated, turn_count, summary, summary_updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (conversation_id, character_name, updated, updated, len(rows), summary, updated if summary else None)
+            )
+            return len(rows)
+        return self._submit(insert).result()
+
+    def expire(self, max_age):
+        cutoff = time.time() - max_age
+
+        def delete(connection):
+            expired = [row[0] for row in connection.execute(
+                "SELECT conversation_id FROM conversations WHERE updated < ?", (cutoff,)
+            )]
+            connection.executemany("DELETE FROM turns WHERE conversation_id = ?", [(cid,) for cid in expired])
+            connection.executemany("DELETE FROM summary_chunks WHERE conversation_id = ?", [(cid,) for cid in expired])
+            connection.executemany("DELETE FROM conversations WHERE conversation_id = ?", [(cid,) for cid in expired])
+            return expired
+        expired = self._submit(delete).result()
+        if expired:
+            logging.info(f"Expired {len(expired)} conversations not updated for {max_age}s")
+        return expired
+
+    def flush(self, timeout=None):
+        """Block until every write queued so far is committed."""
+        if threading.current_thread() is self._thread or self._closed:
+            return
+        self._submit(lambda connection: None).result(timeout)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    # Reads
+
+    def exists(self, conversation_id):
+        self.flush()
+        return self._reader().execute(
+            "SELECT 1 FROM conversations WHERE conversation_id = ?", (str(conversation_id),)
+        ).fetchone() is not None
+
+    def tail(self, conversation_id, count):
+        if count <= 0:
+            return []
+        self.flush()
+        return [_record(*row) for row in self._reader().execute(SELECT_TAIL, (str(conversation_id), count))]
+
+    def iter_turns(self, conversation_id, page_size=1000):
+        self.flush()
+        last_id = 0
+        while True:
+            rows = self._reader().execute(SELECT_TURNS_AFTER, (str(conversation_id), last_id, page_size)).fetchall()
+            for row in rows:
+                yield _record(row[1], row[2])
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1][0]
+
+    def load_summary(self, conversation_id):
+        self.flush()
+        row = self._reader().execute(
+            "SELECT summary FROM conversations WHERE conversation_id = ?", (str(conversation_id),)
+        ).fetchone()
+        return row[0] if row else ""
+
+    def load_memory(self, conversation_id):
+        self.flush()
+        reader = self._reader()
+        row = reader.execute(
+            "SELECT summary, turn_count FROM conversations WHERE conversation_id = ?", (str(conversation_id),)
+        ).fetchone()
+        chunks = [{"first_turn": chunk[0], "last_turn": chunk[1], "summary": chunk[2], "rolled": chunk[3]} for chunk in reader.execute(
+            "SELECT first_turn, last_turn, summary, rolled FROM summary_chunks WHERE conversation_id = ? ORDER BY first_turn",
+            (str(conversation_id),)
+        )]
+        return _memory(row[0] if row else "", row[1] if row else 0, chunks)
+
+    def list_conversations(self, character_name=None, limit=100, offset=0):
+        self.flush()
+        query = "SELECT conversation_id, character_name, created, updated, turn_count, metadata FROM conversations"
+        params = ()
+        if character_name is not None:
+            query += " WHERE character_name = ?"
+            params = (character_name,)
+        query += " ORDER BY updated DESC LIMIT ? OFFSET ?"
+        return [{
+            "conversation_id": row[0],
+            "character_name": row[1],
+            "created": row[2],
+            "updated": row[3],
+            "turns": row[4],
+            "metadata": json.loads(row[5] or "{}"),
+        } for row in self._reader().execute(query, params + (limit, offset))]
+
+    def search(self, text, conversation_id=None, limit=20):
+        self.flush()
+        if self.full_text:
+            # Quoted as a single FTS5 phrase so user text cannot inject query syntax
+            phrase = '"' + text.replace('"', '""') + '"'
+            query = ("SELECT turns.conversation_id, turns.created, turns.user_input, turns.answer FROM turns_fts "
+                     "JOIN turns ON turns.id = turns_fts.rowid WHERE turns_fts MATCH ?")
+            params = (phrase,)
+        else:
+            pattern = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            query = ("SELECT conversation_id, created, user_input, answer FROM turns "
+                     "WHERE (user_input LIKE ? ESCAPE '\\' OR answer LIKE ? ESCAPE '\\')")
+            params = (pattern, pattern)
+        if conversation_id is not None:
+            query += " AND turns.conversation_id = ?"
+            params += (str(conversation_id),)
+        query += " ORDER BY turns.id DESC LIMIT ?"
+        return [{"conversation_id": row[0], "created": row[1], **_record(row[2], row[3])}
+                for row in self._reader().execute(query, params + (limit,))]
+
+def conversation_files(save_dir):
+    """Map each conversation_id in a log directory to its files: log, sealed segments, index, segment counts and snapshot."""
+    files = {}
+    try:
+        names = os.listdir(save_dir)
+    except FileNotFoundError:
+        return files
+    for name in names:
+        base = name
+        for suffix in (".idx", ".summary.json", ".segments.json"):
+            if base.endswith(suffix):
+                base = base[:-len(suffix)]
+        match = LOG_FILE_NAME.match(base)
+        if match:
+            files.setdefault(match.group("id"), []).append(os.path.join(save_dir, name))
+    return files
+
+class LogFileStore(ConversationStore):
+    """
+    The original layout: one segmented JSONL log plus a summary snapshot per conversation in a directory.
+
+    Listing, searching and expiring scan the directory; use SQLiteStore for many conversations.
+    """
+
+    def __init__(self, save_dir, **log_writer_settings):
+        self.save_dir = save_dir
+        # Chunk and arc updates rewrite the whole snapshot
+        self._snapshot_lock = threading.Lock()
+        # Kept so close() stops this store's writer, not one a later store installed
+        self.writer = chat_log.configure_log_writer(**log_writer_settings)
+
+    def log_path(self, conversation_id):
+        return os.path.join(self.save_dir, f"{conversation_id}.log")
+
+    def create_conversation(self, character_name=None):
+        while True:
+            conversation_id = str(uuid.uuid4())
+            if not self.exists(conversation_id):
+                return conversation_id
+
+    def exists(self, conversation_id):
+        self.writer.flush()
+        path = self.log_path(conversation_id)
+        return os.path.exists(path) or bool(chat_log.segment_paths(path))
+
+    def append_turn(self, conversation_id, user_input, answer, character_name=None):
+        self.writer.append(self.log_path(conversation_id), _record(user_input, answer))
+
+    def tail(self, conversation_id, count):
+        return chat_log.read_tail_records(self.log_path(conversation_id), count)
+
+    def iter_turns(self, conversation_id):
+        return chat_log.iter_records(self.log_path(conversation_id))
+
+    def load_summary(self, conversation_id):
+        return chat_log.load_summary_snapshot(self.log_path(conversation_id))
+
+    def save_summary(self, conversation_id, summary):
+        with self._snapshot_lock:
+            chat_log.save_summary_snapshot(self.log_path(conversation_id), summary)
+
+    def load_memory(self, conversation_id):
+        self.writer.flush()
+        snapshot = chat_log.load_memory_snapshot(self.log_path(conversation_id))
+        turns = chat_log.count_all_records(self.log_path(conversation_id))
+        return _memory(snapshot["summary"], turns, sorted(snapshot["chunks"], key=lambda chunk: chunk["first_turn"]))
+
+    def save_chunk(self, conversation_id, first_turn, last_turn, summary):
+        log_path = self.log_path(conversation_id)
+        with self._snapshot_lock:
+            snapshot = chat_log.load_memory_snapshot(log_path)
+            chunks = [chunk for chunk in snapshot["chunks"] if chunk["first_turn"] != first_turn]
+            chunks.append({"first_turn": first_turn, "last_turn": last_turn, "summary": summary, "rolled": False})
+            chat_log.save_memory_snapshot(log_path, snapshot["summary"], chunks)
+
+    def save_arc(self, conversation_id, arc, through_turn):
+        log_path = self.log_path(conversation_id)
+        with self._snapshot_lock:
+            chunks = chat_log.load_memory_snapshot(log_path)["chunks"]
+            for chunk in chunks:
+                if chunk["last_turn"] < through_turn:
+                    chunk["rolled"] = True
+            chat_log.save_memory_snapshot(log_path, arc, chunks)
+
+    def list_conversations(self, character_name=None, limit=100, offset=0):
+        if character_name is not None:
+            return []  # Logs do not record the character
+        self.writer.flush()
+        conversations = []
+        for conversation_id, paths in conversation_files(self.save_dir).items():
+            conversations.append({
+                "conversation_id": conversation_id,
+                "character_name": None,
+                "created": min(os.path.getmtime(path) for path in paths),
+                "updated": max(os.path.getmtime(path) for path in paths),
+                "turns": None,
+                "metadata": {},
+            })
+        conversations.sort(key=lambda conversation: conversation["updated"], reverse=True)
+        return conversations[offset:offset + limit]
+
+    def search(self, text, conversation_id=None, limit=20):
+        ids = [conversation_id] if conversation_id is not None else list(conversation_files(self.save_dir))
+        needle = text.lower()
+        hits = []
+        for cid in ids:
+            for record in self.iter_turns(cid):
+                if needle in record.get("user_input", "").lower() or needle in record.get("answer", "").lower():
+                    hits.append({"conversation_id": str(cid), "created": None, **record})
+        return hits[-limit:][::-1]
+
+    def expire(self, max_age):
+        self.writer.flush()
+        cutoff = time.time() - max_age
+        expired = []
+        for conversation_id, paths in conversation_files(self.save_dir).items():
+            if max(os.path.getmtime(path) for path in paths) < cutoff:
+                for path in paths:
+                    os.remove(path)
+                expired.append(conversation_id)
+        if expired:
+            logging.info(f"Expired {len(expired)} conversations not updated for {max_age}s")
+        return expired
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+
+def make_store(backend="sqlite", save_dir=".", path=None, chat_log_settings=None, **settings):
+    """
+    Build the conversation store described by the "storage" settings.
+
+    Args:
+        backend (str): "sqlite" (default) or "log" for the per-conversation JSONL files.
+        save_dir (str): Directory holding the database or the logs.
+        path (str): SQLite database file. Defaults to conversations.db in save_dir.
+        chat_log_settings (dict): LogWriter settings for the "log" backend.
+    """
+    if backend not in STORE_BACKENDS:
+        raise ValueError(f"Unknown storage backend {backend!r}, expected one of {STORE_BACKENDS}")
+    if backend == "log":
+        return LogFileStore(save_dir, **(chat_log_settings or {}))
+    return SQLiteStore(path or os.path.join(save_dir, "conversations.db"), **settings)
+
+_store = None
+_store_lock = threading.Lock()
+
+def configure_store(**kwargs):
+    """Replace the process-wide conversation store, closing the previous one. Takes make_store arguments."""
+    global _store
+    with _store_lock:
+        previous = _store
+        _store = make_store(**kwargs)
+    if previous is not None:
+        previous.close()
+    return _store
+
+def get_store(save_dir="."):
+    """Return the process-wide conversation store, opening a default SQLite store in save_dir if needed."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = make_store(save_dir=save_dir)
+        return _store
+
+@atexit.register
+def _close_store():
+    if _store is not None:
+        _store.close()
@@ -0,0 +1,120 @@
+import logging
+
+# The last section the prompt asks for; nothing after its closing tag is used
+FINAL_SECTION = "actions"
+DEFAULT_STOP = ("</actions>",)
+
+# Appended when the thinking cap is hit: close the reasoning and open the answer
+THINKING_NUDGE = "\n</thinking>\n<answer>\n"
+
+class GenerationSettings:
+    """
+    Per-character generation budgets from the "generation" settings.
+
+    Top-level keys are the defaults; "characters" maps a character name to
+    overrides of num_predict, num_ctx, max_thinking_tokens or stop.
+    """
+
+    def __init__(self, settings=None, default_num_ctx=8192):
+        settings = settings or {}
+        self.defaults = {
+            "num_predict": settings.get("num_predict", -1),
+            "num_ctx": settings.get("num_ctx", default_num_ctx),
+            "max_thinking_tokens": settings.get("max_thinking_tokens", 0),
+            "stop": list(settings.get("stop", DEFAULT_STOP)),
+        }
+        self.characters = settings.get("characters", {})
+
+    def for_character(self, character_name):
+        budget = dict(self.defaults)
+        budget.update(self.characters.get(character_name, {}))
+        return budget
+
+class GenerationControl:
+    """
+    Early-stop policy for one character's completions.
+
+    Ollama stops at the closing tag of the last section through the "stop"
+    option, and the stream is also dropped as soon as the parser has seen that
+    tag, in case the model spells it differently. Once the thinking section
+    runs past `max_thinking_tokens` streamed tokens, the stream is dropped and
+    a second request continues the same reply with the reasoning closed and
+    <answer> opened. It sends the reply so far as an assistant prefill, which
+    the model extends instead of starting a new reply, behind the same
+    templated prompt, so Ollama reuses its KV cache.
+    """
+
+    def __init__(self, num_predict=-1, max_thinking_tokens=0, stop=DEFAULT_STOP, **_):
+        """
+        Args:
+            num_predict (int): Token limit for a whole reply, -1 for none. A continuation gets what is left.
+            max_thinking_tokens (int): Streamed tokens allowed in the thinking section, 0 for no cap.
+            stop (list): Ollama stop sequences.
+        """
+        self.num_predict = num_predict
+        self.max_thinking_tokens = max_thinking_tokens
+        self.stop = list(stop)
+
+    def options(self):
+        """Ollama options for the first request of a turn."""
+        options = {}
+        if self.stop:
+            options["stop"] = self.stop
+        if self.num_predict is not None and self.num_predict > 0:
+            options["num_predict"] = self.num_predict
+        return options
+
+    def start(self):
+        return GenerationState(self)
+
+class GenerationState:
+    """Token accounting of one turn under a GenerationControl."""
+
+    def __init__(self, control):
+        self.control = control
+        self.tokens = 0
+        self.thinking_tokens = 0
+        self.nudged = False
+
+    def should_stop(self, parser):
+        """Call after feeding each streamed chunk to the parser. True when the stream should be dropped."""
+        self.tokens += 1
+        if FINAL_SECTION in parser.closed:
+            return True
+        if parser.channel == "thinking" and self.nudged:
+            return True  # Reasoning reopened after the nudge closed it; the cap covers the whole reply
+        if parser.channel == "thinking":
+            self.thinking_tokens += 1
+            cap = self.control.max_thinking_tokens
+            return bool(cap) and self.thinking_tokens >= cap
+        return False
+
+    def continuation(self, response, parser):
+        """
+        The follow-up request once a stream ended, if any.
+
+        Args:
+            response (str): The reply streamed so far.
+        Returns:
+            tuple or None: (options, assistant prefill, injected text) to stream next for the same prompt,
+                None when the turn is complete.
+        """
+        if self.nudged or parser.channel != "thinking" or not self.control.max_thinking_tokens:
+            return None
+        if self.thinking_tokens < self.control.max_thinking_tokens:
+            return None  # The model ended inside its reasoning on its own; nothing to continue
+        self.nudged = True
+        options = self.control.options()
+        if "num_predict" in options:
+            remaining = options["num_predict"] - self.tokens
+            if remaining <= 0:
+                return None
+            options["num_predict"] = remaining
+        logging.info(f"Thinking cap of {self.control.max_thinking_tokens} tokens reached, continuing with the answer")
+        return options, response + THINKING_NUDGE, THINKING_NUDGE
+
+    def closing(self, parser):
+        """Text completing a reply whose stop sequence Ollama stripped, so stored replies stay well-formed."""
+        if parser.channel == FINAL_SECTION:
+            return f"</{FINAL_SECTION}>"
+        return ""
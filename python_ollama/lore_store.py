@@ -0,0 +1,430 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+import numpy as np
+import requests
+
+from chat_log import iter_records
+
+PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+def content_hash(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+def chunk_text(text, max_chars=600):
+    """
+    Split text into chunks of whole paragraphs of at most `max_chars` characters.
+
+    Paragraphs longer than the limit are split on line boundaries, and lines
+    longer than the limit are cut hard.
+    """
+    chunks = []
+    current = ""
+    for paragraph in PARAGRAPH_SPLIT.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        pieces = [paragraph] if len(paragraph) <= max_chars else [
+            line[i:i + max_chars]
+            for line in paragraph.splitlines() if line.strip()
+            for i in range(0, len(line), max_chars)
+        ]
+        for piece in pieces:
+            if current and len(current) + len(piece) + 2 > max_chars:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def chunk_character_file(path, max_chars=600):
+    """Chunk a full character sheet from char_data/."""
+    with open(path, "r", encoding="utf-8") as f:
+        return chunk_text(f.read(), max_chars)
+
+def format_turn(user_input, answer, character_name="AI"):
+    return f"User: {user_input}\n{character_name}: {answer}"
+
+def chunk_log(log_path, character_name="AI", max_chars=600):
+    """Chunk a conversation log into one chunk per turn, cutting very long turns."""
+    return chunk_turns(iter_records(log_path), character_name, max_chars)
+
+def chunk_turns(records, character_name="AI", max_chars=600):
+    """Chunk {"user_input", "answer"} records into one chunk per turn, cutting very long turns."""
+    chunks = []
+    for record in records:
+        turn = format_turn(record.get("user_input", ""), record.get("answer", ""), character_name)
+        chunks.extend(turn[i:i + max_chars] for i in range(0, len(turn), max_chars))
+    return chunks
+
+class HashEmbedder:
+    """
+    Deterministic feature-hashing embedder.
+
+    Needs no model and gives the same vector for the same text on every
+    machine, which makes it the stand-in for tests and benchmarks. Texts that
+    share words get similar vectors, so it also works as a crude offline fallback.
+    """
+
+    def __init__(self, dim=256):
+        self.dim = dim
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in TOKEN_PATTERN.findall(text.lower()):
+                digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                vectors[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+        return vectors
+
+class OllamaEmbedder:
+    """Embed texts through the local Ollama /api/embed endpoint."""
+
+    def __init__(self, base_url, model="nomic-embed-text", batch_size=64, keep_alive="30m", timeout=60):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.batch_size = batch_size
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self._session = requests.Session()
+        self.dim = None
+
+    def embed(self, texts):
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            response = self._session.post(f"{self.base_url}/api/embed", json={
+                "model": self.model,
+                "input": texts[start:start + self.batch_size],
+                "keep_alive": self.keep_alive,
+            }, timeout=self.timeout)
+            response.raise_for_status()
+            batches.append(np.asarray(response.json()["embeddings"], dtype=np.float32))
+        if not batches:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        vectors = np.concatenate(batches)
+        self.dim = vectors.shape[1]
+        return vectors
+
+def make_embedder(kind, base_url, model="nomic-embed-text", dim=256):
+    """Build the embedder named in settings: "ollama" or "hash"."""
+    if kind == "hash":
+        return HashEmbedder(dim)
+    return OllamaEmbedder(base_url, model)
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def spherical_kmeans(vectors, clusters, iterations=8, sample_size=20000, seed=0):
+    """Cluster unit vectors by cosine similarity, fitting the centroids on a random sample."""
+    rng = np.random.default_rng(seed)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), min(sample_size, len(vectors)), replace=False))])
+    centroids = sample[rng.choice(len(sample), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(clusters + 1))
+        for cluster in range(clusters):
+            if bounds[cluster] < bounds[cluster + 1]:
+                centroids[cluster] = sample[order[bounds[cluster]:bounds[cluster + 1]]].sum(axis=0)
+        centroids = normalize(centroids)
+    return centroids
+
+class _InvertedIndex:
+    """
+    Inverted-file ANN over the first `count` rows of a store.
+
+    Rows are clustered and copied into one contiguous matrix ordered by
+    cluster, so a query only scores the `nprobe` clusters nearest to it.
+    """
+
+    def __init__(self, matrix, nprobe=16, block_rows=16384):
+        self.count = len(matrix)
+        self.nprobe = nprobe
+        self.centroids = spherical_kmeans(matrix, max(1, int(np.sqrt(self.count))))
+        assignment = np.concatenate([
+            np.argmax(matrix[start:start + block_rows] @ self.centroids.T, axis=1)
+            for start in range(0, self.count, block_rows)
+        ])
+        self.order = np.argsort(assignment, kind="stable")
+        self.bounds = np.searchsorted(assignment[self.order], np.arange(len(self.centroids) + 1))
+        self.matrix = np.ascontiguousarray(matrix[self.order])
+
+    def search(self, query, k):
+        """Return (scores, row ids) of the best candidates for one normalized query."""
+        probes = np.argpartition(-(self.centroids @ query), min(self.nprobe, len(self.centroids)) - 1)[:self.nprobe]
+        scores = []
+        rows = []
+        for cluster in probes:
+            start, stop = self.bounds[cluster], self.bounds[cluster + 1]
+            if start < stop:
+                scores.append(self.matrix[start:stop] @ query)
+                rows.append(self.order[start:stop])
+        if not scores:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        scores = np.concatenate(scores)
+        rows = np.concatenate(rows)
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            scores, rows = scores[best], rows[best]
+        return scores, rows
+
+class VectorStore:
+    """
+    Append-only store of unit-length embeddings with their chunk texts.
+
+    Vectors live in a raw float32 file (<path>.vec) that is memory-mapped for
+    search, and chunk metadata in <path>.meta.jsonl, one line per vector.
+    Adding only appends to both files, and chunks whose content hash is
+    already stored are skipped, so re-indexing a grown log embeds only the new turns.
+
+    Small stores are searched brute force with one matrix product and
+    argpartition. Once a store reaches `ivf_min_vectors` an inverted-file
+    index is built, because scanning 100k x 768 floats alone takes ~20 ms;
+    probing the nearest clusters keeps a query in the low milliseconds.
+    Rows added after the index was built are scanned brute force until the
+    index is rebuilt.
+    """
+
+    def __init__(self, path, dim=None, ivf_min_vectors=20000, nprobe=16):
+        """
+        Args:
+            path (str): Path prefix of the store files.
+            dim (int): Vector size. Taken from the first added batch if omitted.
+            ivf_min_vectors (int): Store size from which the ANN index is used. None disables it.
+            nprobe (int): Clusters scanned per query by the ANN index.
+        """
+        self.path = path
+        self.dim = dim
+        self.ivf_min_vectors = ivf_min_vectors
+        self.nprobe = nprobe
+        self.texts = []
+        self.sources = []
+        self._hashes = set()
+        self._matrix = None
+        self._ivf = None
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def vec_path(self):
+        return self.path + ".vec"
+
+    @property
+    def meta_path(self):
+        return self.path + ".meta.jsonl"
+
+    def __len__(self):
+        return len(self.texts)
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            if os.path.exists(self.vec_path):
+                os.remove(self.vec_path)  # Vectors whose metadata was never written
+            return
+        entries = []
+        torn = False
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    torn = True  # Torn write at the end of the file
+                    break
+        if entries and self.dim is None:
+            self.dim = entries[0]["dim"]
+        row_bytes = 4 * (self.dim or 0)
+        # Vectors are written before their metadata, so after a crash either file can be ahead
+        stored = os.path.getsize(self.vec_path) // row_bytes if row_bytes and os.path.exists(self.vec_path) else 0
+        if stored < len(entries):
+            logging.warning(f"Vector store {self.path} is missing vectors, dropping {len(entries) - stored} chunks")
+            del entries[stored:]
+            torn = True
+        if torn:
+            with open(self.meta_path, "w", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        with open(self.vec_path, "ab") as f:
+            f.truncate(len(entries) * row_bytes)
+        for entry in entries:
+            self.texts.append(entry["text"])
+            self.sources.append(entry.get("source", ""))
+            self._hashes.add(entry["hash"])
+        self._remap()
+
+    def _remap(self):
+        if not self.texts:
+            self._matrix = None
+            return
+        self._matrix = np.memmap(self.vec_path, dtype=np.float32, mode="r", shape=(len(self.texts), self.dim))
+        if self.ivf_min_vectors is None or len(self.texts) < self.ivf_min_vectors:
+            return
+        # Rebuild once the brute-force tail outgrows a fifth of the indexed rows
+        if self._ivf is None or len(self.texts) - self._ivf.count > self._ivf.count // 5:
+            self._ivf = _InvertedIndex(self._matrix, self.nprobe)
+            logging.info(f"Built ANN index for {self.path}: {self._ivf.count} vectors, {len(self._ivf.centroids)} clusters")
+
+    def missing(self, texts):
+        """The texts, deduplicated, whose content is not stored yet."""
+        seen = set()
+        missing = []
+        for text in texts:
+            key = content_hash(text)
+            if key not in self._hashes and key not in seen:
+                seen.add(key)
+                missing.append(text)
+        return missing
+
+    def add(self, texts, vectors, source=""):
+        """Append chunks with their embeddings, skipping content that is already stored."""
+        vectors = normalize(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            rows = []
+            entries = []
+            for text, vector in zip(texts, vectors):
+                key = content_hash(text)
+                if key in self._hashes:
+                    continue
+                self._hashes.add(key)
+                rows.append(vector)
+                entries.append({"hash": key, "source": source, "dim": self.dim, "text": text})
+            if not rows:
+                return 0
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.vec_path, "ab") as f:
+                f.write(np.stack(rows).astype(np.float32).tobytes())
+            with open(self.meta_path, "a", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.texts.extend(entry["text"] for entry in entries)
+            self.sources.extend([source] * len(entries))
+            self._remap()
+            return len(entries)
+
+    def search(self, queries, k=3):
+        """
+        Batched top-k by cosine similarity.
+
+        Args:
+            queries (ndarray): (n, dim) query embeddings.
+            k (int): Results per query.
+        Returns:
+            list: For every query a list of (score, text, source), best first.
+        """
+        matrix, ivf = self._matrix, self._ivf
+        if matrix is None:
+            return [[] for _ in range(len(queries))]
+        queries = normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        if queries.shape[1] != self.dim:
+            raise ValueError(f"Query size {queries.shape[1]} does not match {self.path} vectors of size {self.dim}")
+        offset = ivf.count if ivf is not None else 0
+        tail = queries @ matrix[offset:].T
+        results = []
+        for row, query in enumerate(queries):
+            scores, rows = tail[row], np.arange(offset, len(matrix))
+            if ivf is not None:
+                ivf_scores, ivf_rows = ivf.search(query, k)
+                scores, rows = np.concatenate([ivf_scores, scores]), np.concatenate([ivf_rows, rows])
+            if len(scores) > k:
+                best = np.argpartition(-scores, k - 1)[:k]
+                scores, rows = scores[best], rows[best]
+            ranked = np.argsort(-scores)
+            results.append([(float(scores[i]), self.texts[rows[i]], self.sources[rows[i]]) for i in ranked])
+        return results
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def open_store(path):
+    """Return the process-wide VectorStore for a path, so sessions sharing a store never append concurrently."""
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = VectorStore(path)
+        return store
+
+def conversation_store_path(store_dir, conversation_id):
+    return os.path.join(store_dir, f"conversation_{conversation_id}")
+
+def remove_conversation_store(store_dir, conversation_id):
+    """Delete the embedded turns of a conversation, e.g. once it expired. Returns the number of files removed."""
+    removed = 0
+    base = conversation_store_path(store_dir, conversation_id)
+    for path in (base + ".vec", base + ".meta.jsonl"):
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+class LoreIndex:
+    """
+    Lore retrieval for one conversation: the character's full sheet plus the conversation's own turns.
+
+    The character store is shared by every conversation with that character;
+    the log store belongs to the conversation, so one user's chats never
+    surface in another user's prompt.
+    """
+
+    def __init__(self, character_name, conversation_id, embedder, store_dir, char_data_path=None,
+                 turns=None, top_k=3, min_score=0.3, chunk_chars=600):
+        """
+        Args:
+            turns (callable): Returns the conversation's stored turns as {"user_input", "answer"} records.
+        """
+        self.character_name = character_name
+        self.embedder = embedder
+        self.top_k = top_k
+        self.min_score = min_score
+        self.chunk_chars = chunk_chars
+        self.turns = turns
+        self.source = f"conversation {conversation_id}"
+        self.character_store = open_store(os.path.join(store_dir, f"character_{character_name}"))
+        # The session registry keeps one character per conversation, so the log store needs no sharing
+        self.log_store = VectorStore(conversation_store_path(store_dir, conversation_id))
+        if char_data_path and os.path.exists(char_data_path):
+            self._index(self.character_store, chunk_character_file(char_data_path, chunk_chars), char_data_path)
+
+    def _index(self, store, chunks, source):
+        missing = store.missing(chunks)
+        if not missing:
+            return 0
+        added = store.add(missing, self.embedder.embed(missing), source)
+        logging.info(f"Embedded {added} new lore chunks from {source}")
+        return added
+
+    def sync_log(self):
+        """Embed the stored turns of the conversation that are not indexed yet."""
+        if self.turns:
+            return self._index(self.log_store, chunk_turns(self.turns(), self.character_name, self.chunk_chars), self.source)
+        return 0
+
+    def add_turn(self, user_input, answer):
+        """Index one finished turn without re-reading the stored turns."""
+        turn = format_turn(user_input, answer, self.character_name)
+        chunks = [turn[i:i + self.chunk_chars] for i in range(0, len(turn), self.chunk_chars)]
+        return self._index(self.log_store, chunks, self.source)
+
+    def search(self, query, k=None):
+        """Best chunks for a query across both stores, as (score, text, source) tuples."""
+        k = k or self.top_k
+        vector = self.embedder.embed([query])
+        hits = []
+        for store in (self.character_store, self.log_store):
+            hits.extend(store.search(vector, k)[0])
+        hits.sort(key=lambda hit: hit[0], reverse=True)
+        return [hit for hit in hits[:k] if hit[0] >= self.min_score]
+
+    def search_text(self, query, k=None):
+        """Retrieved chunks joined for the prompt's context slot, or "" if nothing is relevant."""
+        return "\n---\n".join(text for _, text, _ in self.search(query, k))
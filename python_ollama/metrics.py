@@ -0,0 +1,287 @@
+import re
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager, nullcontext
+
+METRIC_NAME_INVALID = re.compile(r"[^a-zA-Z0-9_]")
+
+# Upper bounds in milliseconds (or tokens), roughly doubling, wide enough for multi-minute reasoning turns
+DEFAULT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000, 300000)
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, cumulative count) pairs ending with +Inf."""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def quantile(self, q):
+        """Approximate quantile: the upper bound of the bucket holding it."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+        return float("inf")
+
+class MetricsRegistry:
+    """
+    Process-wide histograms and counters, keyed by name plus labels.
+
+    Collectors are callables returning a (possibly nested) dict of numbers,
+    exported as gauges; the server registers the scheduler, session registry
+    and response cache stats this way.
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def register_collector(self, name, collector):
+        self._collectors[name] = collector
+
+    def _gauges(self):
+        gauges = []
+        for prefix, collector in self._collectors.items():
+            try:
+                values = collector()
+            except Exception as e:
+                logging.warning(f"Metrics collector {prefix} failed: {e}")
+                continue
+            stack = [(prefix, values)]
+            while stack:
+                name, value = stack.pop()
+                if isinstance(value, dict):
+                    stack.extend((f"{name}_{key}", inner) for key, inner in value.items())
+                elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                    gauges.append((METRIC_NAME_INVALID.sub("_", name), value))
+        return sorted(gauges)
+
+    def snapshot(self):
+        """Everything as a JSON-serializable dict, with approximate p50/p95/p99 per histogram."""
+        with self._lock:
+            histograms = [{
+                "name": name,
+                "labels": dict(labels),
+                "count": histogram.count,
+                "sum": histogram.sum,
+                "p50": histogram.quantile(0.5),
+                "p95": histogram.quantile(0.95),
+                "p99": histogram.quantile(0.99),
+            } for (name, labels), histogram in sorted(self._histograms.items())]
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self._counters.items())]
+        for histogram in histograms:
+            for q in ("p50", "p95", "p99"):
+                if histogram[q] == float("inf"):
+                    histogram[q] = None  # Beyond the last bucket; JSON has no infinity
+        return {"histograms": histograms, "counters": counters, "gauges": dict(self._gauges())}
+
+    def prometheus(self):
+        """Render everything in the Prometheus text exposition format."""
+        def render_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+        lines = []
+        typed = set()
+        with self._lock:
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                for bound, total in histogram.cumulative():
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{name}_bucket{render_labels(labels, [('le', le)])} {total}")
+                lines.append(f"{name}_sum{render_labels(labels)} {histogram.sum:g}")
+                lines.append(f"{name}_count{render_labels(labels)} {histogram.count}")
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{render_labels(labels)} {value:g}")
+        for name, value in self._gauges():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+class TurnTrace:
+    """Stage timings of one sampled turn, recorded into the `turn_stage_ms` histogram."""
+
+    sampled = True
+
+    def __init__(self, conversation_id=None):
+        self.conversation_id = conversation_id
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def record(self, stage, seconds):
+        milliseconds = seconds * 1000
+        self.stages[stage] = self.stages.get(stage, 0.0) + milliseconds
+        registry.observe("turn_stage_ms", milliseconds, stage=stage)
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def finish(self):
+        total = (time.perf_counter() - self.started) * 1000
+        registry.observe("turn_total_ms", total)
+        breakdown = " ".join(f"{stage}={ms:.1f}ms" for stage, ms in self.stages.items())
+        logging.info(f"Turn {self.conversation_id}: total={total:.1f}ms {breakdown}")
+
+class _NullTrace:
+    """Stand-in for unsampled turns; every method is a no-op."""
+
+    sampled = False
+
+    _span = nullcontext()
+
+    def record(self, stage, seconds):
+        pass
+
+    def span(self, stage):
+        return self._span
+
+    def finish(self):
+        pass
+
+NULL_TRACE = _NullTrace()
+
+# The trace of the turn being served by the current task; async generators and awaited calls see it too
+_current_trace = contextvars.ContextVar("current_trace", default=NULL_TRACE)
+
+_sample_rate = 1.0
+
+def configure(sample_rate=1.0):
+    """Set the fraction of turns that are traced. Ollama token stats are recorded for every turn."""
+    global _sample_rate
+    _sample_rate = sample_rate
+
+@contextmanager
+def trace_turn(conversation_id=None):
+    """Trace one turn if it is sampled, making the trace current for the duration of the block."""
+    trace = TurnTrace(conversation_id) if _sample_rate >= 1.0 or random.random() < _sample_rate else NULL_TRACE
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        trace.finish()
+
+def current_trace():
+    return _current_trace.get()
+
+def span(stage):
+    """Time a stage of the current turn; free when the turn is not sampled."""
+    return _current_trace.get().span(stage)
+
+def record_ollama_stats(stats, model=""):
+    """Record Ollama's per-call token counts and durations, as returned by prompt_cache_stats."""
+    registry.observe("ollama_prompt_eval_ms", stats["prompt_eval_ms"], model=model)
+    registry.observe("ollama_eval_ms", stats["eval_ms"], model=model)
+    registry.observe("ollama_prompt_eval_tokens", stats["prompt_eval_tokens"], model=model)
+    registry.observe("ollama_cached_tokens", stats["cached_tokens"], model=model)
+    registry.observe("ollama_eval_tokens", stats["eval_tokens"], model=model)
+    registry.inc("ollama_eval_tokens_total", stats["eval_tokens"], model=model)
+    registry.inc("ollama_prompt_eval_tokens_total", stats["prompt_eval_tokens"], model=model)
+
+class MetricsServer:
+    """
+    Tiny local HTTP endpoint: /metrics (Prometheus text), /metrics.json and /ready.
+
+    /ready answers 200 once `readiness()` reports "ready" and 503 until then, with
+    the readiness dict as JSON either way, for load balancers and startup scripts.
+    """
+
+    def __init__(self, host="127.0.0.1", port=9464, metrics=registry, readiness=None):
+        self.host = host
+        self.port = port
+        self.metrics = metrics
+        self.readiness = readiness
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        logging.info(f"Metrics endpoint on http://{self.host}:{self.port}/metrics")
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            path = parts[1] if len(parts) > 1 else "/"
+            if path == "/metrics":
+                status, content_type, body = "200 OK", "text/plain; version=0.0.4", self.metrics.prometheus()
+            elif path == "/metrics.json":
+                status, content_type, body = "200 OK", "application/json", json.dumps(self.metrics.snapshot())
+            elif path == "/ready":
+                state = self.readiness() if self.readiness is not None else {"ready": 1}
+                status = "200 OK" if state.get("ready") else "503 Service Unavailable"
+                content_type, body = "application/json", json.dumps(state)
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", "not found\n"
+            data = body.encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(data)}\r\n"
+                f"Connection: close\r\n\r\n".encode("latin-1") + data
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
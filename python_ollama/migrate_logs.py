@@ -0,0 +1,66 @@
+"""
+Import per-conversation chat logs (server_saves/<uuid>.log, sealed segments and memory snapshots) into the SQLite store.
+
+Conversations already in the database are skipped unless --replace is given, so the tool can be rerun.
+The logs are left in place; remove them once the server runs on the SQLite backend.
+
+Usage:
+    python migrate_logs.py [--save-dir server_saves] [--db server_saves/conversations.db] [--replace]
+"""
+import os
+import sys
+import time
+import argparse
+import logging
+
+from chat_log import iter_records, load_memory_snapshot
+from conversation_store import SQLiteStore, conversation_files
+
+def migrate(save_dir, db_path, replace=False):
+    """
+    Copy every conversation log in save_dir into the database.
+
+    Returns:
+        dict: Counts of migrated and skipped conversations and of imported turns.
+    """
+    store = SQLiteStore(db_path)
+    counts = {"conversations": 0, "skipped": 0, "turns": 0}
+    try:
+        for conversation_id, paths in sorted(conversation_files(save_dir).items()):
+            log_path = os.path.join(save_dir, f"{conversation_id}.log")
+            started = time.perf_counter()
+            memory = load_memory_snapshot(log_path)
+            turns = store.import_conversation(
+                conversation_id,
+                iter_records(log_path),
+                summary=memory["summary"],
+                chunks=memory["chunks"],
+                updated=max(os.path.getmtime(path) for path in paths),
+                replace=replace
+            )
+            if turns is None:
+                counts["skipped"] += 1
+                continue
+            counts["conversations"] += 1
+            counts["turns"] += turns
+            logging.info(f"Migrated {conversation_id}: {turns} turns in {(time.perf_counter() - started) * 1000:.1f}ms")
+    finally:
+        store.close()
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server_saves")
+    parser.add_argument("--save-dir", default=default_dir, help="Directory holding the .log files")
+    parser.add_argument("--db", help="SQLite database (default: conversations.db in the save directory)")
+    parser.add_argument("--replace", action="store_true", help="Re-import conversations already in the database")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
+    counts = migrate(args.save_dir, args.db or os.path.join(args.save_dir, "conversations.db"), args.replace)
+    print(f"Migrated {counts['conversations']} conversations ({counts['turns']} turns), "
+          f"skipped {counts['skipped']} already in the database")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
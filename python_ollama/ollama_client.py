@@ -0,0 +1,226 @@
+import json
+import asyncio
+import logging
+from typing import Any
+
+import aiohttp
+import requests
+from langchain_core.language_models.llms import LLM
+
+from ollama_pool import get_pool
+
+class OllamaError(Exception):
+    """Raised when the Ollama server rejects a request or reports an error mid-stream."""
+
+class BackendUnavailable(OllamaError):
+    """Raised when a backend cannot serve a request at all; the request is retried on another backend."""
+
+class OllamaClient:
+    """
+    Minimal client for Ollama's streaming /api/generate endpoint.
+
+    Unlike the LangChain wrapper it exposes the final stream chunk, which carries
+    prompt_eval_count, eval_count and the context tokens, and it sends
+    keep_alive so the model stays resident between turns.
+
+    A request with a `prefill` continues a reply instead of starting one. It
+    goes to /api/chat as the prompt in a user message followed by the prefill
+    in an assistant message. Ollama's templates leave a trailing assistant
+    message open, so the model extends it. The templated prompt is the same
+    as /api/generate builds, so the KV cache of the first request is reused.
+    Chat chunks are returned in the /api/generate shape, with the text in
+    "response".
+
+    Requests go through a BackendPool, which shares keep-alive connections
+    between every client of the process and picks the backend. A backend that
+    fails mid-stream is marked down and the completion resumes on another
+    one: the retry sends the text streamed so far as an assistant prefill,
+    which the next backend continues, so callers never see a token twice.
+    """
+
+    def __init__(self, base_url, model, keep_alive="30m", options=None, timeout=300, pool=None, conversation_id=None):
+        """
+        Args:
+            base_url (str): Ollama server URL, used when no pool is given.
+            model (str): Model name.
+            keep_alive (str): How long Ollama keeps the model loaded after a request.
+            options (dict): Default Ollama options (num_ctx, temperature, ...).
+            timeout (float): Request timeout in seconds.
+            pool (BackendPool): Backends to route to. Defaults to the shared pool of base_url.
+            conversation_id: Sticky routing key keeping the conversation on one backend.
+        """
+        self.pool = pool or get_pool([base_url], health_interval=0)
+        self.model = model
+        self.keep_alive = keep_alive
+        self.options = dict(options or {})
+        self.timeout = timeout
+        self.conversation_id = conversation_id
+
+    def _payload(self, prompt, options, prefill=""):
+        payload = {
+            "model": self.model,
+            "stream": True,
+            "keep_alive": self.keep_alive,
+        }
+        if prefill:
+            payload["messages"] = [{"role": "user", "content": prompt}, {"role": "assistant", "content": prefill}]
+        else:
+            payload["prompt"] = prompt
+        merged = dict(self.options)
+        merged.update(options)
+        if merged:
+            payload["options"] = merged
+        return payload
+
+    @staticmethod
+    def _endpoint(prefill):
+        return "/api/chat" if prefill else "/api/generate"
+
+    @staticmethod
+    def _decode(line):
+        chunk = json.loads(line)
+        if "error" in chunk:
+            raise OllamaError(chunk["error"])
+        if "message" in chunk:
+            chunk["response"] = chunk["message"].get("content", "")
+        return chunk
+
+    @staticmethod
+    def _resume_options(options, generated):
+        """Options for resuming after `generated` streamed tokens, with what is left of num_predict."""
+        if options.get("num_predict", -1) > 0:
+            options = dict(options, num_predict=max(1, options["num_predict"] - generated))
+        return options
+
+    def _acquire(self, failed, error):
+        if len(failed) >= len(self.pool.backends):
+            raise OllamaError(f"No Ollama backend could serve the request: {error}")
+        return self.pool.acquire(self.conversation_id, exclude=failed)
+
+    def stream_generate(self, prompt, prefill="", **options):
+        """
+        Stream a completion.
+
+        Args:
+            prompt (str): The prompt.
+            prefill (str): Start of the reply to continue, "" to start a new one.
+        Yields:
+            dict: Raw Ollama chunks. Text is in "response"; the last chunk has "done": True plus timing stats.
+        """
+        generated = []
+        failed = set()
+        error = None
+        while True:
+            backend = self._acquire(failed, error)
+            resumed = prefill + ''.join(generated)
+            url = f"{backend.url}{self._endpoint(resumed)}"
+            payload = self._payload(prompt, self._resume_options(options, len(generated)), resumed)
+            try:
+                with self.pool.session.post(url, json=payload, stream=True, timeout=self.timeout) as response:
+                    if response.status_code >= 500:
+                        raise BackendUnavailable(f"{response.status_code}: {response.text}")
+                    if response.status_code >= 400:
+                        raise OllamaError(f"{response.status_code}: {response.text}")
+                    for line in response.iter_lines():
+                        if line:
+                            chunk = self._decode(line)
+                            generated.append(chunk.get("response", ""))
+                            yield chunk
+                return
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError, BackendUnavailable) as e:
+                error = e
+                failed.add(backend)
+                self.pool.mark_failed(backend, e)
+            finally:
+                self.pool.release(backend)
+
+    async def astream_generate(self, prompt, prefill="", **options):
+        """Asynchronous variant of stream_generate."""
+        generated = []
+        failed = set()
+        error = None
+        while True:
+            backend = self._acquire(failed, error)
+            resumed = prefill + ''.join(generated)
+            url = f"{backend.url}{self._endpoint(resumed)}"
+            payload = self._payload(prompt, self._resume_options(options, len(generated)), resumed)
+            try:
+                session = self.pool.async_session()
+                async with session.post(url, json=payload, timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
+                    if response.status >= 500:
+                        raise BackendUnavailable(f"{response.status}: {await response.text()}")
+                    if response.status >= 400:
+                        raise OllamaError(f"{response.status}: {await response.text()}")
+                    async for line in response.content:
+                        line = line.strip()
+                        if line:
+                            chunk = self._decode(line)
+                            generated.append(chunk.get("response", ""))
+                            yield chunk
+                return
+            except (aiohttp.ClientError, asyncio.TimeoutError, BackendUnavailable) as e:
+                error = e
+                failed.add(backend)
+                self.pool.mark_failed(backend, e)
+            finally:
+                self.pool.release(backend)
+
+    def generate(self, prompt, stop=None, **options):
+        """Complete a prompt without streaming to the caller. Returns the text."""
+        if stop:
+            options["stop"] = list(stop)
+        return ''.join(chunk.get("response", "") for chunk in self.stream_generate(prompt, **options))
+
+    async def agenerate(self, prompt, stop=None, **options):
+        """Asynchronous variant of generate."""
+        if stop:
+            options["stop"] = list(stop)
+        return ''.join([chunk.get("response", "") async for chunk in self.astream_generate(prompt, **options)])
+
+    async def aclose(self):
+        await self.pool.aclose()
+
+class PooledOllamaLLM(LLM):
+    """LangChain LLM over an OllamaClient, so summaries and tool routing share the pooled backends too."""
+
+    client: Any
+
+    @property
+    def _llm_type(self):
+        return "pooled_ollama"
+
+    @property
+    def _identifying_params(self):
+        return {"model": self.client.model, "backends": self.client.pool.urls}
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        return self.client.generate(prompt, stop=stop, **kwargs)
+
+    async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        return await self.client.agenerate(prompt, stop=stop, **kwargs)
+
+def prompt_cache_stats(final_chunk):
+    """
+    Summarize how much of a prompt Ollama evaluated versus reused from its KV cache.
+
+    Ollama only reports prompt_eval_count for tokens it actually evaluated. The
+    returned context holds prompt + completion tokens, so the cached part is
+    what remains after subtracting both.
+    """
+    evaluated = final_chunk.get("prompt_eval_count", 0)
+    generated = final_chunk.get("eval_count", 0)
+    context = final_chunk.get("context")
+    prompt_tokens = len(context) - generated if context else evaluated
+    stats = {
+        "prompt_tokens": prompt_tokens,
+        "prompt_eval_tokens": evaluated,
+        "cached_tokens": max(0, prompt_tokens - evaluated),
+        "eval_tokens": generated,
+        "prompt_eval_ms": final_chunk.get("prompt_eval_duration", 0) / 1e6,
+        "eval_ms": final_chunk.get("eval_duration", 0) / 1e6,
+    }
+    logging.info(
+        f"Prompt eval: {stats['prompt_eval_tokens']} evaluated / {stats['cached_tokens']} cached "
+        f"of {stats['prompt_tokens']} tokens, {stats['eval_tokens']} generated"
+    )
+    return stats
@@ -0,0 +1,217 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+class Backend:
+    """One Ollama host and the counters the pool routes by."""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_check = 0.0
+
+    def stats(self):
+        return {
+            "healthy": int(self.healthy),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+class BackendPool:
+    """
+    Process-wide set of Ollama backends behind shared keep-alive HTTP sessions.
+
+    A conversation sticks to the backend that served it last, so its prompt
+    prefix stays in that backend's KV cache. New conversations, and
+    conversations whose backend went down, go to the healthy backend with
+    the fewest requests in flight. A backend that fails a request is marked
+    down until a periodic health check sees it answer again.
+    """
+
+    def __init__(self, urls, health_interval=10.0, health_timeout=2.0, max_sticky=10000, connections_per_backend=32):
+        """
+        Args:
+            urls (list): Ollama base URLs.
+            health_interval (float): Seconds between health checks, 0 to disable them.
+            health_timeout (float): Timeout of one health check request.
+            max_sticky (int): Conversations whose backend assignment is remembered.
+            connections_per_backend (int): Keep-alive connections pooled per backend.
+        """
+        if not urls:
+            raise ValueError("BackendPool needs at least one backend URL")
+        self.backends = [Backend(url) for url in urls]
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.max_sticky = max_sticky
+        self.connections_per_backend = connections_per_backend
+        self.failovers = 0
+        self._sticky = OrderedDict()
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.backends), pool_maxsize=connections_per_backend)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._async_sessions = {}
+        self._stopped = threading.Event()
+        self._health_thread = None
+        if health_interval > 0:
+            self._health_thread = threading.Thread(target=self._health_loop, name="ollama-health", daemon=True)
+            self._health_thread.start()
+
+    @property
+    def urls(self):
+        return [backend.url for backend in self.backends]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "failovers": self.failovers,
+                "sticky": len(self._sticky),
+                "backends": {backend.url: backend.stats() for backend in self.backends},
+            }
+
+    def acquire(self, conversation_id=None, exclude=()):
+        """
+        Pick a backend for one request and count it as in flight until `release`.
+
+        Args:
+            conversation_id: Sticky routing key, or None for requests with no cache to keep warm.
+            exclude (set): Backends that already failed this request.
+        """
+        with self._lock:
+            candidates = [backend for backend in self.backends if backend not in exclude]
+            if not candidates:
+                raise ConnectionError("Every Ollama backend failed this request")
+            backend = None
+            if conversation_id is not None:
+                sticky = self._sticky.get(conversation_id)
+                if sticky is not None and sticky.healthy and sticky in candidates:
+                    backend = sticky
+                    self._sticky.move_to_end(conversation_id)
+            if backend is None:
+                # Down backends are only tried once nothing healthy is left
+                healthy = [candidate for candidate in candidates if candidate.healthy] or candidates
+                fewest = min(candidate.outstanding for candidate in healthy)
+                backend = random.choice([candidate for candidate in healthy if candidate.outstanding == fewest])
+                if conversation_id is not None:
+                    self._sticky[conversation_id] = backend
+                    self._sticky.move_to_end(conversation_id)
+                    while len(self._sticky) > self.max_sticky:
+                        self._sticky.popitem(last=False)
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def release(self, backend):
+        with self._lock:
+            backend.outstanding -= 1
+
+    def mark_failed(self, backend, error):
+        """Take a backend out of rotation until a health check succeeds; its conversations move on their next request."""
+        with self._lock:
+            backend.failures += 1
+            backend.last_error = str(error)
+            self.failovers += 1
+            if backend.healthy:
+                backend.healthy = False
+                logging.warning(f"Ollama backend {backend.url} marked down: {error}")
+
+    def check(self, backend):
+        """Probe one backend and update its health."""
+        try:
+            response = self.session.get(f"{backend.url}/api/version", timeout=self.health_timeout)
+            healthy = response.status_code < 500
+            error = None if healthy else f"HTTP {response.status_code}"
+        except requests.RequestException as e:
+            healthy, error = False, e
+        backend.last_check = time.time()
+        with self._lock:
+            if healthy and not backend.healthy:
+                logging.info(f"Ollama backend {backend.url} is back up")
+            elif not healthy and backend.healthy:
+                logging.warning(f"Ollama backend {backend.url} failed its health check: {error}")
+            backend.healthy = healthy
+            if error is not None:
+                backend.last_error = str(error)
+        return healthy
+
+    def warm_up(self, model, keep_alive="30m", options=None, embed=False, timeout=600):
+        """
+        Load a model on every backend without generating, so the first real request skips the cold load.
+
+        Ollama loads the model for an empty prompt (or empty embedding input) and keeps it resident for
+        keep_alive. Pass the num_ctx real requests use, or Ollama reloads the model for them.
+
+        Returns:
+            dict: Backend URL -> True if the model loaded there.
+        """
+        path = "/api/embed" if embed else "/api/generate"
+        payload = {"model": model, "keep_alive": keep_alive}
+        if embed:
+            payload["input"] = ""
+        else:
+            payload.update(prompt="", stream=False, options=options or {})
+        loaded = {}
+        for backend in self.backends:
+            started = time.perf_counter()
+            try:
+                response = self.session.post(f"{backend.url}{path}", json=payload, timeout=timeout)
+                response.raise_for_status()
+                loaded[backend.url] = True
+                logging.info(f"Loaded {model} on {backend.url} in {time.perf_counter() - started:.2f}s")
+            except requests.RequestException as e:
+                loaded[backend.url] = False
+                logging.warning(f"Could not load {model} on {backend.url}: {e}")
+        return loaded
+
+    def _health_loop(self):
+        while not self._stopped.wait(self.health_interval):
+            for backend in self.backends:
+                self.check(backend)
+
+    def async_session(self):
+        """Shared aiohttp session of the running event loop."""
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(loop)
+        if session is None or session.closed:
+            # The final chunk carries the whole context token list, which can exceed aiohttp's 64 KB line limit
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.connections_per_backend),
+                read_bufsize=4 * 1024 * 1024
+            )
+            self._async_sessions[loop] = session
+        return session
+
+    async def aclose(self):
+        """Close the aiohttp session of the running event loop."""
+        session = self._async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
+
+    def close(self):
+        self._stopped.set()
+        self.session.close()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(urls, **settings):
+    """Return the process-wide pool for a list of backend URLs, creating it on first use."""
+    key = tuple(url.rstrip("/") for url in urls)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = BackendPool(list(key), **settings)
+        return pool
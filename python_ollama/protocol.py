@@ -0,0 +1,223 @@
+import asyncio
+import json
+import struct
+
+try:
+    import ormsgpack
+except ImportError:
+    ormsgpack = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Every frame is a little-endian uint32 body size followed by a UTF-8 JSON body.
+# After a negotiated handshake the body may be MessagePack instead, and the top
+# bit of the size marks a zstd-compressed body. Legacy frames never set it.
+FRAME_HEADER = struct.Struct('<I')
+FRAME_COMPRESSED = 0x80000000
+FRAME_SIZE_MASK = 0x7FFFFFFF
+
+# Frame types used by streaming responses. Legacy (non-streaming) responses
+# carry no "type" field at all so existing clients keep working unchanged.
+FRAME_CHUNK = "chunk"
+FRAME_FINAL = "final"
+
+# Frame types of multiplexed requests, which carry a client-chosen "request_id"
+# echoed on every frame of their response. Responses may interleave.
+FRAME_CANCEL = "cancel"
+FRAME_CANCELLED = "cancelled"
+FRAME_ERROR = "error"
+
+# Upper bound on a single request body so a corrupt header cannot make the server allocate gigabytes
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+# Bodies at least this large are compressed when zstd was negotiated
+COMPRESSION_THRESHOLD = 1024
+
+class FrameTooLarge(Exception):
+    """Raised when a peer announces a frame bigger than the configured limit."""
+
+class FrameCodec:
+    """
+    Body encoding of one connection: "json" or "msgpack", optionally with zstd compression.
+
+    The default codec is plain JSON without compression, i.e. the legacy protocol.
+    """
+
+    def __init__(self, codec="json", compression=None, threshold=COMPRESSION_THRESHOLD, max_size=MAX_FRAME_SIZE):
+        self.codec = codec
+        self.compression = compression
+        self.threshold = threshold
+        self.max_size = max_size
+        self._compressor = zstandard.ZstdCompressor(level=3) if compression == "zstd" else None
+        self._decompressor = zstandard.ZstdDecompressor() if compression == "zstd" else None
+
+    def dumps(self, message):
+        if self.codec == "msgpack":
+            return ormsgpack.packb(message) if ormsgpack is not None else msgpack.packb(message, use_bin_type=True)
+        return json.dumps(message, ensure_ascii=False).encode('utf-8')
+
+    def loads(self, data):
+        if self.codec == "msgpack":
+            return ormsgpack.unpackb(data) if ormsgpack is not None else msgpack.unpackb(data, raw=False)
+        return json.loads(data.decode('utf-8') if not isinstance(data, str) else data)
+
+    def encode(self, message):
+        """Serialize a message dict into a length-prefixed frame."""
+        data = self.dumps(message)
+        if self._compressor is not None and len(data) >= self.threshold:
+            compressed = self._compressor.compress(data)
+            if len(compressed) < len(data):
+                return FRAME_HEADER.pack(len(compressed) | FRAME_COMPRESSED) + compressed
+        return FRAME_HEADER.pack(len(data)) + data
+
+    def parse_header(self, raw_header):
+        """Return (body size, compressed) for a frame header, enforcing the size limit."""
+        value = FRAME_HEADER.unpack(raw_header)[0]
+        compressed = bool(value & FRAME_COMPRESSED) and self._decompressor is not None
+        size = value & FRAME_SIZE_MASK if compressed else value
+        if size > self.max_size:
+            raise FrameTooLarge(f"Frame of {size} bytes exceeds limit of {self.max_size} bytes")
+        return size, compressed
+
+    def decode(self, body, compressed):
+        if compressed:
+            # The compressor records the content size; check it before allocating for it
+            content_size = zstandard.frame_content_size(body)
+            if content_size < 0 or content_size > self.max_size:
+                raise FrameTooLarge(f"Compressed frame expands beyond limit of {self.max_size} bytes")
+            body = self._decompressor.decompress(body)
+        return self.loads(body)
+
+JSON_CODEC = FrameCodec()
+
+def available_codecs():
+    """Codecs this installation can speak, best first."""
+    return (["msgpack"] if ormsgpack is not None or msgpack is not None else []) + ["json"]
+
+def available_compression():
+    return ["zstd"] if zstandard is not None else []
+
+def negotiate(request):
+    """
+    Pick the codec and compression for a connection from a handshake request.
+
+    Clients advertise "codecs" and "compression" lists in order of preference.
+    Requests without them are legacy clients and get plain JSON.
+
+    Returns:
+        FrameCodec: The codec to use after the handshake reply.
+    """
+    codecs = [codec for codec in request.get("codecs", []) if codec in available_codecs()]
+    compression = [name for name in request.get("compression", []) if name in available_compression()]
+    return FrameCodec(codecs[0] if codecs else "json", compression[0] if compression else None)
+
+def handshake_fields(codec):
+    """Fields announcing the negotiated codec in a handshake reply."""
+    return {"codec": codec.codec, "compression": codec.compression}
+
+def encode_frame(message, codec=JSON_CODEC):
+    """Serialize a message dict into a length-prefixed frame."""
+    return codec.encode(message)
+
+def send_frame(sock, message, codec=JSON_CODEC):
+    """Send a single message dict over a blocking socket."""
+    sock.sendall(codec.encode(message))
+
+def recv_exact(sock, size, buffer=None):
+    """
+    Read exactly `size` bytes from the socket into a preallocated buffer.
+
+    Returns:
+        memoryview or None: The bytes read, or None if the peer closed the connection first.
+    """
+    if buffer is None or len(buffer) < size:
+        buffer = bytearray(size)
+    view = memoryview(buffer)[:size]
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if not count:
+            return None
+        received += count
+    return view
+
+class FrameReader:
+    """Receive frames from a blocking socket, reusing one growing buffer for the bodies."""
+
+    def __init__(self, sock, codec=JSON_CODEC, initial_size=64 * 1024):
+        self.sock = sock
+        self.codec = codec
+        self._header = bytearray(FRAME_HEADER.size)
+        self._buffer = bytearray(initial_size)
+
+    def recv(self):
+        """
+        Returns:
+            dict or None: The decoded message, or None if the connection was closed.
+        """
+        header = recv_exact(self.sock, FRAME_HEADER.size, self._header)
+        if header is None:
+            return None
+        size, compressed = self.codec.parse_header(header)
+        if size > len(self._buffer):
+            self._buffer = bytearray(max(size, 2 * len(self._buffer)))
+        body = recv_exact(self.sock, size, self._buffer)
+        if body is None:
+            return None
+        # Decompression and JSON need bytes; msgpack reads the view directly
+        return self.codec.decode(body if self.codec.codec == "msgpack" and not compressed else bytes(body), compressed)
+
+def recv_frame(sock, codec=JSON_CODEC):
+    """
+    Receive a single message dict from a blocking socket.
+
+    Returns:
+        dict or None: The decoded message, or None if the connection was closed.
+    """
+    return FrameReader(sock, codec, initial_size=0).recv()
+
+async def read_frame(reader, max_size=MAX_FRAME_SIZE, codec=None):
+    """
+    Receive a single message dict from an asyncio stream.
+
+    Returns:
+        dict or None: The decoded message, or None if the connection was closed.
+    """
+    if codec is None:
+        codec = JSON_CODEC if max_size == MAX_FRAME_SIZE else FrameCodec(max_size=max_size)
+    try:
+        raw_size = await reader.readexactly(FRAME_HEADER.size)
+        size, compressed = codec.parse_header(raw_size)
+        data = await reader.readexactly(size)
+    except asyncio.IncompleteReadError:
+        return None
+    return codec.decode(data, compressed)
+
+async def write_frame(writer, message, codec=JSON_CODEC):
+    """Send a single message dict over an asyncio stream, waiting for the transport to drain."""
+    writer.write(codec.encode(message))
+    await writer.drain()
+
+def chunk_frame(channel, text):
+    """Build a partial-response frame for the given channel ("answer" or "thinking")."""
+    return {"type": FRAME_CHUNK, "channel": channel, "text": text}
+
+def final_frame(parsed_response):
+    """Build the closing frame of a streamed response carrying the fully parsed reply."""
+    frame = {"type": FRAME_FINAL}
+    frame.update(parsed_response)
+    return frame
+
+def cancelled_frame(request_id):
+    """Build the frame confirming that a multiplexed request was cancelled."""
+    return {"type": FRAME_CANCELLED, "request_id": request_id}
+
+def error_frame(request_id, message):
+    """Build the frame reporting that a multiplexed request failed; the connection stays open."""
+    return {"type": FRAME_ERROR, "request_id": request_id, "error": message}
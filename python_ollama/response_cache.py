@@ -0,0 +1,209 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+import numpy as np
+
+WHITESPACE = re.compile(r"\s+")
+
+def normalize_text(text):
+    return WHITESPACE.sub(" ", text).strip().lower()
+
+def _digest(*parts):
+    hasher = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        hasher.update(part.encode("utf-8"))
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+class _Entry:
+    __slots__ = ("key", "scope", "character", "user_input", "vector", "response", "created")
+
+    def __init__(self, key, scope, character, user_input, vector, response, created):
+        self.key = key
+        self.scope = scope
+        self.character = character
+        self.user_input = user_input
+        self.vector = vector
+        self.response = response
+        self.created = created
+
+class ResponseCache:
+    """
+    Opt-in cache of raw model outputs in front of generation.
+
+    The exact layer is keyed by character, model, sampling options and the
+    whole normalized prompt, so it only hits when nothing but whitespace or
+    case differs. The semantic layer matches the embedding of the user input
+    against earlier inputs in the same scope: the same character, model,
+    options, turn context and last `history_turns` turns. Openers such as
+    "hi" or "who are you?" hit here across conversations.
+
+    Entries are evicted least-recently-used beyond `max_entries` and expire
+    after `ttl` seconds. Callers replay the cached output through the normal
+    parse-and-log path, so a hit updates session state just like a generation.
+    """
+
+    def __init__(self, embedder=None, max_entries=2048, ttl=86400, semantic_threshold=0.95, history_turns=1,
+                 persist_path=None):
+        """
+        Args:
+            embedder: Object with embed(texts) -> vectors. None disables the semantic layer.
+            max_entries (int): Maximum cached responses.
+            ttl (float): Seconds a response stays valid.
+            semantic_threshold (float): Minimum cosine similarity for a semantic hit.
+            history_turns (int): Recent turns that must match for a semantic hit.
+            persist_path (str): JSON file the cache is loaded from and saved to. None keeps it in memory.
+        """
+        self.embedder = embedder
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self.history_turns = history_turns
+        self.persist_path = persist_path
+        self._entries = OrderedDict()  # exact key -> _Entry
+        self._scopes = defaultdict(OrderedDict)  # scope -> exact key -> _Entry, for semantic lookups
+        self._metrics = defaultdict(lambda: {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0})
+        self._lock = threading.Lock()
+
+    def exact_key(self, character, model, options, prompt):
+        return _digest(character, model, json.dumps(options, sort_keys=True), normalize_text(prompt))
+
+    def scope(self, character, model, options, context, history_messages):
+        """Semantic scope: everything besides the user input that shapes the answer."""
+        recent = history_messages[-2 * self.history_turns:] if self.history_turns else []
+        fingerprint = "\n".join(normalize_text(message) for message in recent)
+        return _digest(character, model, json.dumps(options, sort_keys=True), normalize_text(context), fingerprint)
+
+    def embed(self, user_input):
+        """Unit-length embedding of a user input, or None without an embedder."""
+        if self.embedder is None:
+            return None
+        vector = np.asarray(self.embedder.embed([normalize_text(user_input)])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry.created > self.ttl
+
+    def _drop(self, entry):
+        self._entries.pop(entry.key, None)
+        scope = self._scopes.get(entry.scope)
+        if scope is not None:
+            scope.pop(entry.key, None)
+            if not scope:
+                del self._scopes[entry.scope]
+
+    def lookup(self, character, key, scope=None, vector=None):
+        """
+        Return a cached raw response or None.
+
+        Args:
+            character (str): Character name, for metrics.
+            key (str): Exact key from exact_key.
+            scope (str): Semantic scope from scope. None skips the semantic layer.
+            vector (ndarray): Input embedding from embed. None skips the semantic layer.
+        """
+        now = time.time()
+        with self._lock:
+            metrics = self._metrics[character]
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                self._drop(entry)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                metrics["exact_hits"] += 1
+                return entry.response
+            if scope is not None and vector is not None:
+                best, best_score = None, self.semantic_threshold
+                for candidate in list(self._scopes.get(scope, {}).values()):
+                    if self._expired(candidate, now):
+                        self._drop(candidate)
+                        continue
+                    if candidate.vector is None or len(candidate.vector) != len(vector):
+                        continue
+                    score = float(candidate.vector @ vector)
+                    if score >= best_score:
+                        best, best_score = candidate, score
+                if best is not None:
+                    self._entries.move_to_end(best.key)
+                    metrics["semantic_hits"] += 1
+                    logging.info(f"Semantic cache hit for {character} ({best_score:.3f}): {best.user_input!r}")
+                    return best.response
+            metrics["misses"] += 1
+            return None
+
+    def _insert(self, entry):
+        old = self._entries.get(entry.key)
+        if old is not None:
+            self._drop(old)
+        self._entries[entry.key] = entry
+        if entry.scope is not None and entry.vector is not None:
+            self._scopes[entry.scope][entry.key] = entry
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries.values())))
+
+    def store(self, character, key, response, user_input="", scope=None, vector=None, created=None):
+        """Cache a raw response under its exact key and, with scope and vector, for semantic lookups."""
+        entry = _Entry(key, scope, character, user_input, vector, response, created or time.time())
+        with self._lock:
+            self._insert(entry)
+            self._metrics[character]["stores"] += 1
+
+    def stats(self):
+        """Per-character hit/miss counters plus the number of cached responses."""
+        with self._lock:
+            return {"entries": len(self._entries), "characters": {name: dict(m) for name, m in self._metrics.items()}}
+
+    def load(self):
+        """Restore persisted entries that have not expired yet."""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return 0
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+        except Exception as e:
+            logging.warning(f"Failed to load response cache: {e}")
+            return 0
+        now = time.time()
+        loaded = 0
+        for record in records:
+            if self.ttl is not None and now - record["created"] > self.ttl:
+                continue
+            vector = np.asarray(record["vector"], dtype=np.float32) if record.get("vector") else None
+            entry = _Entry(record["key"], record.get("scope"), record["character"], record.get("user_input", ""),
+                           vector, record["response"], record["created"])
+            # Restored entries are not new stores, so they stay out of the metrics
+            with self._lock:
+                self._insert(entry)
+            loaded += 1
+        logging.info(f"Loaded {loaded} cached responses from {self.persist_path}")
+        return loaded
+
+    def save(self):
+        """Atomically write all entries to persist_path."""
+        if not self.persist_path:
+            return
+        with self._lock:
+            records = [{
+                "key": entry.key,
+                "scope": entry.scope,
+                "character": entry.character,
+                "user_input": entry.user_input,
+                "vector": entry.vector.tolist() if entry.vector is not None else None,
+                "response": entry.response,
+                "created": entry.created,
+            } for entry in self._entries.values()]
+        try:
+            os.makedirs(os.path.dirname(self.persist_path) or ".", exist_ok=True)
+            tmp_path = self.persist_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(records, f, ensure_ascii=False)
+            os.replace(tmp_path, self.persist_path)
+        except Exception as e:
+            logging.warning(f"Failed to save response cache: {e}")
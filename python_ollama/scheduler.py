@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+# Lower value wins: a user waiting for an answer always goes before tool routing,
+# and both go before summaries nobody is waiting for.
+INTERACTIVE = 0
+TOOL = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", TOOL: "tool", BACKGROUND: "background"}
+
+class GenerationScheduler:
+    """
+    Central admission control for LLM calls.
+
+    At most `workers` generations run at once, which should match Ollama's
+    OLLAMA_NUM_PARALLEL so requests queue here instead of thrashing VRAM.
+    Waiting calls are served by priority and, within a priority, round-robin
+    across conversations so one chatty client cannot starve the others.
+    Cancelling a waiting or running call (e.g. because the client
+    disconnected) frees its place immediately.
+    """
+
+    def __init__(self, workers=None):
+        """
+        Args:
+            workers (int): Maximum concurrent generations. None disables scheduling entirely.
+        """
+        self.workers = workers
+        self.active = 0
+        self._loop = None
+        # priority -> conversation_id -> deque of (future, enqueued_at)
+        self._queues = {priority: OrderedDict() for priority in PRIORITY_NAMES}
+        self._waits = {priority: {"count": 0, "total": 0.0, "max": 0.0} for priority in PRIORITY_NAMES}
+        self.cancelled = 0
+
+    def start(self):
+        """Bind to the running event loop so other threads can use blocking_slot."""
+        self._loop = asyncio.get_running_loop()
+
+    def stats(self):
+        """Queue depth and wait-time counters per priority."""
+        stats = {"workers": self.workers, "active": self.active, "cancelled": self.cancelled}
+        for priority, name in PRIORITY_NAMES.items():
+            waits = self._waits[priority]
+            stats[name] = {
+                "queued": sum(len(waiters) for waiters in self._queues[priority].values()),
+                "admitted": waits["count"],
+                "avg_wait_ms": 1000 * waits["total"] / waits["count"] if waits["count"] else 0.0,
+                "max_wait_ms": 1000 * waits["max"],
+            }
+        return stats
+
+    def _record_wait(self, priority, enqueued_at):
+        waited = time.monotonic() - enqueued_at
+        waits = self._waits[priority]
+        waits["count"] += 1
+        waits["total"] += waited
+        waits["max"] = max(waits["max"], waited)
+
+    def _has_waiters(self):
+        return any(self._queues.values())
+
+    def _next_waiter(self):
+        for priority, conversations in self._queues.items():
+            while conversations:
+                conversation_id, waiters = next(iter(conversations.items()))
+                future, enqueued_at = waiters.popleft()
+                if waiters:
+                    conversations.move_to_end(conversation_id)  # Round-robin to the next conversation
+                else:
+                    del conversations[conversation_id]
+                if not future.done():
+                    return priority, future, enqueued_at
+        return None
+
+    def _dispatch(self):
+        while self.active < self.workers:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            priority, future, enqueued_at = waiter
+            self.active += 1
+            self._record_wait(priority, enqueued_at)
+            future.set_result(None)
+
+    def _release(self):
+        self.active -= 1
+        self._dispatch()
+
+    def _remove(self, priority, conversation_id, future):
+        waiters = self._queues[priority].get(conversation_id)
+        if not waiters:
+            return
+        for entry in waiters:
+            if entry[0] is future:
+                waiters.remove(entry)
+                break
+        if not waiters:
+            del self._queues[priority][conversation_id]
+
+    async def _acquire(self, priority, conversation_id):
+        if self.active < self.workers and not self._has_waiters():
+            self.active += 1
+            self._record_wait(priority, time.monotonic())
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._queues[priority].setdefault(conversation_id, deque()).append((future, time.monotonic()))
+        try:
+            await future
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            if future.done() and not future.cancelled():
+                self._release()  # The slot was granted just as we were cancelled
+            else:
+                self._remove(priority, conversation_id, future)
+            raise
+
+    @asynccontextmanager
+    async def slot(self, priority, conversation_id):
+        """Hold one generation slot for the duration of the block."""
+        if self.workers is None:
+            yield
+            return
+        await self._acquire(priority, str(conversation_id))
+        try:
+            yield
+        except asyncio.CancelledError:
+            logging.info(f"Cancelled {PRIORITY_NAMES[priority]} generation for {conversation_id}")
+            raise
+        finally:
+            self._release()
+
+    @contextmanager
+    def blocking_slot(self, priority, conversation_id):
+        """Hold a generation slot from a worker thread, e.g. for background summarization."""
+        if self.workers is None or self._loop is None:
+            yield
+            return
+        asyncio.run_coroutine_threadsafe(self._acquire(priority, str(conversation_id)), self._loop).result()
+        try:
+            yield
+        finally:
+            self._loop.call_soon_threadsafe(self._release)
@@ -1,14 +1,21 @@
-import socket
-import threading
+import asyncio
 import json
-import struct
 import os
-import uuid
 import logging
 import signal
-from ollama_char import OllamaCharacter
-
-server_stop = False
+import time
+import threading
+# Only light modules are imported up front so the socket opens at once; LangChain, numpy and
+# the HTTP clients load on first use or in the background warm-up
+from session_registry import SessionRegistry
+from scheduler import GenerationScheduler
+from generation import GenerationSettings
+from conversation_store import configure_store, get_store
+from metrics import MetricsServer, registry, trace_turn, configure as configure_metrics
+from protocol import (
+    read_frame, write_frame, chunk_frame, final_frame, cancelled_frame, error_frame, FrameTooLarge,
+    FRAME_CANCEL, JSON_CODEC, negotiate, handshake_fields
+)
 
 # Load settings
 with open(os.path.join(os.path.dirname(__file__), '../config/settings.json'), 'r', encoding='utf-8') as f:
@@ -18,103 +25,510 @@ HOST = config.get("HOST", "127.0.0.1")
 PORT = config.get("PORT", 55555)
 MODEL_NAME = config.get("model_name", "deepseek-r1-14b-q4")
 BASE_URL = config.get("base_url", "http://localhost:11434")
+KEEP_ALIVE = config.get("keep_alive", "30m")
+# Several Ollama hosts to balance across; base_url alone when empty
+BACKENDS = config.get("backends", [])
+BACKEND_POOL_SETTINGS = config.get("backend_pool", {})
+OLLAMA_NUM_PARALLEL = config.get("ollama_num_parallel", 4)
+CLIENT_READ_TIMEOUT = config.get("client_read_timeout", 300)
+SHUTDOWN_GRACE = config.get("shutdown_grace", 30)
+MAX_INFLIGHT_REQUESTS = config.get("max_inflight_requests", 8)
+SESSION_MAX = config.get("session_max", 256)
+SESSION_IDLE_TTL = config.get("session_idle_ttl", 1800)
+SESSION_MAX_BYTES = config.get("session_max_bytes", 268435456)
+CHAT_LOG_SETTINGS = config.get("chat_log", {})
+STORAGE_SETTINGS = config.get("storage", {})
+RESPONSE_CACHE_SETTINGS = config.get("response_cache", {})
+METRICS_SETTINGS = config.get("metrics", {})
+LORE_SETTINGS = config.get("lore", {})
+STARTUP_SETTINGS = config.get("startup", {})
+# Conversation database (or chat logs), lore stores and the response cache
+SAVE_DIR = config.get("save_dir") or os.path.join(os.path.dirname(__file__), "server_saves")
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
 
-# Store all generated UUIDs
-uuids = set()
+async def generate_unique_uid():
+    """A new conversation_id, checked against and recorded in the conversation store off the event loop."""
+    return await asyncio.to_thread(get_store(SAVE_DIR).create_conversation)
 
-def generate_unique_uid():
-    while True:
-        new_uid = str(uuid.uuid4())
-        if new_uid not in uuids:
-            uuids.add(new_uid)
-            return new_uid
+def wants_new_conversation(request):
+    """True if a handshake asks for a new conversation: conversation_id missing, empty, 0 or "0"."""
+    conversation_id = request.get('conversation_id')
+    return conversation_id is None or str(conversation_id).strip() in ("", "0")
 
-def handle_client(conn, addr):
-    global server_stop
-    logging.info(f"Connection from {addr}")
-    try:
-        first_message = True
-        character = None
-        conversation_id = None
-        character_name = None
-        while not server_stop:
-            raw_size = conn.recv(4)
-            if not raw_size:
-                logging.info(f"Connection closed by {addr}")
-                break
-            json_size = struct.unpack('<I', raw_size)[0]
-            data = b''
-            while len(data) < json_size:
-                packet = conn.recv(json_size - len(data))
-                if not packet:
+# Every LLM call in the process goes through this scheduler
+scheduler = GenerationScheduler(workers=OLLAMA_NUM_PARALLEL)
+
+def build_response_cache(settings):
+    """Create the shared response cache described by the "response_cache" settings, or None if it is off."""
+    if not settings.get("enabled", False):
+        return None
+    from ollama_char import get_lore_embedder
+    from response_cache import ResponseCache
+    persist_path = None
+    if settings.get("persist", False):
+        persist_path = os.path.join(SAVE_DIR, "response_cache.json")
+    return ResponseCache(
+        embedder=get_lore_embedder(BASE_URL) if settings.get("semantic", True) else None,
+        max_entries=settings.get("max_entries", 2048),
+        ttl=settings.get("ttl", 86400),
+        semantic_threshold=settings.get("semantic_threshold", 0.95),
+        history_turns=settings.get("history_turns", 1),
+        persist_path=persist_path
+    )
+
+_response_cache = None
+_response_cache_ready = False
+_response_cache_lock = threading.Lock()
+
+def response_cache():
+    """The shared response cache with its persisted entries loaded, built on first use; None if it is off."""
+    global _response_cache, _response_cache_ready
+    with _response_cache_lock:
+        if not _response_cache_ready:
+            _response_cache = build_response_cache(RESPONSE_CACHE_SETTINGS)
+            if _response_cache is not None:
+                _response_cache.load()
+            _response_cache_ready = True
+        return _response_cache
+
+def backend_pool():
+    """The process-wide pool of Ollama backends every session streams from."""
+    from ollama_pool import get_pool
+    return get_pool(BACKENDS or [BASE_URL], **BACKEND_POOL_SETTINGS)
+
+def build_character(character_name, conversation_id):
+    from ollama_char import OllamaCharacter
+    logging.info(f"Creating OllamaCharacter for {character_name} (conversation_id={conversation_id})")
+    return OllamaCharacter(
+        character_name=character_name,
+        conversation_id=conversation_id,
+        model=MODEL_NAME,
+        base_url=BASE_URL,
+        scheduler=scheduler,
+        response_cache=response_cache(),
+        pool=backend_pool(),
+        save_dir=SAVE_DIR,
+        lore=LORE_SETTINGS.get("enabled", True)
+    )
+
+def remove_lore(conversation_ids):
+    """Delete the lore vector stores of expired conversations, which hold their turn text."""
+    from lore_store import remove_conversation_store
+    lore_dir = os.path.join(SAVE_DIR, "lore")
+    for conversation_id in conversation_ids:
+        remove_conversation_store(lore_dir, conversation_id)
+
+def warm_models():
+    """
+    Load every configured model on every backend with keep_alive, so the first turn skips the cold load.
+
+    Returns:
+        dict: Model name -> backend URL -> whether it loaded.
+    """
+    pool = backend_pool()
+    # The same num_ctx as the characters' requests, or Ollama would reload the model for the first turn
+    generation = GenerationSettings(config.get("generation"), config.get("context", {}).get("num_ctx", 8192))
+    loaded = {MODEL_NAME: pool.warm_up(MODEL_NAME, keep_alive=KEEP_ALIVE, options={"num_ctx": generation.defaults["num_ctx"]})}
+    embedder_used = LORE_SETTINGS.get("enabled", True) or (
+        RESPONSE_CACHE_SETTINGS.get("enabled", False) and RESPONSE_CACHE_SETTINGS.get("semantic", True)
+    )
+    if embedder_used and LORE_SETTINGS.get("embedder", "ollama") == "ollama":
+        embed_model = LORE_SETTINGS.get("embed_model", "nomic-embed-text")
+        loaded[embed_model] = pool.warm_up(embed_model, keep_alive=KEEP_ALIVE, embed=True)
+    return loaded
+
+class CompanionServer:
+    """
+    asyncio socket server speaking the length-prefixed JSON protocol.
+
+    Generations are admitted by the shared GenerationScheduler so a burst of
+    clients cannot overload Ollama, idle connections time out, and shutdown lets in-flight
+    turns finish for up to `shutdown_grace` seconds before cancelling them.
+    Characters live in a shared SessionRegistry so reconnects reuse them.
+    """
+
+    def __init__(self, host=HOST, port=PORT, read_timeout=CLIENT_READ_TIMEOUT, shutdown_grace=SHUTDOWN_GRACE,
+                 max_inflight=MAX_INFLIGHT_REQUESTS):
+        """
+        Args:
+            host (str): Interface to bind.
+            port (int): Port to listen on.
+            read_timeout (float): Seconds a connection may stay idle before it is closed.
+            shutdown_grace (float): Seconds to wait for in-flight turns on shutdown.
+            max_inflight (int): Multiplexed requests one connection may have in flight.
+        """
+        self.host = host
+        self.port = port
+        self.read_timeout = read_timeout
+        self.shutdown_grace = shutdown_grace
+        self.max_inflight = max_inflight
+        self.server = None
+        self.stopping = None
+        # Connection task -> True while it is serving a turn, False while waiting for input
+        self.connections = {}
+        self.sessions = SessionRegistry(
+            build_character, max_sessions=SESSION_MAX, idle_ttl=SESSION_IDLE_TTL,
+            max_bytes=SESSION_MAX_BYTES, sizer=lambda character: character.memory_footprint()
+        )
+        self.metrics_server = None
+        # Warm-up step -> seconds it took once done; the server is ready when every step is
+        self.readiness = {"profiles": None, "modules": None, "response_cache": None}
+        if STARTUP_SETTINGS.get("warm_models", True):
+            self.readiness["models"] = None
+        self.warmup_errors = {}
+        self.started = time.perf_counter()
+
+    async def handle_client(self, reader, writer):
+        addr = writer.get_extra_info('peername')
+        task = asyncio.current_task()
+        self.connections[task] = False
+        logging.info(f"Connection from {addr}")
+        # request_id -> task of the multiplexed requests in flight on this connection
+        inflight = {}
+        slots = asyncio.Semaphore(self.max_inflight)
+        # Read of the next frame started while a non-multiplexed turn was running
+        next_read = None
+        try:
+            first_message = True
+            conversation_id = None
+            character_name = None
+            codec = JSON_CODEC
+            while not self.stopping.is_set():
+                try:
+                    reading = next_read or read_frame(reader, codec=codec)
+                    next_read = None
+                    request = await asyncio.wait_for(reading, self.read_timeout)
+                except asyncio.TimeoutError:
+                    if inflight:
+                        continue  # Quiet while its replies are still generating, not idle
+                    raise
+                if request is None:
+                    logging.info(f"Connection closed by {addr}")
                     break
-                data += packet
-            if not data:
-                logging.info(f"No data received from {addr}")
-                break
-            request = json.loads(data.decode('utf-8'))
-            print(request)
-
-            # If first message and conversation_id == 0, generate and send UID
-            if first_message and request.get('conversation_id', 0) == 0:
-                new_uid = generate_unique_uid()
-                logging.info(f"Generated new UID {new_uid} for {addr}")
-                response = {"uid": new_uid}
-                response_json = json.dumps(response, ensure_ascii=False).encode('utf-8')
-                response_size = struct.pack('<I', len(response_json))
-                conn.sendall(response_size + response_json)
+
+                # A first message advertising codecs is a handshake: answer in JSON, then switch
+                if first_message and 'codecs' in request:
+                    negotiated = negotiate(request)
+                    uid = await generate_unique_uid() if wants_new_conversation(request) else request['conversation_id']
+                    logging.info(f"Negotiated {negotiated.codec}/{negotiated.compression or 'uncompressed'} with {addr}, UID {uid}")
+                    await write_frame(writer, {"uid": uid, **handshake_fields(negotiated)})
+                    codec = negotiated
+                    first_message = False
+                    continue
+
+                # If first message and no conversation_id yet, generate and send UID
+                if first_message and wants_new_conversation(request):
+                    new_uid = await generate_unique_uid()
+                    logging.info(f"Generated new UID {new_uid} for {addr}")
+                    await write_frame(writer, {"uid": new_uid})
+                    first_message = False
+                    continue
                 first_message = False
-                continue
-
-            # On first real chat message, create OllamaCharacter
-            if character is None:
-                user_input = request.get('input', '')
-                conversation_id = request.get('conversation_id', 0)
-                character_name = request.get('character_name', 'Clara')
-                logging.info(f"Creating OllamaCharacter for {character_name} (conversation_id={conversation_id})")
-                character = OllamaCharacter(
-                    character_name=character_name,
-                    conversation_id=conversation_id,
-                    model=MODEL_NAME,
-                    base_url=BASE_URL
-                )
+
+                request_id = request.get('request_id')
+                if request.get('type') == FRAME_CANCEL:
+                    await self.cancel_request(writer, inflight, request_id, codec)
+                    continue
+
+                # The first real chat message binds the connection to a conversation
+                if conversation_id is None:
+                    conversation_id = request.get('conversation_id', 0)
+                    character_name = request.get('character_name', 'Clara')
+
+                if request_id is None:
+                    self.connections[task] = True
+                    try:
+                        next_read = await self.serve_watched_turn(
+                            reader, writer, request, conversation_id, character_name, codec
+                        )
+                    finally:
+                        self.connections[task] = bool(inflight)
+                    continue
+
+                # Multiplexed requests name their own conversation and run concurrently; turns of the
+                # same conversation still run in order behind the session lock. A full connection
+                # stops reading until a slot frees, which pushes back on the client through TCP.
+                if request_id in inflight:
+                    await write_frame(writer, error_frame(request_id, "request_id already in flight"), codec)
+                    continue
+                await slots.acquire()
+                request_task = asyncio.create_task(self.serve_request(
+                    writer, request,
+                    request.get('conversation_id', conversation_id),
+                    request.get('character_name', character_name),
+                    codec, slots
+                ))
+                inflight[request_id] = request_task
+                self.connections[task] = True
+                request_task.add_done_callback(lambda _, request_id=request_id: self.request_done(task, inflight, request_id))
+        except asyncio.TimeoutError:
+            logging.info(f"Connection with {addr} idle for {self.read_timeout}s, closing.")
+        except asyncio.CancelledError:
+            logging.info(f"Connection with {addr} cancelled during shutdown.")
+        except (ConnectionError, FrameTooLarge) as e:
+            logging.warning(f"Connection error with {addr}: {e}")
+        except Exception as e:
+            logging.error(f"Error handling client {addr}: {e}")
+        finally:
+            if next_read is not None:
+                next_read.cancel()
+            for request_task in list(inflight.values()):
+                request_task.cancel()
+            await asyncio.gather(*inflight.values(), return_exceptions=True)
+            self.connections.pop(task, None)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+            logging.info(f"Connection with {addr} closed.")
+
+    async def serve_turn(self, writer, request, conversation_id, character_name, codec, request_id=None):
+        """Run one turn of a conversation and send the reply."""
+        user_input = request.get('input', '')
+        logging.info(f"Received input for {conversation_id}: {user_input}")
+        registry.inc("turns_total", stream=bool(request.get('stream')))
+        with trace_turn(conversation_id) as trace:
+            leased = time.perf_counter()
+            async with self.sessions.lease(conversation_id, character_name) as character:
+                trace.record("session", time.perf_counter() - leased)
+                await self.respond(writer, character, request, codec, request_id)
+
+    async def serve_watched_turn(self, reader, writer, request, conversation_id, character_name, codec):
+        """
+        Run a non-multiplexed turn while reading the connection, cancelling the turn if the client hangs up.
+
+        Without the read, a client leaving during a non-stream turn goes unnoticed until the reply is written.
+        A frame the client sends meanwhile is left for the connection to serve after this turn.
+
+        Returns:
+            asyncio.Task: The read of the connection's next frame.
+        """
+        turn = asyncio.create_task(self.serve_turn(writer, request, conversation_id, character_name, codec))
+        next_read = asyncio.create_task(read_frame(reader, codec=codec))
+        try:
+            await asyncio.wait((turn, next_read), return_when=asyncio.FIRST_COMPLETED)
+            if not turn.done() and (next_read.exception() is not None or next_read.result() is None):
+                logging.info(f"Client left during a turn for {conversation_id}, cancelling it")
+                turn.cancel()
+                await asyncio.gather(turn, return_exceptions=True)
+            else:
+                await turn
+            return next_read
+        except BaseException:
+            turn.cancel()
+            next_read.cancel()
+            raise
+
+    async def serve_request(self, writer, request, conversation_id, character_name, codec, slots):
+        """Serve one multiplexed request, reporting failures on its request_id instead of dropping the connection."""
+        request_id = request['request_id']
+        try:
+            await self.serve_turn(writer, request, conversation_id, character_name, codec, request_id)
+        except (asyncio.CancelledError, ConnectionError):
+            raise
+        except Exception as e:
+            logging.error(f"Request {request_id} for {conversation_id} failed: {e}")
+            await write_frame(writer, error_frame(request_id, str(e)), codec)
+        finally:
+            slots.release()
+
+    def request_done(self, connection, inflight, request_id):
+        inflight.pop(request_id, None)
+        if inflight or connection not in self.connections:
+            return
+        self.connections[connection] = False
+        # Draining: the connection was only kept open for its in-flight requests
+        if self.stopping.is_set():
+            connection.cancel()
+
+    async def cancel_request(self, writer, inflight, request_id, codec):
+        """Abort an in-flight multiplexed request; closing its stream cancels the generation."""
+        request_task = inflight.get(request_id)
+        if request_task is None:
+            return  # Already finished, its final frame is on the way
+        request_task.cancel()
+        await asyncio.gather(request_task, return_exceptions=True)
+        logging.info(f"Cancelled request {request_id}")
+        await write_frame(writer, cancelled_frame(request_id), codec)
+
+    async def respond(self, writer, character, request, codec=JSON_CODEC, request_id=None):
+        """Generate a reply and send it to the client."""
+        def tagged(frame):
+            if request_id is not None:
+                frame["request_id"] = request_id
+            return frame
+
+        user_input = request.get('input', '')
+        if not request.get('stream'):
+            await write_frame(writer, tagged(dict(await character.arespond(user_input))), codec)
+            return
+        # Stream answer chunks as they arrive, then the final parsed frame. If the client
+        # goes away a write fails and closing the stream cancels the generation.
+        include_thinking = request.get('stream_thinking', False)
+        stream = character.arespond_stream(user_input)
+        try:
+            async for channel, payload in stream:
+                if channel == "final":
+                    await write_frame(writer, tagged(final_frame(payload)), codec)
+                elif channel == "answer" or (channel == "thinking" and include_thinking):
+                    await write_frame(writer, tagged(chunk_frame(channel, payload)), codec)
+        finally:
+            await stream.aclose()
+
+    async def run_retention(self, store, max_age, interval=3600):
+        """
+        Periodically delete conversations not updated for `max_age` seconds, with their sessions and
+        embedded lore turns. Runs until cancelled.
+        """
+        while True:
+            try:
+                expired = await asyncio.to_thread(store.expire, max_age)
+                for conversation_id in expired:
+                    self.sessions.discard(conversation_id)
+                if expired:
+                    await asyncio.to_thread(remove_lore, expired)
+            except Exception as e:
+                logging.warning(f"Conversation retention failed: {e}")
+            await asyncio.sleep(interval)
+
+    def ready(self):
+        return all(seconds is not None for seconds in self.readiness.values())
+
+    def startup_stats(self):
+        return {
+            "ready": int(self.ready()),
+            "steps_ms": {step: seconds * 1000 for step, seconds in self.readiness.items() if seconds is not None},
+            "errors": dict(self.warmup_errors),
+        }
+
+    async def warm_up(self):
+        """
+        Do the work the first turn would otherwise pay for: parse the character sheets, import the
+        LangChain stack, load the response cache and load the models into Ollama. Each step runs in
+        a worker thread, so clients are served meanwhile; a failed step is logged and left to first use.
+        """
+        def preload_profiles():
+            from character_profiles import profiles
+            profiles.preload()
+
+        def import_modules():
+            import ollama_char  # noqa: F401
+
+        steps = {
+            "profiles": preload_profiles,
+            "modules": import_modules,
+            "response_cache": response_cache,
+            "models": warm_models,
+        }
+        for step in self.readiness:
+            started = time.perf_counter()
+            try:
+                result = await asyncio.to_thread(steps[step])
+            except Exception as e:
+                logging.warning(f"Warm-up step {step} failed: {e}")
+                self.warmup_errors[step] = str(e)
             else:
-                user_input = request.get('input', '')
-
-            logging.info(f"Received input from {addr}: {user_input}")
-            response = character.respond(user_input)
-            response_json = json.dumps(response, ensure_ascii=False).encode('utf-8')
-            response_size = struct.pack('<I', len(response_json))
-            conn.sendall(response_size + response_json)
-            first_message = False
-    except Exception as e:
-        logging.error(f"Error handling client {addr}: {e}")
-    finally:
-        conn.close()
-        logging.info(f"Connection with {addr} closed.")
-
-def sigint_handler(signum, frame):
-    logging.info("SIGINT received, shutting down server.")
-    server_stop = True
-    exit(0)
-
-signal.signal(signal.SIGINT, sigint_handler)
+                if step == "models":
+                    for model, backends in result.items():
+                        if not all(backends.values()):
+                            logging.warning(f"Model {model} did not load on every backend: {backends}")
+                            self.warmup_errors[model] = f"not loaded on {[url for url, ok in backends.items() if not ok]}"
+            self.readiness[step] = time.perf_counter() - started
+            logging.info(f"Warm-up: {step} done in {self.readiness[step] * 1000:.0f}ms")
+        logging.info(f"Server ready {time.perf_counter() - self.started:.2f}s after start")
+
+    def request_stop(self):
+        if not self.stopping.is_set():
+            logging.info("Shutdown requested, draining connections.")
+            self.stopping.set()
+
+    async def shutdown(self):
+        """Stop accepting clients, let in-flight turns finish, then cancel whatever is left."""
+        self.server.close()
+        # Idle connections have nothing to drain
+        for task, busy in list(self.connections.items()):
+            if not busy:
+                task.cancel()
+        pending = list(self.connections)
+        if pending:
+            logging.info(f"Waiting up to {self.shutdown_grace}s for {len(pending)} connection(s) to finish.")
+            _, still_running = await asyncio.wait(pending, timeout=self.shutdown_grace)
+            for task in still_running:
+                task.cancel()
+            await asyncio.gather(*still_running, return_exceptions=True)
+        await self.server.wait_closed()
+
+    async def serve(self):
+        self.stopping = asyncio.Event()
+        store = configure_store(
+            backend=STORAGE_SETTINGS.get("backend", "sqlite"),
+            save_dir=SAVE_DIR,
+            path=STORAGE_SETTINGS.get("path"),
+            chat_log_settings=CHAT_LOG_SETTINGS,
+            batch_max=STORAGE_SETTINGS.get("batch_max", 256)
+        )
+        scheduler.start()
+        warming = None
+        if not STARTUP_SETTINGS.get("lazy", True):
+            await self.warm_up()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.request_stop)
+            except (NotImplementedError, RuntimeError):
+                pass  # Not supported on Windows, Ctrl+C raises KeyboardInterrupt instead
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        if METRICS_SETTINGS.get("enabled", True):
+            configure_metrics(sample_rate=METRICS_SETTINGS.get("sample_rate", 1.0))
+            registry.register_collector("scheduler", scheduler.stats)
+            registry.register_collector("sessions", self.sessions.stats)
+            registry.register_collector("ollama", lambda: backend_pool().stats())
+            registry.register_collector("startup", self.startup_stats)
+            if RESPONSE_CACHE_SETTINGS.get("enabled", False):
+                registry.register_collector("response_cache", lambda: _response_cache.stats() if _response_cache else {})
+            self.metrics_server = MetricsServer(
+                METRICS_SETTINGS.get("host", "127.0.0.1"), METRICS_SETTINGS.get("port", 9464), readiness=self.startup_stats
+            )
+            try:
+                await self.metrics_server.start()
+            except OSError as e:
+                logging.warning(f"Metrics endpoint disabled: {e}")
+                self.metrics_server = None
+        logging.info(f"Server listening on {self.host}:{self.port} after {time.perf_counter() - self.started:.2f}s")
+        if not self.ready():
+            warming = asyncio.create_task(self.warm_up())
+        sweeper = asyncio.create_task(self.sessions.run_sweeper())
+        retention = None
+        if STORAGE_SETTINGS.get("retention_days"):
+            retention = asyncio.create_task(self.run_retention(store, STORAGE_SETTINGS["retention_days"] * 86400))
+        try:
+            await self.stopping.wait()
+        finally:
+            sweeper.cancel()
+            if warming is not None:
+                warming.cancel()
+            if retention is not None:
+                retention.cancel()
+            await self.shutdown()
+            if self.metrics_server is not None:
+                await self.metrics_server.close()
+            await backend_pool().aclose()
+            logging.info(f"Session registry: {self.sessions.stats()}")
+            logging.info(f"Generation scheduler: {scheduler.stats()}")
+            if _response_cache is not None:
+                logging.info(f"Response cache: {_response_cache.stats()}")
+                _response_cache.save()
+            store.close()
+            logging.info("Server stopped.")
 
 def main():
-    global server_stop
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.bind((HOST, PORT))
-            s.listen()
-            logging.info(f"Server listening on {HOST}:{PORT}")
-            while not server_stop:
-                conn, addr = s.accept()
-                threading.Thread(target=handle_client, args=(conn, addr), daemon=True).start()
+        asyncio.run(CompanionServer().serve())
     except KeyboardInterrupt:
         logging.info("Server stopped by user (Ctrl+C).")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+class Session:
+    """A live character for one conversation plus the bookkeeping the registry needs."""
+
+    def __init__(self, conversation_id, character_name, character):
+        self.conversation_id = conversation_id
+        self.character_name = character_name
+        self.character = character
+        # Serializes turns so two connections on the same conversation cannot interleave memory updates
+        self.lock = asyncio.Lock()
+        self.leases = 0
+        self.last_used = time.monotonic()
+        # Approximate bytes of conversation state, as reported by the registry's sizer
+        self.size = 0
+
+class SessionRegistry:
+    """
+    Process-wide cache of live characters keyed by conversation_id.
+
+    Reconnecting clients get the already-built character back instead of
+    re-reading the character sheet and replaying the chat log. Sessions are
+    evicted least-recently-used first once `max_sessions` is exceeded or
+    their combined size passes `max_bytes`, and after `idle_ttl` seconds
+    without a turn. Sessions with a turn in flight are never evicted. A
+    conversation that switches character waits for the turns of the old
+    character to finish before its session is rebuilt.
+    """
+
+    def __init__(self, factory, max_sessions=256, idle_ttl=1800, max_bytes=None, sizer=None):
+        """
+        Args:
+            factory (callable): factory(character_name, conversation_id) building a character. Runs in a worker thread.
+            max_sessions (int): Maximum number of resident sessions.
+            idle_ttl (float): Seconds after which an unused session is evicted.
+            max_bytes (int): Bound on the combined size of resident sessions, None for no bound.
+            sizer (callable): sizer(character) returning its approximate size in bytes, measured after each turn.
+        """
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self.sizer = sizer
+        self.resident_bytes = 0
+        self._sessions = OrderedDict()
+        self._building = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """Registry counters for monitoring."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "resident": len(self._sessions),
+            "resident_bytes": self.resident_bytes,
+        }
+
+    async def get(self, conversation_id, character_name):
+        """Return the session for a conversation, building it on first use."""
+        key = str(conversation_id)
+        while True:
+            # Another connection may already be building this conversation's session; wait for it
+            # and look again, since it may have been built for another character or failed
+            building = self._building.get(key)
+            if building is not None:
+                await asyncio.wait([building])
+                continue
+            session = self._sessions.get(key)
+            if session is not None and session.character_name == character_name:
+                self.hits += 1
+                self._sessions.move_to_end(key)
+                return session
+            if session is None or not session.leases:
+                break
+            # Same conversation, other character: let its turns finish so the two never interleave
+            async with session.lock:
+                pass
+
+        self.misses += 1
+        building = asyncio.get_running_loop().create_future()
+        self._building[key] = building
+        try:
+            character = await asyncio.to_thread(self.factory, character_name, conversation_id)
+        except BaseException as e:
+            building.set_exception(e)
+            building.exception()  # Mark retrieved so unawaited failures are not reported twice
+            raise
+        finally:
+            del self._building[key]
+        session = Session(key, character_name, character)
+        if key in self._sessions:
+            logging.info(f"Conversation {key} switched to {character_name}, replacing its session")
+            self._evict(key)
+        self._sessions[key] = session
+        self._measure(session)
+        self._evict_overflow()
+        building.set_result(session)
+        return session
+
+    @asynccontextmanager
+    async def lease(self, conversation_id, character_name):
+        """
+        Hold a conversation's character exclusively for the duration of a turn.
+
+        Yields:
+            The character object built by the factory.
+        """
+        session = await self.get(conversation_id, character_name)
+        session.leases += 1
+        try:
+            async with session.lock:
+                yield session.character
+        finally:
+            session.leases -= 1
+            session.last_used = time.monotonic()
+            if self._sessions.get(session.conversation_id) is session:
+                self._measure(session)
+                self._evict_overflow()
+
+    def _measure(self, session):
+        if self.sizer is None:
+            return
+        try:
+            size = self.sizer(session.character)
+        except Exception as e:
+            logging.warning(f"Could not size session {session.conversation_id}: {e}")
+            return
+        self.resident_bytes += size - session.size
+        session.size = size
+
+    def _over_budget(self):
+        if len(self._sessions) > self.max_sessions:
+            return True
+        return self.max_bytes is not None and self.resident_bytes > self.max_bytes
+
+    def _evict(self, key):
+        session = self._sessions.pop(key)
+        self.resident_bytes -= session.size
+        self.evictions += 1
+        logging.info(f"Evicted session {key} ({session.character_name})")
+
+    def _evict_overflow(self):
+        for key in list(self._sessions):
+            if not self._over_budget():
+                break
+            if self._sessions[key].leases == 0:
+                self._evict(key)
+
+    def discard(self, conversation_id):
+        """Drop a conversation's session unless a turn is in flight, e.g. after its data was deleted."""
+        session = self._sessions.get(str(conversation_id))
+        if session is not None and session.leases == 0:
+            self._evict(str(conversation_id))
+
+    def evict_idle(self):
+        """Evict every session that has been unused for longer than the idle TTL."""
+        now = time.monotonic()
+        for key, session in list(self._sessions.items()):
+            if session.leases == 0 and now - session.last_used > self.idle_ttl:
+                self._evict(key)
+
+    async def run_sweeper(self, interval=60):
+        """Periodically evict idle sessions. Runs until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            self.evict_idle()
+            logging.debug(f"Session registry: {self.stats()}")
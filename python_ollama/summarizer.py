@@ -0,0 +1,232 @@
+import re
+import time
+import logging
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from metrics import registry
+
+# Shared by every character so summarization never competes with replies for more than a couple of threads
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="summarizer")
+
+# Reasoning models think out loud before answering; only what follows is the summary
+REASONING = re.compile(r"<think(?:ing)?>.*?</think(?:ing)?>|^.*?</think(?:ing)?>", re.DOTALL)
+
+CHUNK_PROMPT = """Summarize this part of a roleplay between user and {character_name} in at most {max_words} words.
+Keep names, facts learned about user, promises, decisions and how their relationship changed. Write plain prose without a preamble.
+
+{turns}
+
+Summary:"""
+
+ARC_PROMPT = """Below is the story so far of a roleplay between user and {character_name}, then summaries of what happened next.
+Rewrite them as a single story so far of at most {max_words} words. Keep what matters for continuing the roleplay, drop details that no longer do. Write plain prose without a preamble.
+
+Story so far:
+{arc}
+
+What happened next:
+{chunks}
+
+Story so far:"""
+
+def format_turns(turns):
+    return "\n".join(f"Human: {user_input}\nAI: {answer}" for user_input, answer in turns)
+
+class TieredMemory:
+    """
+    Long-term memory in tiers, each computed exactly once and kept in the conversation store.
+
+    The newest turns stay verbatim in the prompt history. The prompt window
+    reports through `show_from` which turns it still shows; turns that left
+    it are summarized, at most `chunk_turns` at a time, into chunk summaries
+    by a background worker, so no turn is both shown verbatim and summarized
+    and none is dropped without a summary. Without a window, the oldest
+    `chunk_turns` turns are summarized once more than `recent_turns` are
+    waiting. A chunk is never summarized again. Once more than `max_chunks` chunk summaries exist, the
+    oldest `arc_chunks` are folded into the arc summary, the story so far.
+    The rendered memory is the arc plus at most `max_chunks` chunks, each
+    capped in tokens, so its size is bounded however long the conversation
+    runs. A restored session reads every tier back from the store without an
+    LLM call.
+    """
+
+    def __init__(self, generate, store, conversation_id, character_name="", counter=None, recent_turns=8,
+                 chunk_turns=8, max_chunks=4, arc_chunks=2, chunk_tokens=200, arc_tokens=400, executor=None, gate=None):
+        """
+        Args:
+            generate (callable): generate(prompt) returning the completion text.
+            store (ConversationStore): Where the turns are read from and the summaries persisted.
+            conversation_id: Conversation whose memory this is.
+            character_name (str): Named in the summarization prompts.
+            counter (TokenCounter): Caps summaries at their token budget. Summaries are not cut if omitted.
+            recent_turns (int): Newest turns never summarized while no prompt window reports what it shows.
+            chunk_turns (int): Turns condensed into one chunk summary.
+            max_chunks (int): Chunk summaries kept before the oldest are folded into the arc.
+            arc_chunks (int): Chunk summaries folded into the arc at a time.
+            chunk_tokens (int): Token budget of one chunk summary.
+            arc_tokens (int): Token budget of the arc summary.
+            executor (Executor): Where summarization jobs run. Defaults to a shared pool.
+            gate (callable): Returns a context manager held around each LLM call, e.g. a scheduler slot.
+        """
+        self.generate = generate
+        self.store = store
+        self.conversation_id = conversation_id
+        self.character_name = character_name
+        self.counter = counter
+        self.recent_turns = max(0, recent_turns)
+        self.chunk_turns = max(1, chunk_turns)
+        self.max_chunks = max(1, max_chunks)
+        self.arc_chunks = min(max(1, arc_chunks), self.max_chunks)
+        self.chunk_tokens = chunk_tokens
+        self.arc_tokens = arc_tokens
+        self.executor = executor or _executor
+        self.gate = gate or nullcontext
+        self._lock = threading.Lock()
+        self._running = False
+        self._epoch = 0
+        # Ordinal of the oldest turn the prompt window shows verbatim, None until a window reports it
+        self.visible_from = None
+        self._restore()
+
+    def _restore(self):
+        """
+        Load the persisted tiers and the turns not yet summarized. Reads only, no LLM call.
+
+        Summarization resumes once the prompt window reports what it shows, or with the next turn.
+        """
+        state = self.store.load_memory(self.conversation_id)
+        self.arc = state["arc"]
+        self.chunks = state["chunks"]
+        self.turns = state["turns"]
+        summarized = state["summarized"]
+        if summarized is None:
+            # No chunk was ever stored, e.g. a conversation from before the tiers; start with the recent turns
+            summarized = max(0, self.turns - self.recent_turns)
+        # (ordinal, user_input, answer) of the turns no chunk covers yet
+        self._pending = []
+        if self.turns > summarized:
+            records = self.store.tail(self.conversation_id, self.turns - summarized)
+            first = self.turns - len(records)
+            self._pending = [(first + index, record.get("user_input", ""), record.get("answer", ""))
+                             for index, record in enumerate(records)]
+
+    @property
+    def summary(self):
+        """The memory as prompt text: the arc, then the chunk summaries in order."""
+        with self._lock:
+            parts = [self.arc] if self.arc else []
+            parts.extend(f"Turns {chunk['first_turn'] + 1}-{chunk['last_turn'] + 1}: {chunk['summary']}" for chunk in self.chunks)
+        return "\n".join(parts)
+
+    def stats(self):
+        with self._lock:
+            return {"turns": self.turns, "pending": len(self._pending), "chunks": len(self.chunks), "arc": int(bool(self.arc))}
+
+    def show_from(self, first_turn):
+        """Record that the prompt window shows the turns from ordinal `first_turn` on; older ones get summarized."""
+        with self._lock:
+            self.visible_from = first_turn
+        self._schedule()
+
+    def add_turn(self, user_input, answer):
+        """Record a finished turn; summarization starts in the background once a chunk is complete."""
+        with self._lock:
+            self._pending.append((self.turns, user_input, answer))
+            self.turns += 1
+        self._schedule()
+
+    def _next_batch(self):
+        """The pending turns to summarize next, or None if none is due."""
+        if self.visible_from is None:
+            if len(self._pending) < self.recent_turns + self.chunk_turns:
+                return None
+            return self._pending[:self.chunk_turns]
+        # Turns the window no longer shows cannot wait for a full chunk, the prompt has nothing else of them
+        hidden = 0
+        while hidden < min(len(self._pending), self.chunk_turns) and self._pending[hidden][0] < self.visible_from:
+            hidden += 1
+        return self._pending[:hidden] or None
+
+    def _schedule(self):
+        with self._lock:
+            if self._running or not (self._next_batch() or len(self.chunks) > self.max_chunks):
+                return
+            self._running = True
+        self.executor.submit(self._run)
+
+    def _complete(self, prompt, max_tokens, metric):
+        queued = time.perf_counter()
+        with self.gate():
+            started = time.perf_counter()
+            text = self.generate(prompt)
+        registry.observe("summary_queue_wait_ms", (started - queued) * 1000)
+        registry.observe(metric, (time.perf_counter() - started) * 1000)
+        text = REASONING.sub("", text).strip()
+        if self.counter is not None:
+            text = self.counter.truncate(text, max_tokens)
+        return text
+
+    def _max_words(self, max_tokens):
+        return max(20, int(max_tokens * 0.7))
+
+    def _summarize_chunk(self, batch):
+        summary = self._complete(CHUNK_PROMPT.format(
+            character_name=self.character_name,
+            max_words=self._max_words(self.chunk_tokens),
+            turns=format_turns((user_input, answer) for _, user_input, answer in batch)
+        ), self.chunk_tokens, "summary_chunk_ms")
+        return {"first_turn": batch[0][0], "last_turn": batch[-1][0], "summary": summary}
+
+    def _summarize_arc(self, arc, chunks):
+        return self._complete(ARC_PROMPT.format(
+            character_name=self.character_name,
+            max_words=self._max_words(self.arc_tokens),
+            arc=arc or "(nothing yet)",
+            chunks="\n".join(chunk["summary"] for chunk in chunks)
+        ), self.arc_tokens, "summary_arc_ms")
+
+    def _run(self):
+        """Summarize complete chunks, then roll surplus chunks into the arc, until nothing is due."""
+        while True:
+            with self._lock:
+                epoch = self._epoch
+                batch = self._next_batch()
+                rolled = self.chunks[:self.arc_chunks] if batch is None and len(self.chunks) > self.max_chunks else None
+                arc = self.arc
+                if batch is None and rolled is None:
+                    self._running = False
+                    return
+            try:
+                if batch is not None:
+                    chunk = self._summarize_chunk(batch)
+                else:
+                    arc = self._summarize_arc(arc, rolled)
+            except Exception as e:
+                # The turns or chunks stay queued and are retried with the next finished turn
+                logging.warning(f"Failed to update the memory of {self.conversation_id}: {e}")
+                with self._lock:
+                    self._running = False
+                return
+            with self._lock:
+                if epoch != self._epoch:
+                    continue  # Computed before a clear()
+                if batch is not None:
+                    del self._pending[:len(batch)]
+                    self.chunks.append(chunk)
+                else:
+                    del self.chunks[:len(rolled)]
+                    self.arc = arc
+            # Written in order by the store's writer, so a restore never sees an arc without its chunks rolled
+            if batch is not None:
+                self.store.save_chunk(self.conversation_id, chunk["first_turn"], chunk["last_turn"], chunk["summary"])
+            else:
+                self.store.save_arc(self.conversation_id, arc, rolled[-1]["last_turn"] + 1)
+
+    def clear(self):
+        """Forget every tier and any turns waiting to be summarized."""
+        with self._lock:
+            self._pending = []
+            self.chunks = []
+            self.arc = ""
+            self._epoch += 1
@@ -0,0 +1,179 @@
+import re
+from functools import lru_cache
+
+# Sections the roleplay prompt asks the model to emit
+TOPICS = ("thinking", "answer", "mood", "actions")
+
+OPEN_DELIMITERS = "<({"
+CLOSE_DELIMITERS = ">)}"
+
+# Room for whitespace inside a tag such as "< /answer >"
+TAG_SLACK = 8
+
+@lru_cache(maxsize=32)
+def tag_pattern(topics=TOPICS):
+    """
+    Compile a regex matching opening and closing tags for the given topics.
+
+    Models are inconsistent about delimiters, so <answer>, (answer), {answer}
+    and mixed forms like (answer> are all accepted. Bare words are not, which
+    keeps "answer" inside the prose from being mistaken for a tag.
+    """
+    names = "|".join(re.escape(topic) for topic in topics)
+    return re.compile(
+        rf"[{re.escape(OPEN_DELIMITERS)}]\s*(/?)\s*({names})\s*[{re.escape(CLOSE_DELIMITERS)}]",
+        re.IGNORECASE
+    )
+
+@lru_cache(maxsize=32)
+def delimiter_patterns(topics=TOPICS):
+    """
+    The tag pattern split by opening delimiter: (delimiter, regex) pairs.
+
+    A pattern starting with a literal character is scanned for with a fast
+    substring search, while one starting with a character class is tried at
+    every position, so three literal passes beat one pass over long replies.
+    """
+    names = "|".join(re.escape(topic) for topic in topics)
+    return tuple(
+        (delimiter, re.compile(rf"{re.escape(delimiter)}\s*(/?)\s*({names})\s*[{re.escape(CLOSE_DELIMITERS)}]", re.IGNORECASE))
+        for delimiter in OPEN_DELIMITERS
+    )
+
+def find_tags(text, topics=TOPICS):
+    """Every tag in text as regex matches, in order. Same matches as tag_pattern(topics).finditer(text)."""
+    matches = []
+    for delimiter, pattern in delimiter_patterns(topics):
+        if delimiter in text:
+            matches.extend(pattern.finditer(text))
+    matches.sort(key=lambda match: match.start())
+    return matches
+
+def _transition(channel, closing, name):
+    """Channel after a tag: an opening tag enters its section, closing the current section leaves it."""
+    if not closing:
+        return name
+    if name == channel:
+        return None
+    return channel  # Stray closing tag of another section, stay where we are
+
+def parse_sections(text, topics=TOPICS):
+    """
+    Extract every tagged section of a response in a single scan.
+
+    A section runs from its opening tag to its closing tag, or to the next
+    opening tag of another section if the closing tag is missing, or to the
+    end of the text. When a section appears more than once the first one wins.
+
+    Args:
+        text (str): The model output.
+        topics (tuple): Section names to extract.
+    Returns:
+        dict: Section name -> stripped content ("" when absent).
+    """
+    sections = {topic: "" for topic in topics}
+    found = set()
+    channel = None
+    start = 0
+    for match in find_tags(text, topics):
+        closing, name = match.group(1), match.group(2).lower()
+        if channel is not None:
+            if bool(closing) != (name == channel):
+                continue  # Repeated opening tag, or a stray closing tag of another section
+            if channel not in found:
+                sections[channel] = text[start:match.start()].strip()
+                found.add(channel)
+            channel = None
+        if not closing:
+            channel = name
+            start = match.end()
+    if channel is not None and channel not in found:
+        sections[channel] = text[start:].strip()
+    return sections
+
+def _could_be_tag(fragment, topics):
+    """True if `fragment` (starting with an opening delimiter) may still grow into a tag."""
+    body = fragment[1:].lstrip()
+    if body.startswith('/'):
+        body = body[1:].lstrip()
+    name = body.rstrip().lower()
+    if name != body.lower() and name not in topics:
+        return False  # Whitespace after an incomplete name can never become a tag
+    return any(topic.startswith(name) for topic in topics)
+
+class TagStreamParser:
+    """
+    Incremental counterpart of parse_sections for token streams.
+
+    Text is released as soon as it is known not to be part of a tag, so answer
+    tokens can be forwarded to the client while the model is still generating.
+    """
+
+    def __init__(self, channel="thinking", topics=TOPICS):
+        """
+        Args:
+            channel (str): Channel the stream starts in (the prompt already opens <thinking>).
+            topics (tuple): Section names to route.
+        """
+        self.channel = channel
+        self.topics = topics
+        self._pattern = tag_pattern(topics)
+        self._max_tag_length = max(len(topic) for topic in topics) + 3 + TAG_SLACK
+        self._pending = ""
+        # Sections whose closing tag has been seen, so callers can end generation early
+        self.closed = set()
+
+    def _emit(self, events, text):
+        if not text or self.channel is None:
+            return
+        if events and events[-1][0] == self.channel:
+            events[-1] = (self.channel, events[-1][1] + text)
+        else:
+            events.append((self.channel, text))
+
+    def _held_back(self, text):
+        """Index from which `text` may be the start of a tag split across chunks."""
+        index = max(0, len(text) - self._max_tag_length)
+        while True:
+            candidates = [found for found in (text.find(d, index) for d in OPEN_DELIMITERS) if found != -1]
+            if not candidates:
+                return len(text)
+            index = min(candidates)
+            if _could_be_tag(text[index:], self.topics):
+                return index
+            index += 1
+
+    def feed(self, text):
+        """
+        Consume a chunk of streamed text.
+
+        Returns:
+            list: (channel, text) pairs ready to be forwarded.
+        """
+        events = []
+        pending = self._pending + text
+        if not any(delimiter in pending for delimiter in OPEN_DELIMITERS):
+            # No tag can start here, nothing to hold back: the common case for prose tokens
+            self._emit(events, pending)
+            self._pending = ""
+            return events
+        position = 0
+        for match in self._pattern.finditer(pending):
+            self._emit(events, pending[position:match.start()])
+            closing, name = match.group(1), match.group(2).lower()
+            if closing and name == self.channel:
+                self.closed.add(name)
+            self.channel = _transition(self.channel, closing, name)
+            position = match.end()
+        rest = pending[position:]
+        hold = self._held_back(rest)
+        self._emit(events, rest[:hold])
+        self._pending = rest[hold:]
+        return events
+
+    def close(self):
+        """Flush any text held back while waiting for a possible tag."""
+        events = []
+        self._emit(events, self._pending)
+        self._pending = ""
+        return events
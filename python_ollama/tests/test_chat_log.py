@@ -0,0 +1,46 @@
+import os
+import time
+
+import chat_log
+from chat_log import LogWriter
+
+def test_flush_makes_appended_records_readable(tmp_path):
+    writer = LogWriter(fsync="none")
+    log_path = str(tmp_path / "conversation.log")
+    try:
+        for index in range(10):
+            writer.append(log_path, {"user_input": f"u{index}", "answer": f"a{index}"})
+        assert writer.flush(timeout=5)
+        records = list(chat_log.iter_records(log_path))
+        assert [record["user_input"] for record in records] == [f"u{index}" for index in range(10)]
+    finally:
+        writer.close()
+
+def test_close_writes_everything_queued(tmp_path):
+    writer = LogWriter(fsync="none")
+    log_path = str(tmp_path / "conversation.log")
+    for index in range(100):
+        writer.append(log_path, {"user_input": str(index), "answer": ""})
+    writer.close()
+    assert len(list(chat_log.iter_records(log_path))) == 100
+
+def test_flush_after_close_returns_at_once(tmp_path):
+    writer = LogWriter(fsync="none")
+    writer.close()
+    started = time.monotonic()
+    assert writer.flush() is False
+    assert time.monotonic() - started < 1
+
+def test_append_after_close_is_dropped(tmp_path, caplog):
+    writer = LogWriter(fsync="none")
+    writer.close()
+    log_path = str(tmp_path / "conversation.log")
+    writer.append(log_path, {"user_input": "late", "answer": ""})
+    assert not os.path.exists(log_path)
+    assert "closed" in caplog.text
+
+def test_close_is_idempotent():
+    writer = LogWriter(fsync="none")
+    writer.close()
+    writer.close()
+    assert writer.closed
@@ -0,0 +1,127 @@
+import os
+
+import pytest
+
+import conversation_store
+from conversation_store import ConversationStore, SQLiteStore, make_store
+
+@pytest.fixture(params=["sqlite", "log"])
+def store(request, tmp_path):
+    store = make_store(backend=request.param, save_dir=str(tmp_path), chat_log_settings={"fsync": "none"})
+    yield store
+    store.close()
+
+def add_turns(store, conversation_id, count):
+    for index in range(count):
+        store.append_turn(conversation_id, f"u{index}", f"a{index}", "Clara")
+
+def test_turns_round_trip(store):
+    conversation_id = store.create_conversation("Clara")
+    add_turns(store, conversation_id, 5)
+    assert store.exists(conversation_id)
+    assert [record["user_input"] for record in store.iter_turns(conversation_id)] == [f"u{i}" for i in range(5)]
+    assert store.tail(conversation_id, 2) == [{"user_input": "u3", "answer": "a3"}, {"user_input": "u4", "answer": "a4"}]
+    assert [hit["answer"] for hit in store.search("a2", conversation_id)] == ["a2"]
+
+def test_unknown_conversation_is_empty(store):
+    assert not store.exists("missing")
+    assert store.tail("missing", 5) == []
+    assert store.load_summary("missing") == ""
+    assert store.load_memory("missing") == {"arc": "", "turns": 0, "chunks": [], "summarized": None}
+
+def test_memory_tiers_round_trip(store):
+    conversation_id = store.create_conversation()
+    add_turns(store, conversation_id, 6)
+    store.save_chunk(conversation_id, 0, 2, "first")
+    store.save_chunk(conversation_id, 3, 5, "second")
+    memory = store.load_memory(conversation_id)
+    assert memory["turns"] == 6
+    assert memory["summarized"] == 6
+    assert [chunk["summary"] for chunk in memory["chunks"]] == ["first", "second"]
+
+    store.save_arc(conversation_id, "the story so far", 3)
+    memory = store.load_memory(conversation_id)
+    assert memory["arc"] == store.load_summary(conversation_id) == "the story so far"
+    assert [chunk["summary"] for chunk in memory["chunks"]] == ["second"]
+    assert memory["summarized"] == 6
+
+def test_expire_removes_conversations(store):
+    old = store.create_conversation()
+    add_turns(store, old, 2)
+    store.save_chunk(old, 0, 1, "chunk")
+    store.flush()
+    assert store.expire(3600) == []
+    assert store.expire(-1) == [old]
+    assert not store.exists(old)
+    assert store.tail(old, 5) == []
+    assert store.load_memory(old)["chunks"] == []
+
+def test_log_store_counts_turns_without_reading_sealed_segments(tmp_path, monkeypatch):
+    settings = {"fsync": "none", "segment_max_bytes": 256, "compression": "none"}
+    store = make_store(backend="log", save_dir=str(tmp_path), chat_log_settings=settings)
+    try:
+        conversation_id = store.create_conversation()
+        add_turns(store, conversation_id, 50)
+        store.flush()
+        assert any(".000001.log" in name for name in os.listdir(tmp_path))
+        counts_path = os.path.join(tmp_path, f"{conversation_id}.log.segments.json")
+        assert os.path.exists(counts_path)
+
+        def unreadable(path):
+            raise AssertionError(f"read {path}")
+
+        with monkeypatch.context() as patch:
+            patch.setattr("chat_log.read_segment", unreadable)
+            assert store.load_memory(conversation_id)["turns"] == 50
+
+        # Segments sealed before the counts sidecar existed are counted once and recorded
+        os.remove(counts_path)
+        assert store.load_memory(conversation_id)["turns"] == 50
+        assert os.path.exists(counts_path)
+
+        assert store.expire(-1) == [conversation_id]
+        assert os.listdir(tmp_path) == []
+    finally:
+        store.close()
+
+def test_sqlite_import_conversation(tmp_path):
+    store = SQLiteStore(str(tmp_path / "conversations.db"))
+    try:
+        records = [{"user_input": "hi", "answer": "hello"}]
+        chunks = [{"first_turn": 0, "last_turn": 0, "summary": "greeting", "rolled": False}]
+        assert store.import_conversation("c1", records, summary="arc", chunks=chunks) == 1
+        assert store.import_conversation("c1", records) is None
+        memory = store.load_memory("c1")
+        assert memory["arc"] == "arc" and memory["turns"] == 1 and memory["chunks"][0]["summary"] == "greeting"
+    finally:
+        store.close()
+
+def test_reconfiguring_log_store_keeps_the_new_writer(tmp_path):
+    first = conversation_store.configure_store(backend="log", save_dir=str(tmp_path / "a"), chat_log_settings={"fsync": "none"})
+    second = conversation_store.configure_store(backend="log", save_dir=str(tmp_path / "b"), chat_log_settings={"fsync": "none"})
+    try:
+        assert first.writer.closed
+        assert not second.writer.closed
+        conversation_id = second.create_conversation()
+        second.append_turn(conversation_id, "hi", "hello")
+        assert second.tail(conversation_id, 1) == [{"user_input": "hi", "answer": "hello"}]
+    finally:
+        second.close()
+        conversation_store._store = None
+
+def test_store_missing_a_method_fails_on_construction():
+    class Incomplete(ConversationStore):
+        def exists(self, conversation_id):
+            return False
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+def test_remove_conversation_lore(tmp_path):
+    lore_store = pytest.importorskip("lore_store")
+    base = lore_store.conversation_store_path(str(tmp_path), "c1")
+    for suffix in (".vec", ".meta.jsonl"):
+        with open(base + suffix, "w") as f:
+            f.write("x")
+    assert lore_store.remove_conversation_store(str(tmp_path), "c1") == 2
+    assert not os.listdir(tmp_path)
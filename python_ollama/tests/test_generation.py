@@ -0,0 +1,73 @@
+from generation import THINKING_NUDGE, GenerationControl, GenerationSettings
+from tag_parser import TagStreamParser
+
+def stream(state, parser, tokens):
+    """Feed tokens until the state says stop; returns the tokens consumed."""
+    consumed = []
+    for token in tokens:
+        list(parser.feed(token))
+        consumed.append(token)
+        if state.should_stop(parser):
+            break
+    return consumed
+
+def test_stops_after_the_final_section():
+    state = GenerationControl().start()
+    parser = TagStreamParser()
+    tokens = ["ok", "</thinking>", "<answer>", "hi", "</answer>", "<actions>", "wave", "</actions>", "ignored", "more"]
+    consumed = stream(state, parser, tokens)
+    assert consumed[-1] == "</actions>"
+    assert state.continuation("".join(consumed), parser) is None
+
+def test_thinking_cap_continues_with_an_answer_prefill():
+    state = GenerationControl(max_thinking_tokens=3).start()
+    parser = TagStreamParser()
+    consumed = stream(state, parser, ["hmm "] * 10)
+    assert len(consumed) == 3
+    response = "".join(consumed)
+    options, prefill, injected = state.continuation(response, parser)
+    assert prefill == response + THINKING_NUDGE
+    assert injected == THINKING_NUDGE
+    assert options["stop"] == ["</actions>"]
+    assert state.nudged
+
+    # The continuation extends the answer; the cap does not apply twice
+    list(parser.feed(injected))
+    assert parser.channel == "answer"
+    consumed = stream(state, parser, ["Hello", "</answer>", "<actions>", "wave", "</actions>"])
+    assert consumed[-1] == "</actions>"
+    assert state.continuation(prefill + "".join(consumed), parser) is None
+
+def test_reasoning_reopened_after_the_nudge_is_cut():
+    state = GenerationControl(max_thinking_tokens=2).start()
+    parser = TagStreamParser()
+    stream(state, parser, ["a ", "b "])
+    _, _, injected = state.continuation("a b ", parser)
+    list(parser.feed(injected))
+    consumed = stream(state, parser, ["Hi", "</answer>", "<thinking>", "more", "reasoning"])
+    assert consumed[-1] == "<thinking>"
+    assert state.continuation("", parser) is None
+
+def test_continuation_gets_what_is_left_of_num_predict():
+    state = GenerationControl(num_predict=10, max_thinking_tokens=4).start()
+    parser = TagStreamParser()
+    stream(state, parser, ["x "] * 8)
+    options, _, _ = state.continuation("x " * 4, parser)
+    assert options["num_predict"] == 6
+
+def test_no_continuation_once_num_predict_is_spent():
+    state = GenerationControl(num_predict=4, max_thinking_tokens=4).start()
+    parser = TagStreamParser()
+    stream(state, parser, ["x "] * 8)
+    assert state.continuation("x " * 4, parser) is None
+
+def test_no_continuation_when_the_model_stops_thinking_on_its_own():
+    state = GenerationControl(max_thinking_tokens=100).start()
+    parser = TagStreamParser()
+    stream(state, parser, ["short "] * 3)
+    assert state.continuation("short " * 3, parser) is None
+
+def test_character_overrides():
+    settings = GenerationSettings({"max_thinking_tokens": 1024, "characters": {"Clara": {"max_thinking_tokens": 0}}})
+    assert settings.for_character("Clara")["max_thinking_tokens"] == 0
+    assert settings.for_character("Elara")["max_thinking_tokens"] == 1024
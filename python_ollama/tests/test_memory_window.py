@@ -0,0 +1,98 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.chat_history import InMemoryChatMessageHistory
+
+from conversation_store import make_store
+from prompting import PromptAssembler
+from summarizer import TieredMemory
+from tokens import TokenCounter
+
+class InlineExecutor:
+    """Runs summarization jobs at once so the tests see their result."""
+
+    def submit(self, job):
+        job()
+
+@pytest.fixture
+def store(tmp_path):
+    store = make_store(save_dir=str(tmp_path))
+    yield store
+    store.close()
+
+def summarize(prompt):
+    return "summary"
+
+def make_memory(store, conversation_id, **settings):
+    return TieredMemory(summarize, store, conversation_id, executor=InlineExecutor(), max_chunks=1000, **settings)
+
+def make_window(chat_memory, memory, max_tokens=300):
+    counter = TokenCounter()
+    prompt = PromptAssembler("prefix\n", chat_memory, counter, max_tokens=max_tokens, first_turn=memory.turns - len(chat_memory.messages) // 2,
+                             on_rebase=memory.show_from)
+    memory.show_from(prompt.first_turn)
+    return prompt
+
+def play(store, conversation_id, chat_memory, memory, prompt, turns, words):
+    for index in range(turns):
+        user_input = f"question {index} " + "word " * words
+        answer = f"answer {index} " + "word " * words
+        prompt.build(user_input, summary=memory.summary)
+        chat_memory.add_user_message(user_input)
+        chat_memory.add_ai_message(answer)
+        store.append_turn(conversation_id, user_input, answer, "Clara")
+        memory.add_turn(user_input, answer)
+    prompt.build("next", summary=memory.summary)
+
+def assert_every_turn_once(memory, prompt):
+    """Each turn is either covered by exactly one chunk or shown in the window, never both or neither."""
+    covered = [turn for chunk in memory.chunks for turn in range(chunk["first_turn"], chunk["last_turn"] + 1)]
+    visible = list(range(prompt.first_turn, memory.turns))
+    assert sorted(covered + visible) == list(range(memory.turns))
+
+@pytest.mark.parametrize("words", [2, 60])
+def test_window_and_chunks_cover_every_turn_once(store, words):
+    conversation_id = store.create_conversation("Clara")
+    chat_memory = InMemoryChatMessageHistory()
+    memory = make_memory(store, conversation_id)
+    prompt = make_window(chat_memory, memory)
+    play(store, conversation_id, chat_memory, memory, prompt, 40, words)
+    assert prompt.rebases > 0
+    assert_every_turn_once(memory, prompt)
+
+def test_short_turns_in_the_window_are_not_summarized(store):
+    conversation_id = store.create_conversation("Clara")
+    chat_memory = InMemoryChatMessageHistory()
+    memory = make_memory(store, conversation_id, recent_turns=2, chunk_turns=2)
+    prompt = make_window(chat_memory, memory, max_tokens=4096)
+    play(store, conversation_id, chat_memory, memory, prompt, 20, 1)
+    assert prompt.rebases == 0
+    assert memory.chunks == []
+
+def test_restore_shows_only_turns_no_chunk_covers(store):
+    conversation_id = store.create_conversation("Clara")
+    chat_memory = InMemoryChatMessageHistory()
+    memory = make_memory(store, conversation_id)
+    prompt = make_window(chat_memory, memory)
+    play(store, conversation_id, chat_memory, memory, prompt, 30, 30)
+
+    restored_memory = make_memory(store, conversation_id)
+    restored_chat = InMemoryChatMessageHistory()
+    pending = restored_memory.stats()["pending"]
+    for record in store.tail(conversation_id, pending):
+        restored_chat.add_user_message(record["user_input"])
+        restored_chat.add_ai_message(record["answer"])
+    restored_prompt = make_window(restored_chat, restored_memory)
+    assert_every_turn_once(restored_memory, restored_prompt)
+
+def test_reset_starts_the_window_at_the_next_turn(store):
+    conversation_id = store.create_conversation("Clara")
+    chat_memory = InMemoryChatMessageHistory()
+    memory = make_memory(store, conversation_id)
+    prompt = make_window(chat_memory, memory)
+    play(store, conversation_id, chat_memory, memory, prompt, 5, 1)
+    chat_memory.clear()
+    memory.clear()
+    prompt.reset(memory.turns)
+    assert prompt.first_turn == 5
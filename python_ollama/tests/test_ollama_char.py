@@ -0,0 +1,117 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain.memory")
+pytest.importorskip("langchain.chains")
+
+from generation import GenerationControl
+from ollama_char import OllamaCharacter, ToolRouting
+from scheduler import GenerationScheduler
+
+CACHED_REPLY = "Thinking it over.</thinking>\n<answer>Hello there</answer>\n<mood>happy</mood>\n<actions>wave</actions>"
+REPLY_TOKENS = ["Thinking ", "it ", "over.", "</thinking>", "<answer>", "Hello ", "there", "</answer>",
+                "<actions>", "wave", "</actions>"]
+
+class Recorder:
+    """Stands in for the memory, history and store objects and records the calls they receive."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args))
+
+def make_character():
+    """An OllamaCharacter whose collaborators are recorders, answering every turn from the response cache."""
+    character = object.__new__(OllamaCharacter)
+    character.conversation_id = "c1"
+    character.character_name = "Clara"
+    character.short_term_memory = Recorder()
+    character.long_term_memory = Recorder()
+    character.store = Recorder()
+    character.lore = None
+    character.tools = SimpleNamespace(executor=ThreadPoolExecutor(max_workers=1))
+    character.last_turn_stats = None
+
+    async def turn_context(user_input):
+        return "", ToolRouting()
+
+    character._aturn_context = turn_context
+    character._build_prompt = lambda user_input, context="": "prompt"
+    character._cache_lookup = lambda user_input, prompt, context: (CACHED_REPLY, None)
+    character._cache_store = lambda *args: None
+    return character
+
+def test_turn_reaches_the_long_term_memory_when_the_client_leaves_at_the_final_frame():
+    character = make_character()
+
+    async def scenario():
+        stream = character.arespond_stream("hi")
+        async for channel, _ in stream:
+            if channel == "final":
+                break  # The client is gone while the final frame is written
+        await stream.aclose()
+
+    asyncio.run(scenario())
+    assert [name for name, _ in character.store.calls] == ["append_turn"]
+    assert character.long_term_memory.calls == [("add_turn", ("hi", "Hello there"))]
+
+class FakeClient:
+    """Streams REPLY_TOKENS for every prompt, calling `on_token(index)` before each one."""
+
+    model = "fake"
+
+    def __init__(self, on_token=lambda index: None):
+        self.on_token = on_token
+        self.prompts = []
+
+    async def astream_generate(self, prompt, prefill="", **options):
+        self.prompts.append(prompt)
+        for index, token in enumerate(REPLY_TOKENS):
+            self.on_token(index)
+            await asyncio.sleep(0)
+            yield {"response": token}
+
+def make_routed_character(routed_at):
+    """A character generating through FakeClient whose tool router answers before the reply's token `routed_at`."""
+    character = make_character()
+    character.scheduler = GenerationScheduler(workers=None)
+    character.generation = GenerationControl()
+    character._cache_lookup = lambda user_input, prompt, context: (None, None)
+    character._build_prompt = lambda user_input, context="": f"{context}|{user_input}"
+    routings = []
+
+    async def turn_context(user_input):
+        routings.append(ToolRouting(asyncio.get_running_loop().create_future()))
+        return "", routings[-1]
+
+    def on_token(index):
+        if index == routed_at and routings[-1].future is not None and not routings[-1].future.done():
+            routings[-1].future.set_result(f"Lore result: for {character.client.prompts[-1]}")
+
+    character._aturn_context = turn_context
+    character.client = FakeClient(on_token)
+    return character, routings
+
+def replies(character, *user_inputs):
+    async def scenario():
+        return [await character.arespond(user_input) for user_input in user_inputs]
+
+    return asyncio.run(scenario())
+
+def test_router_answering_during_the_reasoning_reissues_the_same_turn():
+    character, routings = make_routed_character(routed_at=2)
+    [parsed] = replies(character, "who is the king?")
+    assert character.client.prompts == ["|who is the king?", "Lore result: for |who is the king?|who is the king?"]
+    assert parsed["answer"] == "Hello there"
+    assert routings[0].future is None
+
+def test_router_answering_after_the_reasoning_is_dropped():
+    character, routings = make_routed_character(routed_at=6)
+    replies(character, "who is the king?", "and the queen?")
+    # The late result reaches neither this reply nor the next turn's
+    assert character.client.prompts == ["|who is the king?", "|and the queen?"]
+    assert all(routing.abandoned.is_set() for routing in routings)
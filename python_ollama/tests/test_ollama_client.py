@@ -0,0 +1,118 @@
+import os
+import sys
+import asyncio
+import threading
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("aiohttp")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+from fake_ollama import CANNED_COMPLETION, FakeOllama
+from ollama_client import OllamaClient
+from ollama_pool import BackendPool
+
+class FakeBackends:
+    """Fake Ollama servers on an event loop in a background thread, for the blocking and async clients alike."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.servers = []
+
+    def start(self, **settings):
+        fake = FakeOllama(port=0, tokens_per_second=0, first_token_ms=0, **settings)
+        asyncio.run_coroutine_threadsafe(fake.start(), self.loop).result()
+        self.servers.append(fake)
+        return fake
+
+    async def _shutdown(self):
+        for fake in self.servers:
+            await fake.close()
+        # Kept-alive client connections still have handlers waiting for their next request
+        handlers = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in handlers:
+            task.cancel()
+        await asyncio.gather(*handlers, return_exceptions=True)
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+@pytest.fixture
+def backends():
+    backends = FakeBackends()
+    yield backends
+    backends.close()
+
+def url(fake):
+    return f"http://127.0.0.1:{fake.port}"
+
+def test_prefill_continues_the_reply_through_the_chat_api(backends):
+    fake = backends.start()
+    pool = BackendPool([url(fake)], health_interval=0)
+    client = OllamaClient(url(fake), "fake", pool=pool)
+    prefill = CANNED_COMPLETION[:40]
+    chunks = list(client.stream_generate("prompt", prefill=prefill))
+    assert prefill + "".join(chunk["response"] for chunk in chunks) == CANNED_COMPLETION
+    assert chunks[-1]["done"]
+    path, request = fake.generations[-1]
+    assert path == "/api/chat"
+    assert request["messages"] == [{"role": "user", "content": "prompt"}, {"role": "assistant", "content": prefill}]
+
+def test_plain_requests_use_the_generate_api(backends):
+    fake = backends.start()
+    client = OllamaClient(url(fake), "fake", pool=BackendPool([url(fake)], health_interval=0))
+    assert client.generate("prompt") == CANNED_COMPLETION
+    assert fake.generations[-1][0] == "/api/generate"
+
+def failing_pair(backends):
+    """A backend dropping every stream after 5 tokens, tried first, and a healthy one behind it."""
+    failing, healthy = backends.start(fail_after=5), backends.start()
+    pool = BackendPool([url(failing), url(healthy)], health_interval=0)
+    pool.backends[1].healthy = False  # Routed to only once the first one failed
+    return failing, healthy, pool
+
+def test_failover_resumes_without_repeating_tokens(backends):
+    failing, healthy, pool = failing_pair(backends)
+    client = OllamaClient(url(failing), "fake", pool=pool, conversation_id="c1")
+    text = "".join(chunk["response"] for chunk in client.stream_generate("prompt", num_predict=500))
+    assert text == CANNED_COMPLETION
+    assert pool.stats()["failovers"] == 1
+    path, request = healthy.generations[-1]
+    assert path == "/api/chat"
+    assert request["messages"][0] == {"role": "user", "content": "prompt"}
+    streamed = request["messages"][1]["content"]
+    assert CANNED_COMPLETION.startswith(streamed) and streamed
+    assert request["options"]["num_predict"] == 495
+
+def test_async_failover_resumes_without_repeating_tokens(backends):
+    failing, healthy, pool = failing_pair(backends)
+    client = OllamaClient(url(failing), "fake", pool=pool, conversation_id="c1")
+
+    async def scenario():
+        try:
+            return "".join([chunk["response"] async for chunk in client.astream_generate("prompt")])
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(scenario()) == CANNED_COMPLETION
+    assert healthy.generations[-1][0] == "/api/chat"
+
+def test_failover_keeps_a_continuation_prefill(backends):
+    failing, healthy, pool = failing_pair(backends)
+    client = OllamaClient(url(failing), "fake", pool=pool)
+    prefill = CANNED_COMPLETION[:20]
+    text = "".join(chunk["response"] for chunk in client.stream_generate("prompt", prefill=prefill))
+    assert prefill + text == CANNED_COMPLETION
+
+def test_every_backend_failing_raises(backends):
+    first, second = backends.start(fail_after=2), backends.start(fail_after=2)
+    pool = BackendPool([url(first), url(second)], health_interval=0)
+    client = OllamaClient(url(first), "fake", pool=pool)
+    with pytest.raises(Exception, match="No Ollama backend"):
+        list(client.stream_generate("prompt"))
@@ -0,0 +1,80 @@
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("aiohttp")
+
+from ollama_pool import BackendPool
+
+URLS = ["http://a:11434", "http://b:11434/", "http://c:11434"]
+
+@pytest.fixture
+def pool():
+    pool = BackendPool(URLS, health_interval=0)
+    yield pool
+    pool.close()
+
+def test_urls_are_normalized(pool):
+    assert pool.urls == ["http://a:11434", "http://b:11434", "http://c:11434"]
+
+def test_conversations_stick_to_their_backend(pool):
+    first = pool.acquire("c1")
+    pool.release(first)
+    for _ in range(5):
+        backend = pool.acquire("c1")
+        pool.release(backend)
+        assert backend is first
+
+def test_new_conversations_go_to_the_least_loaded_backend(pool):
+    busy = [pool.acquire("c1"), pool.acquire("c2")]
+    backend = pool.acquire("c3")
+    assert backend not in busy
+    assert {b.outstanding for b in pool.backends} == {1}
+
+def test_failed_backend_is_avoided_until_it_recovers(pool):
+    first = pool.acquire("c1")
+    pool.release(first)
+    pool.mark_failed(first, ConnectionError("down"))
+    assert pool.stats()["failovers"] == 1
+    for _ in range(10):
+        backend = pool.acquire("c1")
+        pool.release(backend)
+        assert backend is not first
+    # The conversation moved; a recovered backend only gets new conversations
+    moved = pool.acquire("c1")
+    pool.release(moved)
+    first.healthy = True
+    backend = pool.acquire("c1")
+    pool.release(backend)
+    assert backend is moved
+
+def test_excluded_backends_are_skipped(pool):
+    backend = pool.acquire("c1", exclude={pool.backends[0], pool.backends[1]})
+    assert backend is pool.backends[2]
+    with pytest.raises(ConnectionError):
+        pool.acquire("c1", exclude=set(pool.backends))
+
+def test_down_backends_are_used_when_nothing_else_is_left(pool):
+    for backend in pool.backends:
+        pool.mark_failed(backend, ConnectionError("down"))
+    assert pool.acquire("c1") in pool.backends
+
+def test_sticky_assignments_are_bounded():
+    pool = BackendPool(URLS, health_interval=0, max_sticky=2)
+    try:
+        for conversation_id in ("c1", "c2", "c3"):
+            pool.release(pool.acquire(conversation_id))
+        assert pool.stats()["sticky"] == 2
+    finally:
+        pool.close()
+
+def test_health_check_marks_unreachable_backends_down():
+    pool = BackendPool(["http://127.0.0.1:9"], health_interval=0, health_timeout=0.5)
+    try:
+        assert pool.check(pool.backends[0]) is False
+        assert not pool.backends[0].healthy
+    finally:
+        pool.close()
+
+def test_a_pool_needs_backends():
+    with pytest.raises(ValueError):
+        BackendPool([])
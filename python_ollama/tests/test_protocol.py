@@ -0,0 +1,92 @@
+import asyncio
+import socket
+import struct
+
+import pytest
+
+import protocol
+from protocol import FrameCodec, FrameReader, FrameTooLarge, encode_frame, negotiate, read_frame, recv_frame, send_frame
+
+MESSAGES = [
+    {"conversation_id": 0},
+    {"type": "chunk", "channel": "answer", "text": "héllo " * 2000, "request_id": 3},
+    {"type": "final", "answer": "", "actions": ["wink"], "mood": "happy"},
+]
+
+needs_msgpack = pytest.mark.skipif("msgpack" not in protocol.available_codecs(), reason="no MessagePack library installed")
+needs_zstd = pytest.mark.skipif(protocol.zstandard is None, reason="zstandard is not installed")
+
+def codecs():
+    return [
+        FrameCodec(),
+        pytest.param(FrameCodec("json", "zstd") if protocol.zstandard else None, marks=needs_zstd, id="json-zstd"),
+        pytest.param(FrameCodec("msgpack") if "msgpack" in protocol.available_codecs() else None, marks=needs_msgpack, id="msgpack"),
+        pytest.param(FrameCodec("msgpack", "zstd") if protocol.zstandard and "msgpack" in protocol.available_codecs() else None,
+                     marks=[needs_msgpack, needs_zstd], id="msgpack-zstd"),
+    ]
+
+@pytest.fixture
+def sockets():
+    left, right = socket.socketpair()
+    yield left, right
+    left.close()
+    right.close()
+
+@pytest.mark.parametrize("codec", codecs())
+def test_frame_reader_round_trip(sockets, codec):
+    left, right = sockets
+    reader = FrameReader(right, codec, initial_size=16)
+    for message in MESSAGES:
+        send_frame(left, message, codec)
+        assert reader.recv() == message
+    left.close()
+    assert reader.recv() is None
+
+@pytest.mark.parametrize("codec", codecs())
+def test_read_frame_round_trip(codec):
+    async def scenario():
+        reader = asyncio.StreamReader()
+        for message in MESSAGES:
+            reader.feed_data(codec.encode(message))
+        reader.feed_eof()
+        return [await read_frame(reader, codec=codec) for _ in range(len(MESSAGES) + 1)]
+
+    assert asyncio.run(scenario()) == MESSAGES + [None]
+
+@needs_zstd
+def test_large_bodies_are_compressed():
+    codec = FrameCodec("json", "zstd")
+    frame = codec.encode(MESSAGES[1])
+    assert struct.unpack("<I", frame[:4])[0] & protocol.FRAME_COMPRESSED
+    assert len(frame) < len(encode_frame(MESSAGES[1]))
+
+def test_legacy_frames_are_plain_json(sockets):
+    left, right = sockets
+    message = {"conversation_id": "67890", "character_name": "Clara", "input": "Hello!"}
+    body = b'{"conversation_id": "67890", "character_name": "Clara", "input": "Hello!"}'
+    left.sendall(struct.pack("<I", len(body)) + body)
+    assert recv_frame(right) == message
+    assert encode_frame(message) == struct.pack("<I", len(body)) + body
+
+def test_handshake_without_codecs_stays_legacy():
+    codec = negotiate({"conversation_id": 0})
+    assert (codec.codec, codec.compression) == ("json", None)
+
+@needs_msgpack
+@needs_zstd
+def test_handshake_picks_the_first_supported_codec():
+    codec = negotiate({"conversation_id": 0, "codecs": ["cbor", "msgpack", "json"], "compression": ["zstd"]})
+    assert (codec.codec, codec.compression) == ("msgpack", "zstd")
+
+def test_oversized_frame_is_rejected(sockets):
+    left, right = sockets
+    left.sendall(struct.pack("<I", protocol.MAX_FRAME_SIZE + 1))
+    with pytest.raises(FrameTooLarge):
+        recv_frame(right)
+
+@needs_zstd
+def test_compressed_frame_expanding_beyond_the_limit_is_rejected():
+    codec = FrameCodec("json", "zstd", max_size=4096)
+    body = protocol.zstandard.ZstdCompressor().compress(b" " * 100000)
+    with pytest.raises(FrameTooLarge):
+        codec.decode(body, True)
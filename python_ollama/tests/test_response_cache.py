@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from response_cache import ResponseCache
+
+def test_store_counts_and_lookup_hits():
+    cache = ResponseCache()
+    cache.store("Clara", "key", "hello")
+    assert cache.lookup("Clara", "key") == "hello"
+    assert cache.lookup("Clara", "other") is None
+    metrics = cache.stats()["characters"]["Clara"]
+    assert (metrics["stores"], metrics["exact_hits"], metrics["misses"]) == (1, 1, 1)
+
+def test_load_restores_entries_without_counting_stores(tmp_path):
+    persist_path = str(tmp_path / "response_cache.json")
+    cache = ResponseCache(persist_path=persist_path)
+    cache.store("Clara", "key", "hello", user_input="hi")
+    cache.save()
+
+    restored = ResponseCache(persist_path=persist_path)
+    assert restored.load() == 1
+    assert restored.stats() == {"entries": 1, "characters": {}}
+    assert restored.lookup("Clara", "key") == "hello"
+
+def test_load_skips_expired_entries(tmp_path):
+    persist_path = str(tmp_path / "response_cache.json")
+    cache = ResponseCache(persist_path=persist_path)
+    cache.store("Clara", "key", "hello", created=1.0)
+    cache.save()
+    assert ResponseCache(persist_path=persist_path, ttl=60).load() == 0
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+
+from scheduler import BACKGROUND, INTERACTIVE, TOOL, GenerationScheduler
+
+async def admit_in_order(scheduler, requests):
+    """Queue `requests` of (priority, conversation_id, label) behind a held slot; return the labels in admission order."""
+    order = []
+    release = asyncio.Event()
+
+    async def hold():
+        async with scheduler.slot(INTERACTIVE, "holder"):
+            await release.wait()
+
+    async def call(priority, conversation_id, label):
+        async with scheduler.slot(priority, conversation_id):
+            order.append(label)
+            await asyncio.sleep(0)
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+    calls = []
+    for request in requests:
+        calls.append(asyncio.create_task(call(*request)))
+        await asyncio.sleep(0)  # Queue them in this order
+    release.set()
+    await asyncio.gather(holder, *calls)
+    return order
+
+def test_higher_priority_is_admitted_first():
+    scheduler = GenerationScheduler(workers=1)
+    order = asyncio.run(admit_in_order(scheduler, [
+        (BACKGROUND, "a", "summary"),
+        (TOOL, "b", "tool"),
+        (INTERACTIVE, "c", "reply"),
+    ]))
+    assert order == ["reply", "tool", "summary"]
+    assert scheduler.stats()["background"]["admitted"] == 1
+
+def test_round_robin_across_conversations_within_a_priority():
+    scheduler = GenerationScheduler(workers=1)
+    order = asyncio.run(admit_in_order(scheduler, [
+        (INTERACTIVE, "chatty", "chatty 1"),
+        (INTERACTIVE, "chatty", "chatty 2"),
+        (INTERACTIVE, "chatty", "chatty 3"),
+        (INTERACTIVE, "quiet", "quiet 1"),
+        (INTERACTIVE, "other", "other 1"),
+    ]))
+    assert order == ["chatty 1", "quiet 1", "other 1", "chatty 2", "chatty 3"]
+
+def test_cancelled_waiter_frees_its_place():
+    async def scenario():
+        scheduler = GenerationScheduler(workers=1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with scheduler.slot(INTERACTIVE, "a"):
+                await release.wait()
+
+        async def wait_for_slot():
+            async with scheduler.slot(INTERACTIVE, "b"):
+                pass
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(wait_for_slot())
+        await asyncio.sleep(0)
+        assert scheduler.stats()["interactive"]["queued"] == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        release.set()
+        await holder
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["cancelled"] == 1
+    assert stats["interactive"]["queued"] == 0
+    assert stats["active"] == 0
+
+def test_workers_bound_concurrency():
+    async def scenario():
+        scheduler = GenerationScheduler(workers=2)
+        running = peak = 0
+
+        async def call(conversation_id):
+            nonlocal running, peak
+            async with scheduler.slot(INTERACTIVE, conversation_id):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(call(index % 3) for index in range(8)))
+        return peak, scheduler.stats()
+
+    peak, stats = asyncio.run(scenario())
+    assert peak == 2
+    assert stats["interactive"]["admitted"] == 8
+
+def test_blocking_slot_waits_behind_interactive_calls():
+    async def scenario():
+        scheduler = GenerationScheduler(workers=1)
+        scheduler.start()
+        order = []
+
+        def summarize():
+            with scheduler.blocking_slot(BACKGROUND, "a"):
+                order.append("summary")
+
+        async with scheduler.slot(INTERACTIVE, "a"):
+            thread = threading.Thread(target=summarize)
+            thread.start()
+            while not scheduler.stats()["background"]["queued"]:
+                await asyncio.sleep(0.001)
+            order.append("reply")
+        await asyncio.to_thread(thread.join)
+        await asyncio.sleep(0)  # The thread hands its slot back through the loop
+        return order, scheduler.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == ["reply", "summary"]
+    assert stats["active"] == 0
+
+def test_no_workers_disables_scheduling():
+    async def scenario():
+        scheduler = GenerationScheduler(workers=None)
+        async with scheduler.slot(INTERACTIVE, "a"):
+            async with scheduler.slot(INTERACTIVE, "b"):
+                return scheduler.stats()
+
+    assert asyncio.run(scenario())["active"] == 0
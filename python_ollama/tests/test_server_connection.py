@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+import server
+from protocol import read_frame, write_frame
+from server import CompanionServer
+from session_registry import SessionRegistry
+
+class FakeCharacter:
+    def __init__(self, character_name, conversation_id):
+        self.conversation_id = conversation_id
+
+    async def arespond(self, user_input):
+        return {"answer": user_input, "thinking": "", "mood": "", "actions": []}
+
+async def start_server(character_class=FakeCharacter):
+    companion = CompanionServer(read_timeout=5)
+    companion.sessions = SessionRegistry(character_class)
+    companion.stopping = asyncio.Event()
+    companion.server = await asyncio.start_server(companion.handle_client, "127.0.0.1", 0)
+    port = companion.server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    return companion, reader, writer
+
+async def stop_server(companion, writer):
+    writer.close()
+    companion.server.close()
+    await companion.server.wait_closed()
+
+@pytest.fixture
+def new_uids(monkeypatch):
+    uids = iter(range(1000, 2000))
+
+    async def generate_unique_uid():
+        return next(uids)
+
+    monkeypatch.setattr(server, "generate_unique_uid", generate_unique_uid)
+
+def handshake(first_message):
+    async def scenario():
+        companion, reader, writer = await start_server()
+        try:
+            await write_frame(writer, first_message)
+            return await asyncio.wait_for(read_frame(reader), 5)
+        finally:
+            await stop_server(companion, writer)
+
+    return asyncio.run(scenario())
+
+@pytest.mark.parametrize("conversation_id", [0, "0", "", None])
+def test_codec_handshake_without_a_conversation_allocates_one(new_uids, conversation_id):
+    reply = handshake({"codecs": ["json"], "conversation_id": conversation_id})
+    assert reply["uid"] == 1000
+
+def test_codec_handshake_keeps_an_existing_conversation(new_uids):
+    assert handshake({"codecs": ["json"], "conversation_id": "c7"})["uid"] == "c7"
+    assert handshake({"codecs": ["json"]})["uid"] == 1000
+
+@pytest.mark.parametrize("first_message", [{"conversation_id": 0}, {"conversation_id": "0"}, {}])
+def test_legacy_handshake_without_a_conversation_allocates_one(new_uids, first_message):
+    assert handshake(first_message) == {"uid": 1000}
+
+class HangingCharacter(FakeCharacter):
+    """Answers "fast" at once and hangs on anything else until cancelled."""
+
+    cancelled = []
+
+    async def arespond(self, user_input):
+        if user_input == "fast":
+            return await super().arespond(user_input)
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            self.cancelled.append(user_input)
+            raise
+
+def plain_turn(user_input):
+    return {"conversation_id": "c1", "character_name": "Clara", "input": user_input}
+
+def test_client_leaving_during_a_non_stream_turn_cancels_it():
+    async def scenario():
+        HangingCharacter.cancelled = []
+        companion, reader, writer = await start_server(HangingCharacter)
+        try:
+            await write_frame(writer, plain_turn("slow"))
+            await asyncio.sleep(0.05)
+            writer.close()
+            for _ in range(100):
+                if HangingCharacter.cancelled:
+                    break
+                await asyncio.sleep(0.01)
+            assert HangingCharacter.cancelled == ["slow"]
+        finally:
+            await stop_server(companion, writer)
+
+    asyncio.run(scenario())
+
+def test_frames_sent_during_a_turn_are_served_after_it():
+    async def scenario():
+        companion, reader, writer = await start_server()
+        try:
+            for user_input in ("one", "two", "three"):
+                await write_frame(writer, plain_turn(user_input))
+            return [(await asyncio.wait_for(read_frame(reader), 5))["answer"] for _ in range(3)]
+        finally:
+            await stop_server(companion, writer)
+
+    assert asyncio.run(scenario()) == ["one", "two", "three"]
@@ -0,0 +1,95 @@
+import asyncio
+
+from protocol import FRAME_CANCEL, FRAME_CANCELLED, FRAME_CHUNK, FRAME_FINAL, read_frame, write_frame
+from server import CompanionServer
+from session_registry import SessionRegistry
+
+class FakeCharacter:
+    """Streams one chunk, then finishes at once for "fast" inputs or hangs until cancelled for "slow" ones."""
+
+    def __init__(self, character_name, conversation_id):
+        self.conversation_id = conversation_id
+        self.closed = []
+
+    async def arespond_stream(self, user_input):
+        try:
+            yield "answer", f"{self.conversation_id}:{user_input}"
+            if user_input == "slow":
+                await asyncio.Event().wait()
+            yield "final", {"answer": user_input, "thinking": "", "mood": "", "actions": []}
+        finally:
+            self.closed.append(user_input)
+
+    async def arespond(self, user_input):
+        return {"answer": user_input, "thinking": "", "mood": "", "actions": []}
+
+def turn(request_id, conversation_id, user_input):
+    return {"request_id": request_id, "conversation_id": conversation_id, "character_name": "Clara", "input": user_input, "stream": True}
+
+async def start_server():
+    server = CompanionServer(read_timeout=5, max_inflight=4)
+    server.sessions = SessionRegistry(FakeCharacter)
+    server.stopping = asyncio.Event()
+    server.server = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+    port = server.server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    return server, reader, writer
+
+async def read_until(reader, done):
+    frames = []
+    while True:
+        frame = await asyncio.wait_for(read_frame(reader), 5)
+        assert frame is not None, "server closed the connection"
+        frames.append(frame)
+        if done(frame):
+            return frames
+
+def test_requests_complete_out_of_order_and_cancel_independently():
+    async def scenario():
+        server, reader, writer = await start_server()
+        try:
+            await write_frame(writer, turn(1, "c1", "slow"))
+            await write_frame(writer, turn(2, "c2", "fast"))
+            # The fast request finishes while the slow one is still generating
+            frames = await read_until(reader, lambda frame: frame.get("type") == FRAME_FINAL)
+            assert frames[-1]["request_id"] == 2
+            assert {frame["request_id"] for frame in frames if frame["type"] == FRAME_CHUNK} == {1, 2}
+
+            await write_frame(writer, {"type": FRAME_CANCEL, "request_id": 1})
+            frames = await read_until(reader, lambda frame: frame.get("type") == FRAME_CANCELLED)
+            assert frames[-1]["request_id"] == 1
+            assert not any(frame.get("type") == FRAME_FINAL for frame in frames)
+            slow = await server.sessions.get("c1", "Clara")
+            assert slow.character.closed == ["slow"]
+
+            # The cancelled turn released its session; the conversation takes new turns
+            await write_frame(writer, turn(3, "c1", "fast"))
+            frames = await read_until(reader, lambda frame: frame.get("type") == FRAME_FINAL)
+            assert frames[-1]["request_id"] == 3
+            assert frames[0]["text"] == "c1:fast"
+            # Cancelling a request that already finished is not confirmed
+            await write_frame(writer, {"type": FRAME_CANCEL, "request_id": 3})
+            await write_frame(writer, turn(4, "c2", "fast"))
+            frames = await read_until(reader, lambda frame: frame.get("type") == FRAME_FINAL)
+            assert all(frame["request_id"] == 4 for frame in frames)
+        finally:
+            writer.close()
+            server.server.close()
+            await server.server.wait_closed()
+
+    asyncio.run(scenario())
+
+def test_duplicate_request_id_is_rejected():
+    async def scenario():
+        server, reader, writer = await start_server()
+        try:
+            await write_frame(writer, turn(1, "c1", "slow"))
+            await write_frame(writer, turn(1, "c1", "fast"))
+            frames = await read_until(reader, lambda frame: frame.get("type") == "error")
+            assert frames[-1]["request_id"] == 1
+        finally:
+            writer.close()
+            server.server.close()
+            await server.server.wait_closed()
+
+    asyncio.run(scenario())
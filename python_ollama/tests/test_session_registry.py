@@ -0,0 +1,108 @@
+import asyncio
+
+from session_registry import SessionRegistry
+
+class Character:
+    def __init__(self, character_name, conversation_id, size=0):
+        self.character_name = character_name
+        self.conversation_id = conversation_id
+        self.size = size
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_reconnect_reuses_the_session():
+    async def scenario():
+        registry = SessionRegistry(Character)
+        first = await registry.get(1, "Clara")
+        second = await registry.get(1, "Clara")
+        return registry, first, second
+
+    registry, first, second = run(scenario())
+    assert first is second
+    assert registry.stats()["misses"] == 1
+    assert registry.stats()["hits"] == 1
+
+def test_character_switch_waits_for_the_leased_session():
+    events = []
+
+    async def scenario():
+        registry = SessionRegistry(Character)
+        release = asyncio.Event()
+
+        async def old_turn():
+            async with registry.lease(1, "Clara") as character:
+                events.append(("start", character.character_name))
+                await release.wait()
+                events.append(("end", character.character_name))
+
+        async def new_turn():
+            async with registry.lease(1, "Elara") as character:
+                events.append(("start", character.character_name))
+
+        old = asyncio.create_task(old_turn())
+        await asyncio.sleep(0.01)
+        new = asyncio.create_task(new_turn())
+        await asyncio.sleep(0.05)
+        # The old character is still mid-turn, so its session must not be replaced yet
+        assert events == [("start", "Clara")]
+        release.set()
+        await asyncio.gather(old, new)
+        return registry
+
+    registry = run(scenario())
+    assert events == [("start", "Clara"), ("end", "Clara"), ("start", "Elara")]
+    assert registry.stats()["resident"] == 1
+
+def test_concurrent_builds_of_different_characters_do_not_overwrite_each_other():
+    async def scenario():
+        registry = SessionRegistry(Character)
+        clara, elara = await asyncio.gather(registry.get(1, "Clara"), registry.get(1, "Elara"))
+        return clara, elara, await registry.get(1, "Elara")
+
+    clara, elara, current = run(scenario())
+    assert clara.character_name == "Clara"
+    assert elara.character_name == "Elara"
+    assert current is elara
+
+def test_max_sessions_evicts_least_recently_used():
+    async def scenario():
+        registry = SessionRegistry(Character, max_sessions=2)
+        for conversation_id in (1, 2):
+            await registry.get(conversation_id, "Clara")
+        await registry.get(1, "Clara")
+        await registry.get(3, "Clara")
+        return registry
+
+    registry = run(scenario())
+    assert set(registry._sessions) == {"1", "3"}
+
+def test_max_bytes_evicts_until_under_budget():
+    sizes = {1: 400, 2: 400, 3: 400}
+
+    def factory(character_name, conversation_id):
+        return Character(character_name, conversation_id, sizes[conversation_id])
+
+    async def scenario():
+        registry = SessionRegistry(factory, max_bytes=1000, sizer=lambda character: character.size)
+        for conversation_id in (1, 2, 3):
+            async with registry.lease(conversation_id, "Clara"):
+                pass
+        return registry
+
+    registry = run(scenario())
+    assert set(registry._sessions) == {"2", "3"}
+    assert registry.stats()["resident_bytes"] == 800
+
+def test_size_is_measured_again_after_each_turn():
+    async def scenario():
+        registry = SessionRegistry(Character, max_bytes=1000, sizer=lambda character: character.size)
+        async with registry.lease(1, "Clara") as character:
+            character.size = 100
+        async with registry.lease(2, "Clara") as character:
+            character.size = 950
+        return registry
+
+    registry = run(scenario())
+    assert set(registry._sessions) == {"2"}
+    assert registry.stats()["resident_bytes"] == 950
@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+from tag_parser import TagStreamParser, find_tags, parse_sections, tag_pattern
+
+REPLY = "I should tease them.</thinking>\n<answer>*grins* Hello~</answer>\n<mood>playful</mood>\n<actions>wave</actions>"
+
+@pytest.mark.parametrize("text", [
+    "<thinking>a (answer> b {mood} c < /actions > d</thinking>",
+    "no tags, just an answer about my mood (hmm) <3 {x}",
+    "<ANSWER>loud</Answer>",
+    "",
+])
+def test_find_tags_matches_single_pattern(text):
+    expected = [(match.start(), match.group(0)) for match in tag_pattern().finditer(text)]
+    assert [(match.start(), match.group(0)) for match in find_tags(text)] == expected
+
+def test_parse_sections():
+    sections = parse_sections("<thinking>" + REPLY)
+    assert sections == {"thinking": "I should tease them.", "answer": "*grins* Hello~", "mood": "playful", "actions": "wave"}
+
+def test_bare_words_are_not_tags():
+    assert parse_sections("<answer>my answer is my mood</answer>")["answer"] == "my answer is my mood"
+
+def test_mixed_delimiters_and_missing_close():
+    sections = parse_sections("(answer> hi {mood} calm")
+    assert sections["answer"] == "hi" and sections["mood"] == "calm"
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 4, 16])
+def test_stream_matches_parse_sections(chunk_size):
+    rng = random.Random(chunk_size)
+    text = " ".join(rng.choice(("answer", "(hmm)", "<3", "mood", "word")) for _ in range(200)) + REPLY
+    parser = TagStreamParser()
+    received = {}
+    events = []
+    for index in range(0, len(text), chunk_size):
+        events.extend(parser.feed(text[index:index + chunk_size]))
+    events.extend(parser.close())
+    for channel, payload in events:
+        received[channel] = received.get(channel, "") + payload
+    expected = parse_sections("<thinking>" + text)
+    assert {channel: payload.strip() for channel, payload in received.items()} == {k: v for k, v in expected.items() if v}
+    assert "actions" in parser.closed
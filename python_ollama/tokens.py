@@ -0,0 +1,96 @@
+import re
+import logging
+import threading
+from collections import OrderedDict
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:
+    Tokenizer = None
+
+# Words, numbers and single punctuation marks; BPE vocabularies split long words further
+APPROX_PIECE = re.compile(r"\w+|[^\w\s]")
+
+def approximate_tokens(text):
+    """Fast token estimate: one token per piece plus one per further 6 characters of long pieces."""
+    return sum(1 + (len(piece) - 1) // 6 for piece in APPROX_PIECE.findall(text))
+
+class TokenCounter:
+    """
+    Count prompt tokens, exactly with a tokenizer.json or approximately without one.
+
+    Counts are cached per text, so re-counting the same history messages on
+    every turn costs a dict lookup. The approximate counter is calibrated
+    against the prompt token counts Ollama reports, which absorbs the
+    differences between model vocabularies.
+    """
+
+    def __init__(self, tokenizer_path=None, cache_size=8192):
+        """
+        Args:
+            tokenizer_path (str): HuggingFace tokenizer.json of the served model. Needs the `tokenizers` package.
+            cache_size (int): Number of texts whose counts are cached.
+        """
+        self.tokenizer = None
+        if tokenizer_path:
+            if Tokenizer is None:
+                logging.warning("tokenizers is not installed, using approximate token counts")
+            else:
+                try:
+                    self.tokenizer = Tokenizer.from_file(tokenizer_path)
+                except Exception as e:
+                    logging.warning(f"Failed to load tokenizer {tokenizer_path}, using approximate token counts: {e}")
+        self.cache_size = cache_size
+        self.scale = 1.0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def exact(self):
+        return self.tokenizer is not None
+
+    def _raw_count(self, text):
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+        return approximate_tokens(text)
+
+    def count(self, text):
+        if not text:
+            return 0
+        with self._lock:
+            raw = self._cache.get(text)
+            if raw is not None:
+                self._cache.move_to_end(text)
+        if raw is None:
+            raw = self._raw_count(text)
+            with self._lock:
+                self._cache[text] = raw
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return self._scaled(raw)
+
+    def _scaled(self, raw):
+        return raw if self.exact else int(raw * self.scale + 0.5)
+
+    def calibrate(self, estimated, actual, weight=0.2):
+        """Nudge the approximate counter towards a token count reported by the model."""
+        if self.exact or estimated <= 0 or actual <= 0:
+            return
+        ratio = actual / (estimated / self.scale)
+        self.scale += weight * (ratio - self.scale)
+
+    def truncate(self, text, max_tokens, keep="start"):
+        """Cut text to roughly `max_tokens`, keeping its start or its end."""
+        if max_tokens <= 0:
+            return ""
+        tokens = self.count(text)
+        if tokens <= max_tokens:
+            return text
+        chars = int(len(text) * max_tokens / tokens)
+        while chars > 0:
+            candidate = text[:chars] if keep == "start" else text[-chars:]
+            # Not cached: the candidates are one-off strings
+            if self._scaled(self._raw_count(candidate)) <= max_tokens:
+                return candidate
+            chars = int(chars * 0.9)
+        return ""
@@ -0,0 +1,175 @@
+import re
+import random
+import asyncio
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+# Shared by every conversation; tools are short I/O-bound calls
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tools")
+# LLM routing waits on tool results, so it must not share the tool pool or it could starve it
+_router_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tool-router")
+
+DICE_PATTERN = re.compile(r"\b(\d{0,3})d(\d{1,4})(?:\s*([+-])\s*(\d{1,4}))?\b", re.IGNORECASE)
+ROLL_PATTERN = re.compile(r"\broll\b.*\bdic?e\b", re.IGNORECASE)
+
+def lore_search(request):
+    logging.info(f"Searching lore for: {request}")
+    return ""
+
+def web_search(request):
+    logging.info(f"Searching web for: {request}")
+    return ""
+
+def roll_dice(request):
+    """Roll dice written as NdS[+M], e.g. '2d6+1'. Defaults to a single d6."""
+    logging.info(f"Rolling dice for: {request}")
+    match = DICE_PATTERN.search(request)
+    count, sides, sign, modifier = match.groups() if match else ("1", "6", None, None)
+    count = max(1, min(int(count or 1), 100))
+    sides = max(2, int(sides))
+    rolls = [random.randint(1, sides) for _ in range(count)]
+    total = sum(rolls)
+    notation = f"{count}d{sides}"
+    if sign:
+        total += int(modifier) if sign == "+" else -int(modifier)
+        notation += f"{sign}{modifier}"
+    return f"{notation}: {rolls} = {total}"
+
+def perform_action(request):
+    logging.info(f"Performing action: {request}")
+    return request
+
+# Router keyword -> tool implementation
+TOOLS = {
+    "Lore": lore_search,
+    "Search": web_search,
+    "Roll": roll_dice,
+    "Action": perform_action,
+}
+
+# Only deterministic lookups are worth caching; dice must be re-rolled
+CACHEABLE_TOOLS = {"Lore", "Search"}
+
+def parse_tool(response):
+    """ Parse the response to determine which tool to use.
+
+    Args:
+        response (str): The tool router's response string.
+    Returns:
+        tuple or None: (tool name, argument), or None if no tool is needed.
+    """
+    logging.debug(f"Parsing tool from response: {response}")
+
+    lore = response.find("Lore")
+    if lore != -1:
+        return "Lore", response[lore + 5:].strip()
+    search = response.find("Search")
+    if search != -1:
+        return "Search", response[search + 7:].strip()
+    roll = response.find("Roll")
+    if roll != -1:
+        return "Roll", response[roll + 5:].strip()
+    action = response.find("Action")
+    if action != -1:
+        return "Action", response[action + 7:].strip()
+    return None
+
+def classify_by_rules(user_input):
+    """
+    Cheap pre-classifier for requests whose tool is obvious from the text.
+
+    Returns:
+        tuple or None: (tool name, argument), or None if the LLM router should decide.
+    """
+    dice = DICE_PATTERN.search(user_input)
+    if dice:
+        return "Roll", dice.group(0)
+    if ROLL_PATTERN.search(user_input):
+        return "Roll", "1d6"
+    return None
+
+def format_tool_result(tool, result):
+    """Render a tool result for the prompt's context slot."""
+    if not result:
+        return ""
+    return f"{tool} result: {result}"
+
+class ToolRunner:
+    """
+    Execute tools on a shared thread pool with per-tool timeouts.
+
+    Results of deterministic tools are cached per runner, and each
+    conversation owns its runner, so repeated lookups in a conversation are
+    answered without running the tool again.
+    """
+
+    def __init__(self, timeouts=None, default_timeout=5.0, cache_size=64, executor=None, router_executor=None,
+                 tools=None):
+        """
+        Args:
+            timeouts (dict): Tool name -> timeout in seconds.
+            default_timeout (float): Timeout for tools without an explicit one.
+            cache_size (int): Maximum number of cached results.
+            executor (Executor): Pool running the tools. Defaults to a shared pool.
+            router_executor (Executor): Pool running LLM tool routing. Defaults to a shared pool.
+            tools (dict): Tool name -> implementation overriding the module-level TOOLS.
+        """
+        self.timeouts = dict(timeouts or {})
+        self.default_timeout = default_timeout
+        self.cache_size = cache_size
+        self.executor = executor or _executor
+        self.router_executor = router_executor or _router_executor
+        self.tools = dict(TOOLS)
+        self.tools.update(tools or {})
+        self._cache = OrderedDict()
+
+    def _cached(self, tool, argument):
+        key = (tool, argument)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        return None
+
+    def _store(self, tool, argument, result):
+        if tool not in CACHEABLE_TOOLS:
+            return
+        self._cache[(tool, argument)] = result
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _call(self, tool, argument):
+        try:
+            return self.tools[tool](argument) or ""
+        except Exception as e:
+            logging.warning(f"Tool {tool} failed: {e}")
+            return ""
+
+    def run(self, tool, argument):
+        """Run a tool and wait for its result, returning "" on failure or timeout."""
+        cached = self._cached(tool, argument)
+        if cached is not None:
+            return cached
+        timeout = self.timeouts.get(tool, self.default_timeout)
+        try:
+            result = self.executor.submit(self._call, tool, argument).result(timeout)
+        except FutureTimeoutError:
+            logging.warning(f"Tool {tool} timed out after {timeout}s")
+            return ""
+        self._store(tool, argument, result)
+        return result
+
+    async def arun(self, tool, argument):
+        """Asynchronous variant of run."""
+        cached = self._cached(tool, argument)
+        if cached is not None:
+            return cached
+        timeout = self.timeouts.get(tool, self.default_timeout)
+        future = asyncio.get_running_loop().run_in_executor(self.executor, self._call, tool, argument)
+        try:
+            result = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Tool {tool} timed out after {timeout}s")
+            return ""
+        self._store(tool, argument, result)
+        return result
@@ -1,11 +1,11 @@
 # Save as chat_client.py
 import socket
-import struct
 import json
 import tkinter as tk
 from tkinter import scrolledtext
 import threading
 import os
+from protocol import send_frame, FrameReader, FRAME_CHUNK, JSON_CODEC, FrameCodec, available_codecs, available_compression
 
 # Load settings
 with open(os.path.join(os.path.dirname(__file__), '../config/settings.json'), 'r', encoding='utf-8') as f:
@@ -46,28 +46,24 @@ class ChatClient:
         else:
             self.conversation_id = "0"
 
-        if self.conversation_id == "0" or not self.conversation_id:
-            # Request UID from server
-            request = {"conversation_id": 0}
-            data = json.dumps(request, ensure_ascii=False).encode('utf-8')
-            size = struct.pack('<I', len(data))
-            self.sock.sendall(size + data)
-            raw_size = self.sock.recv(4)
-            if raw_size:
-                resp_size = struct.unpack('<I', raw_size)[0]
-                resp_data = b''
-                while len(resp_data) < resp_size:
-                    packet = self.sock.recv(resp_size - len(resp_data))
-                    if not packet:
-                        break
-                    resp_data += packet
-                if resp_data:
-                    response = json.loads(resp_data.decode('utf-8'))
-                    self.conversation_id = response.get("uid", "0")
-                    # Save UID to file
-                    os.makedirs(os.path.dirname(save_path), exist_ok=True)
-                    with open(save_path, "w", encoding="utf-8") as f:
-                        f.write(self.conversation_id)
+        # Request a UID (or confirm the saved one) and negotiate the frame codec
+        send_frame(self.sock, {
+            "conversation_id": 0 if self.conversation_id == "0" else self.conversation_id,
+            "codecs": available_codecs(),
+            "compression": available_compression(),
+        })
+        self.frames = FrameReader(self.sock)
+        response = self.frames.recv()
+        self.codec = JSON_CODEC
+        if response:
+            self.codec = FrameCodec(response.get("codec", "json"), response.get("compression"))
+            self.frames.codec = self.codec
+            if self.conversation_id == "0" or not self.conversation_id:
+                self.conversation_id = response.get("uid", "0")
+                # Save UID to file
+                os.makedirs(os.path.dirname(save_path), exist_ok=True)
+                with open(save_path, "w", encoding="utf-8") as f:
+                    f.write(self.conversation_id)
 
     def send_message(self, event=None):
         user_input = self.entry.get()
@@ -83,37 +79,37 @@ class ChatClient:
             request = {
                 "input": user_input,
                 "conversation_id": self.conversation_id,
-                "character_name": self.character_name
+                "character_name": self.character_name,
+                "stream": True
             }
-            data = json.dumps(request, ensure_ascii=False).encode('utf-8')
-            size = struct.pack('<I', len(data))
-            self.sock.sendall(size + data)
-
-            # Receive response
-            raw_size = self.sock.recv(4)
-            if not raw_size:
-                self.display_message("Disconnected from server.")
-                return
-            resp_size = struct.unpack('<I', raw_size)[0]
-            resp_data = b''
-            while len(resp_data) < resp_size:
-                packet = self.sock.recv(resp_size - len(resp_data))
-                if not packet:
-                    break
-                resp_data += packet
-            if not resp_data:
-                self.display_message("Disconnected from server.")
-                return
-            response = json.loads(resp_data.decode('utf-8'))
-            answer = response.get('answer', '')
-            # Use after() to safely update the UI from the thread
-            self.master.after(0, lambda: self.display_message(f"{self.character_name}: {answer}"))
+            send_frame(self.sock, request, self.codec)
+
+            # Receive streamed chunks until the final frame arrives
+            self.master.after(0, lambda: self.append_text(f"{self.character_name}: "))
+            streamed = False
+            while True:
+                response = self.frames.recv()
+                if response is None:
+                    self.master.after(0, lambda: self.display_message("\nDisconnected from server."))
+                    return
+                if response.get('type') == FRAME_CHUNK:
+                    text = response.get('text', '')
+                    streamed = True
+                    # Use after() to safely update the UI from the thread
+                    self.master.after(0, lambda text=text: self.append_text(text))
+                    continue
+                answer = '' if streamed else response.get('answer', '')
+                self.master.after(0, lambda: self.append_text(answer + "\n"))
+                break
         except Exception as e:
             self.master.after(0, lambda: self.display_message(f"Error: {e}"))
 
     def display_message(self, message):
+        self.append_text(message + "\n")
+
+    def append_text(self, text):
         self.text_area.config(state='normal')
-        self.text_area.insert(tk.END, message + "\n")
+        self.text_area.insert(tk.END, text)
         self.text_area.see(tk.END)
         self.text_area.config(state='disabled')
 